@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Create a tiny random-weight causal LM (and a matching tokenizer) on disk.
+
+The model has the same architecture family as DeepSeek-LLM (Llama) but only
+a few hundred thousand parameters, so the whole inference path can be
+benchmarked offline on a CPU-only machine:
+
+    python benchmarks/make_tiny_model.py benchmarks/tiny-model
+"""
+
+import argparse
+import os
+import random
+
+# Everything is generated locally; never reach out to the hub
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+from tokenizers import (  # noqa: E402
+    Tokenizer,
+    decoders,
+    models,
+    pre_tokenizers,
+    processors,
+    trainers,
+)
+from transformers import (  # noqa: E402
+    LlamaConfig,
+    LlamaForCausalLM,
+    PreTrainedTokenizerFast,
+)
+
+SPECIAL_TOKENS = ["<unk>", "<pad>", "<s>", "</s>"]
+
+# Minimal chat template so the chat-session path can be benchmarked too
+CHAT_TEMPLATE = (
+    "{{ bos_token }}"
+    "{% for message in messages %}"
+    "{{ message['role'] }}: {{ message['content'] }}\n"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}assistant:{% endif %}"
+)
+
+WORDS = (
+    "the a video frame node graph prompt model token cache batch image "
+    "render light scene camera color shadow sky water tree city night day "
+    "fast slow large small red green blue bright dark quiet loud"
+).split()
+
+
+def build_tokenizer(vocab_size: int, seed: int) -> PreTrainedTokenizerFast:
+    """Train a small BPE tokenizer on a synthetic corpus."""
+    rng = random.Random(seed)
+    corpus = [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))
+        for _ in range(2000)
+    ]
+
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=SPECIAL_TOKENS,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    )
+    tokenizer.train_from_iterator(corpus, trainer=trainer)
+
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<s> $A", special_tokens=[("<s>", tokenizer.token_to_id("<s>"))]
+    )
+
+    wrapped = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        unk_token="<unk>",
+        pad_token="<pad>",
+        bos_token="<s>",
+        eos_token="</s>"
+    )
+    wrapped.chat_template = CHAT_TEMPLATE
+    return wrapped
+
+
+def build_model(tokenizer, hidden_size: int, layers: int, seed: int):
+    """Create a randomly initialized Llama model for the tokenizer."""
+    import torch
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=layers,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=2048,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id
+    )
+    model = LlamaForCausalLM(config)
+    # A random model would stop at arbitrary points; without an EOS token
+    # every run generates exactly `max_new_tokens`, which keeps throughput
+    # numbers comparable
+    model.generation_config.eos_token_id = None
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output_dir", help="Where to save the model and tokenizer")
+    parser.add_argument("--hidden-size", type=int, default=128)
+    parser.add_argument("--layers", type=int, default=2)
+    parser.add_argument("--vocab-size", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tokenizer = build_tokenizer(args.vocab_size, args.seed)
+    model = build_model(tokenizer, args.hidden_size, args.layers, args.seed)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    tokenizer.save_pretrained(args.output_dir)
+    model.save_pretrained(args.output_dir, safe_serialization=True)
+    print(
+        f"Saved tiny model ({model.num_parameters():,} parameters) "
+        f"to {args.output_dir}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Benchmark the DeepSeek inference path against a local model, fully offline.
+
+Measures cold-start import and load time, time-to-first-token, decode
+throughput, peak RSS and how throughput scales with concurrent requests,
+and writes the results as JSON:
+
+    python benchmarks/make_tiny_model.py benchmarks/tiny-model
+    python benchmarks/run_benchmarks.py benchmarks/tiny-model -o results.json
+
+Pass ``--compare previous.json`` to print the change against an earlier run,
+and ``--compile`` to also measure the compiled static-cache decode path.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT, "src")
+
+PROMPTS = [
+    "the video frame shows a quiet city at night",
+    "render a bright scene with blue water and green trees",
+    "a small red node in a large graph",
+    "camera light color shadow sky",
+]
+
+
+def _configure_environment(model_dir: str, cache_dir: str):
+    # Must happen before deepseek_utils is imported: it reads its settings
+    # from the environment at import time
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+    os.environ["DEEPSEEK_LLM_MODELS"] = model_dir
+    # Caches would turn repeated prompts into free hits
+    os.environ["DEEPSEEK_LLM_RESPONSE_CACHE"] = "0"
+    os.environ["DEEPSEEK_LLM_PREFIX_CACHE"] = "0"
+    os.environ["HOME"] = cache_dir
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def bench_import() -> float:
+    """Seconds needed to import the node module in a fresh interpreter."""
+    code = (
+        "import time; start = time.perf_counter(); "
+        "import deepseek_llm_node.comfyui_nodes.deepseek_llm_node; "
+        "print(time.perf_counter() - start)"
+    )
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    output = subprocess.run(
+        [sys.executable, "-c", code], env=env, check=True,
+        capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def bench_load(deepseek_utils, model_dir: str, precision: str) -> dict:
+    """Seconds per phase needed to load tokenizer and weights into a fresh
+    manager."""
+    manager = deepseek_utils.DeepSeekModelManager(
+        model_dir, precision=precision, persist_quantized=False
+    )
+    manager.load()
+    timings = dict(manager.load_timings)
+    manager.unload()
+    return timings
+
+
+def bench_latency(deepseek_utils, model_dir: str, max_new_tokens: int, runs: int):
+    """Time-to-first-token and single-request decode throughput."""
+    ttfts = []
+    rates = []
+    for i in range(runs):
+        prompt = PROMPTS[i % len(PROMPTS)]
+        start = time.perf_counter()
+        first = None
+        for _ in deepseek_utils.stream_deepseek_inference(
+            prompt, model=model_dir, do_sample=False, max_new_tokens=max_new_tokens
+        ):
+            if first is None:
+                first = time.perf_counter()
+        end = time.perf_counter()
+        ttfts.append((first or end) - start)
+
+        start = time.perf_counter()
+        deepseek_utils.run_deepseek_inference(
+            prompt, model=model_dir, do_sample=False, max_new_tokens=max_new_tokens
+        )
+        rates.append(max_new_tokens / (time.perf_counter() - start))
+
+    return {
+        "ttft_ms_median": sorted(ttfts)[len(ttfts) // 2] * 1000.0,
+        "ttft_ms_min": min(ttfts) * 1000.0,
+        "tokens_per_sec_median": sorted(rates)[len(rates) // 2],
+    }
+
+
+def bench_batch_scaling(deepseek_utils, model_dir: str, max_new_tokens: int, levels):
+    """Aggregate throughput with increasing numbers of concurrent requests."""
+    results = {}
+    for concurrency in levels:
+        deepseek_utils.batch_scheduler.reset_stats()
+        barrier = threading.Barrier(concurrency + 1)
+
+        def worker(index):
+            barrier.wait()
+            deepseek_utils.run_deepseek_inference(
+                f"{PROMPTS[index % len(PROMPTS)]} {index}",
+                model=model_dir,
+                do_sample=False,
+                max_new_tokens=max_new_tokens
+            )
+
+        threads = [
+            threading.Thread(target=worker, args=(i,)) for i in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        stats = deepseek_utils.get_batching_stats()
+        results[str(concurrency)] = {
+            "seconds": elapsed,
+            "tokens_per_sec": concurrency * max_new_tokens / elapsed,
+            "avg_batch_size": stats["avg_batch_size"],
+        }
+    return results
+
+
+def bench_compile(
+    deepseek_utils, model_dir: str, max_new_tokens: int, runs: int, eager: dict
+) -> dict:
+    """Compile time and steady-state throughput of the compiled decode path,
+    compared with the eager ``latency`` results."""
+    manager = deepseek_utils.get_model_manager(model_dir)
+    start = time.perf_counter()
+    compiled = manager.compile_model()
+    results = {"warmup_seconds": time.perf_counter() - start}
+    if not compiled:
+        print(f"Compilation failed, eager mode kept: {manager.compile_error}")
+        return results
+
+    latency = bench_latency(deepseek_utils, model_dir, max_new_tokens, runs)
+    results.update(latency)
+    results["speedup"] = (
+        latency["tokens_per_sec_median"] / eager["tokens_per_sec_median"]
+    )
+    return results
+
+
+def _metadata() -> dict:
+    import torch
+    import transformers
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+def _flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current: dict, previous: dict):
+    """Print the relative change of every metric against an earlier run."""
+    old = _flatten(previous["results"])
+    new = _flatten(current["results"])
+    print(f"\nChange vs {previous['meta'].get('commit') or 'previous run'}:")
+    for name in sorted(new):
+        if name in old and old[name]:
+            change = (new[name] - old[name]) / old[name] * 100.0
+            print(f"  {name:45s} {old[name]:12.3f} -> {new[name]:12.3f} "
+                  f"({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("model_dir", help="Local model, e.g. from make_tiny_model.py")
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument("--precision", default="bf16")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--concurrency", default="1,2,4,8")
+    parser.add_argument("--compare", help="Earlier results JSON to compare with")
+    parser.add_argument(
+        "--compile", action="store_true",
+        help="Also benchmark the torch.compile static-cache mode"
+    )
+    args = parser.parse_args()
+
+    model_dir = os.path.abspath(args.model_dir)
+    cache_dir = tempfile.mkdtemp(prefix="deepseek-bench-")
+    os.environ["DEEPSEEK_LLM_PRECISION"] = args.precision
+    _configure_environment(model_dir, cache_dir)
+
+    results = {"import_seconds": bench_import()}
+
+    from deepseek_llm_node.core_logic import deepseek_utils
+
+    load_phases = bench_load(deepseek_utils, model_dir, args.precision)
+    results["load_seconds"] = load_phases.pop("total")
+    results["load_phases"] = load_phases
+
+    # Warm up once so one-off costs don't skew the steady-state numbers
+    deepseek_utils.preload_model(name=model_dir)
+    deepseek_utils.run_deepseek_inference(
+        PROMPTS[0], model=model_dir, do_sample=False, max_new_tokens=4
+    )
+
+    results["latency"] = bench_latency(
+        deepseek_utils, model_dir, args.max_new_tokens, args.runs
+    )
+    deepseek_utils.configure_batching(batch_window_ms=20)
+    results["batch_scaling"] = bench_batch_scaling(
+        deepseek_utils, model_dir, args.max_new_tokens,
+        [int(level) for level in args.concurrency.split(",")]
+    )
+    if args.compile:
+        results["compiled"] = bench_compile(
+            deepseek_utils, model_dir, args.max_new_tokens, args.runs,
+            results["latency"]
+        )
+    results["peak_rss_mb"] = _peak_rss_mb()
+
+    report = {
+        "meta": _metadata(),
+        "config": {
+            "model_dir": model_dir,
+            "precision": args.precision,
+            "max_new_tokens": args.max_new_tokens,
+            "runs": args.runs,
+            "compile": args.compile,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
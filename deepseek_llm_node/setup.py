@@ -4,4 +4,8 @@ setup(
     name="deepseek_llm_node",
     packages=find_packages(where="src"),
     package_dir={"": "src"},
+    extras_require={
+        # kv_cache="quantized" stores the KV cache in 4 bits
+        "quantized-kv": ["optimum-quanto>=0.2.5"],
+    },
 ) 
\ No newline at end of file
@@ -1,21 +1,188 @@
-# Import the core inference function from our utilities
-from ..core_logic.deepseek_utils import run_deepseek_inference
+import os
+import time
+
+# Import the core inference function from our utilities. This is cheap: the
+# model itself is only loaded on first use.
+from ..core_logic.deepseek_utils import (
+    astream_deepseek_inference,
+    available_kv_cache_modes,
+    available_models,
+    default_model_name,
+    preload_model,
+    run_chat_turn,
+    run_deepseek_batch,
+)
+from ..core_logic.cancellation import CancellationToken
+from ..core_logic.generation_config import (
+    GENERATION_MODES,
+    TRUNCATION_POLICIES,
+    GenerationConfig,
+)
+from ..core_logic.response_cache import make_cache_key
+
+# ComfyUI's progress bar and websocket server are only available when the
+# node runs inside ComfyUI
+try:
+    from comfy.utils import ProgressBar
+except ImportError:
+    ProgressBar = None
+
+try:
+    from server import PromptServer
+except ImportError:
+    PromptServer = None
+
+try:
+    from comfy import model_management
+except ImportError:
+    model_management = None
+
+# Optionally start loading the weights in the background as soon as ComfyUI
+# registers the node, so the first execution doesn't pay the full load time
+if os.environ.get("DEEPSEEK_LLM_PRELOAD", "").lower() in ("1", "true", "yes"):
+    preload_model(background=True)
+
+
+class _NodeProgress:
+    """
+    Reports generation progress and the partial text to the ComfyUI frontend.
+    Does nothing when the node runs outside of ComfyUI.
+    """
+
+    # Minimum delay between two partial-text messages to the frontend
+    MIN_INTERVAL = 0.1
+
+    def __init__(self, node_id, total: int):
+        self.node_id = node_id
+        self.total = total
+        self.bar = ProgressBar(total) if ProgressBar is not None else None
+        self._last_sent = 0.0
+
+    def update(self, steps: int, text: str, final: bool = False):
+        if self.bar is not None:
+            self.bar.update_absolute(min(steps, self.total), self.total)
+
+        now = time.monotonic()
+        if PromptServer is None or self.node_id is None:
+            return
+        if not final and now - self._last_sent < self.MIN_INTERVAL:
+            return
+        self._last_sent = now
+
+        server = PromptServer.instance
+        if hasattr(server, "send_progress_text"):
+            server.send_progress_text(text, self.node_id)
+        else:
+            server.send_sync(
+                "deepseek_llm.partial", {"node": self.node_id, "text": text}
+            )
+
+
+class _InterruptToken(CancellationToken):
+    """
+    Cancellation token that also trips when the user interrupts the ComfyUI
+    queue, so the running generation stops within one decoding step.
+    """
+
+    @property
+    def cancelled(self) -> bool:
+        if super().cancelled:
+            return True
+        return (
+            model_management is not None
+            and model_management.processing_interrupted()
+        )
+
+
+def _fingerprint(text: str, model: str = None, **generation_options):
+    """
+    Value for ComfyUI's `IS_CHANGED` hook. Deterministic requests (greedy or
+    seeded) hash to the same fingerprint as long as the prompt, model and
+    parameters stay the same, so ComfyUI can reuse the cached output.
+    Unseeded sampling returns NaN, which never equals itself, so the node
+    runs again on every queue.
+    """
+    config = DeepSeekLLMNode.build_config(**generation_options)
+    if not config.deterministic:
+        return float("nan")
+    return make_cache_key(
+        model or default_model_name, text, config.cache_params(), config.seed
+    )
+
+
+def _generation_inputs():
+    """
+    Optional inputs shared by the DeepSeek nodes: the model selector and the
+    generation parameters understood by `DeepSeekLLMNode.build_config`.
+    """
+    defaults = GenerationConfig()
+    return {
+        # Which model to run; models are loaded on first use and the
+        # least recently used ones are unloaded under memory pressure
+        "model": (list(available_models),),
+        # Budget of generated tokens, not counting the prompt
+        "max_new_tokens": ("INT", {
+            "default": defaults.max_new_tokens, "min": 1, "max": 8192
+        }),
+        # Sample tokens or always pick the most likely one
+        "mode": (list(GENERATION_MODES),),
+        "temperature": ("FLOAT", {
+            "default": defaults.temperature, "min": 0.01, "max": 2.0,
+            "step": 0.01
+        }),
+        "repetition_penalty": ("FLOAT", {
+            "default": defaults.repetition_penalty, "min": 0.5,
+            "max": 2.0, "step": 0.01
+        }),
+        # -1 leaves sampling unseeded; any other value makes the output
+        # reproducible and lets ComfyUI reuse it while the inputs are unchanged
+        "seed": ("INT", {
+            "default": -1, "min": -1, "max": 0xFFFFFFFFFFFFFFFF
+        }),
+        # One stop sequence per line; "\n" stands for a line break
+        "stop_strings": ("STRING", {"multiline": True, "default": ""}),
+        # Let the model's draft model (DEEPSEEK_LLM_DRAFT_MODELS) propose
+        # tokens; speeds up greedy and low-temperature decoding
+        "speculative": ("BOOLEAN", {"default": False}),
+        # Which part of a prompt longer than its token budget is kept
+        "truncation": (list(TRUNCATION_POLICIES),),
+        # Prompt token budget; 0 uses the model's context length
+        "max_prompt_tokens": ("INT", {"default": 0, "min": 0, "max": 1 << 20}),
+        # "sliding" and "quantized" bound the KV cache memory of long
+        # generations at some cost in quality; only the layouts the
+        # installed packages support are offered
+        "kv_cache": (available_kv_cache_modes(),),
+        "kv_window": ("INT", {
+            "default": defaults.kv_window, "min": 8, "max": 1 << 20
+        }),
+    }
+
 
 class DeepSeekLLMNode:
     """
     A ComfyUI custom node that provides an interface to the DeepSeek-LLM model.
     This node allows users to generate text using DeepSeek-LLM directly within ComfyUI.
     """
-    
+
     @classmethod
     def INPUT_TYPES(cls):
         """
         Defines the input parameters that this node accepts.
         Returns a dictionary specifying required and optional inputs.
         """
+        optional = _generation_inputs()
+        # Seconds after which generation stops and the partial text is
+        # returned; 0 for no limit
+        optional["timeout"] = ("FLOAT", {
+            "default": 0.0, "min": 0.0, "max": 86400.0, "step": 1.0
+        })
         return {
             "required": {
                 "prompt": ("STRING",),  # The input prompt for text generation
+            },
+            "optional": optional,
+            "hidden": {
+                "unique_id": "UNIQUE_ID",  # Used to address progress messages
             }
         }
 
@@ -28,27 +195,296 @@ class DeepSeekLLMNode:
     # Provide a description of what this node does
     DESCRIPTION = "A ComfyUI node that calls DeepSeek-LLM for text generation."
 
-    def execute(self, prompt: str):
+    @staticmethod
+    def build_config(
+        max_new_tokens: int = None,
+        mode: str = "sampling",
+        temperature: float = None,
+        repetition_penalty: float = None,
+        seed: int = -1,
+        stop_strings: str = "",
+        speculative: bool = False,
+        truncation: str = None,
+        max_prompt_tokens: int = 0,
+        kv_cache: str = None,
+        kv_window: int = None,
+    ) -> GenerationConfig:
+        """
+        Translates the node's widget values into a validated GenerationConfig.
+        Unset values fall back to the GenerationConfig defaults.
+        """
+        options = {
+            "max_new_tokens": max_new_tokens,
+            "temperature": temperature,
+            "repetition_penalty": repetition_penalty,
+            "truncation": truncation,
+            "max_prompt_tokens": max_prompt_tokens or None,
+            "kv_cache": kv_cache,
+            "kv_window": kv_window,
+        }
+        options = {k: v for k, v in options.items() if v is not None}
+        return GenerationConfig(
+            do_sample=mode != "greedy",
+            seed=seed if seed is not None and seed >= 0 else None,
+            stop_strings=GenerationConfig.parse_stop_strings(stop_strings),
+            speculative=bool(speculative),
+            **options
+        )
+
+    @classmethod
+    def IS_CHANGED(
+        cls,
+        prompt: str,
+        model: str = None,
+        unique_id=None,
+        timeout: float = 0.0,
+        **generation_options
+    ):
+        """
+        Fingerprint of the inputs, see `_fingerprint`. A timeout makes the
+        output depend on how fast the model runs, so it is never reused.
+        """
+        if timeout and timeout > 0:
+            return float("nan")
+        return _fingerprint(prompt, model, **generation_options)
+
+    async def execute(
+        self,
+        prompt: str,
+        model: str = None,
+        unique_id=None,
+        timeout: float = 0.0,
+        **generation_options
+    ):
         """
         Main execution function called by ComfyUI when the node is run.
         Takes a text prompt as input and returns the generated response.
-        
+        The response is streamed, so progress and the partial text are shown
+        in the UI while the model is still generating. The node is async:
+        ComfyUI's event loop keeps serving the UI while it waits for chunks.
+
         Args:
             prompt (str): The input text prompt for generation
-            
+            model (str): Name of the model to use, the default model if None
+            unique_id (str): ComfyUI node id, provided as a hidden input
+            timeout (float): Seconds after which the text generated so far
+                is returned, 0 for no limit
+            **generation_options: The optional generation widgets, see
+                `build_config`
+
         Returns:
             tuple[str]: A single-element tuple containing the generated text
         """
-        # Call our core inference logic and wrap the result in a tuple
-        result = run_deepseek_inference(prompt)
+        config = self.build_config(**generation_options)
+        progress = _NodeProgress(unique_id, total=config.max_new_tokens)
+        deadline = time.time() + timeout if timeout and timeout > 0 else None
+
+        # Stream the response from our core inference logic, reporting each
+        # chunk as it arrives
+        result = ""
+        steps = 0
+        async for chunk in astream_deepseek_inference(
+            prompt, config, model, cancel_token=_InterruptToken(), deadline=deadline
+        ):
+            steps += 1
+            result += chunk
+            progress.update(steps, result)
+
+        # An interrupted queue must not run the downstream nodes
+        if model_management is not None:
+            model_management.throw_exception_if_processing_interrupted()
+
+        progress.update(config.max_new_tokens, result, final=True)
         return (result,)
 
+
+class DeepSeekChatNode:
+    """
+    A ComfyUI custom node for multi-turn conversations with DeepSeek-LLM.
+    Each turn returns a session handle; wiring it into the next chat node
+    continues the conversation without re-processing the earlier turns.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        """
+        Defines the input parameters that this node accepts.
+        Returns a dictionary specifying required and optional inputs.
+        """
+        optional = {
+            # Handle from a previous turn; empty starts a new conversation
+            "session": ("STRING", {"default": "", "forceInput": True}),
+            # Only used when a new conversation is started
+            "system_prompt": ("STRING", {"multiline": True, "default": ""}),
+        }
+        optional.update(_generation_inputs())
+        return {
+            "required": {
+                "message": ("STRING", {"multiline": True}),  # The user's turn
+            },
+            "optional": optional,
+        }
+
+    # The assistant's reply and the handle to continue the conversation
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("response", "session")
+    FUNCTION = "execute"
+    CATEGORY = "Custom/LLM"
+    DESCRIPTION = "Chat with DeepSeek-LLM, keeping the conversation across turns."
+
+    @classmethod
+    def IS_CHANGED(
+        cls,
+        message: str,
+        session: str = "",
+        system_prompt: str = "",
+        model: str = None,
+        **generation_options
+    ):
+        """
+        Fingerprint of the turn, see `_fingerprint`; the session handle and
+        system prompt are part of it.
+        """
+        text = "\x00".join((session or "", system_prompt or "", message))
+        return _fingerprint(text, model, **generation_options)
+
+    def execute(
+        self,
+        message: str,
+        session: str = "",
+        system_prompt: str = "",
+        model: str = None,
+        **generation_options
+    ):
+        """
+        Sends the message to the conversation identified by `session` and
+        returns the reply together with the handle for the next turn.
+
+        Args:
+            message (str): The user's message
+            session (str): Session handle from a previous turn, may be empty
+            system_prompt (str): System message for a new conversation
+            model (str): Name of the model to use, the default model if None
+            **generation_options: The optional generation widgets, see
+                `DeepSeekLLMNode.build_config`
+
+        Returns:
+            tuple[str, str]: The reply and the session handle
+        """
+        config = DeepSeekLLMNode.build_config(**generation_options)
+        response, session_id = run_chat_turn(
+            message,
+            session_id=session or None,
+            config=config,
+            model=model,
+            system_prompt=system_prompt or None
+        )
+        return (response, session_id)
+
+
+class DeepSeekBatchNode:
+    """
+    A ComfyUI custom node generating responses for many prompts in one
+    execution, e.g. captions for a whole set of images. Prompts of similar
+    length are generated together in memory-sized micro-batches.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        """
+        Defines the input parameters that this node accepts.
+        Returns a dictionary specifying required and optional inputs.
+        """
+        return {
+            "required": {
+                # One prompt per line, or a list of prompts from another node
+                "prompts": ("STRING", {"multiline": True}),
+            },
+            "optional": _generation_inputs(),
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            }
+        }
+
+    # Every input arrives as a list, so lists of prompts can be wired in
+    INPUT_IS_LIST = True
+    # The responses as a list (one item per prompt) and joined by newlines
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("responses", "text")
+    OUTPUT_IS_LIST = (True, False)
+    FUNCTION = "execute"
+    CATEGORY = "Custom/LLM"
+    DESCRIPTION = "Generate DeepSeek-LLM responses for a list of prompts."
+
+    @staticmethod
+    def split_prompts(prompts) -> list:
+        """
+        Flattens the prompt input into single prompts: every item of the
+        list is split into lines and empty lines are dropped.
+        """
+        if isinstance(prompts, str):
+            prompts = [prompts]
+        return [
+            line.strip()
+            for item in prompts
+            for line in item.splitlines()
+            if line.strip()
+        ]
+
+    @classmethod
+    def IS_CHANGED(cls, prompts, model=None, unique_id=None, **generation_options):
+        """
+        Fingerprint over all prompts, see `_fingerprint`. Inputs arrive as
+        lists, like in `execute`.
+        """
+        options = {
+            key: value[0] for key, value in generation_options.items() if value
+        }
+        text = "\n".join(cls.split_prompts(prompts))
+        return _fingerprint(text, model[0] if model else None, **options)
+
+    def execute(self, prompts, model=None, unique_id=None, **generation_options):
+        """
+        Generates one response per prompt, in the order of the prompts.
+
+        Args:
+            prompts (list[str]): Newline-separated prompts or a list of them
+            model (list[str]): Name of the model to use
+            unique_id (list[str]): ComfyUI node id, provided as a hidden input
+            **generation_options: The optional generation widgets (as
+                single-element lists), see `DeepSeekLLMNode.build_config`
+
+        Returns:
+            tuple: The list of responses and the responses joined by newlines
+        """
+        # With INPUT_IS_LIST, widget values arrive as single-element lists
+        options = {
+            key: value[0] for key, value in generation_options.items() if value
+        }
+        model = model[0] if model else None
+        node_id = unique_id[0] if unique_id else None
+
+        prompts = self.split_prompts(prompts)
+        config = DeepSeekLLMNode.build_config(**options)
+        progress = _NodeProgress(node_id, total=max(len(prompts), 1))
+
+        def report(done, total):
+            progress.update(done, f"{done}/{total} prompts")
+
+        responses = run_deepseek_batch(prompts, config, model, progress=report)
+        return (responses, "\n".join(responses))
+
+
 # Register the node class with ComfyUI so it can be discovered
 NODE_CLASS_MAPPINGS = {
-    "DeepSeekLLMNode": DeepSeekLLMNode
+    "DeepSeekLLMNode": DeepSeekLLMNode,
+    "DeepSeekChatNode": DeepSeekChatNode,
+    "DeepSeekBatchNode": DeepSeekBatchNode
 }
 
 # Define a user-friendly display name for the node in the UI
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "DeepSeekLLMNode": "DeepSeek LLM"
-}
\ No newline at end of file
+    "DeepSeekLLMNode": "DeepSeek LLM",
+    "DeepSeekChatNode": "DeepSeek Chat",
+    "DeepSeekBatchNode": "DeepSeek Batch"
+}
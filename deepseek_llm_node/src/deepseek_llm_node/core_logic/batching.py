@@ -0,0 +1,225 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Sentinel pushed on the queue to stop the worker thread
+_SHUTDOWN = object()
+
+
+class _PendingRequest:
+    """A submitted payload waiting for its batch to run."""
+
+    __slots__ = ("payload", "group_key", "batchable", "future", "enqueued_at")
+
+    def __init__(self, payload, group_key, batchable: bool):
+        self.payload = payload
+        self.group_key = group_key
+        self.batchable = batchable
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class BatchScheduler:
+    """Dynamic batching in front of a batched generation function.
+
+    Requests submitted from any thread are collected for up to
+    ``batch_window_ms`` after the first one arrives (or until
+    ``max_batch_size`` are waiting). Requests sharing the same ``group_key``
+    are then handed to ``batch_fn`` in a single call and each result is routed
+    back to its caller's future.
+
+    ``batch_fn(group_key, payloads)`` must return one result per payload, in
+    order. Everything runs on a single worker thread, which is only started on
+    the first submission.
+    """
+
+    def __init__(
+        self,
+        batch_fn,
+        max_batch_size: int = 8,
+        batch_window_ms: float = 10.0,
+        name: str = "deepseek-batcher"
+    ):
+        self._batch_fn = batch_fn
+        self._name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._collecting = 0
+        self.configure(max_batch_size=max_batch_size, batch_window_ms=batch_window_ms)
+        self.reset_stats()
+
+    def configure(self, max_batch_size: int = None, batch_window_ms: float = None):
+        """Tune the batching behaviour; takes effect on the next batch.
+
+        Args:
+            max_batch_size (int): Largest number of requests per batch
+            batch_window_ms (float): How long to wait for more requests
+        """
+        if max_batch_size is not None:
+            if max_batch_size < 1:
+                raise ValueError("max_batch_size must be at least 1")
+            self.max_batch_size = int(max_batch_size)
+        if batch_window_ms is not None:
+            if batch_window_ms < 0:
+                raise ValueError("batch_window_ms must not be negative")
+            self.batch_window_ms = float(batch_window_ms)
+
+    def submit(self, payload, group_key=None, batchable: bool = True) -> Future:
+        """Queue a payload for the next batch.
+
+        Args:
+            payload: The item handed to ``batch_fn``
+            group_key: Only payloads with equal keys are batched together
+            batchable (bool): When False the payload always runs on its own
+
+        Returns:
+            Future: Resolves to the result produced for this payload
+        """
+        request = _PendingRequest(payload, group_key, batchable)
+        self._ensure_worker()
+        with self._lock:
+            self._stats["submitted"] += 1
+        self._queue.put(request)
+        return request.future
+
+    def stats(self) -> dict:
+        """Snapshot of the queue depth and batch size statistics."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["batch_size_histogram"] = dict(self._stats["batch_size_histogram"])
+            stats["queue_depth"] = self._queue.qsize() + self._collecting
+        batches = stats["batches"]
+        stats["avg_batch_size"] = (
+            stats["batched_requests"] / batches if batches else 0.0
+        )
+        stats["avg_queue_wait_ms"] = (
+            stats["total_queue_wait_ms"] / stats["batched_requests"]
+            if stats["batched_requests"] else 0.0
+        )
+        return stats
+
+    def reset_stats(self):
+        """Reset all counters, e.g. between benchmark runs."""
+        with self._lock:
+            self._stats = {
+                "submitted": 0,
+                "completed": 0,
+                "failed": 0,
+                "batches": 0,
+                "batched_requests": 0,
+                "max_batch_size_seen": 0,
+                "total_queue_wait_ms": 0.0,
+                "batch_size_histogram": {},
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker thread after the queued requests have run."""
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is None:
+            return
+        self._queue.put(_SHUTDOWN)
+        if wait:
+            worker.join()
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name=self._name, daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _SHUTDOWN:
+                return
+
+            # Collect whatever else arrives within the batching window
+            pending = [first]
+            stop = False
+            deadline = time.monotonic() + self.batch_window_ms / 1000.0
+            with self._lock:
+                self._collecting = 1
+            while len(pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is _SHUTDOWN:
+                    stop = True
+                    break
+                pending.append(request)
+                with self._lock:
+                    self._collecting = len(pending)
+
+            for group_key, requests in self._group(pending):
+                self._run_batch(group_key, requests)
+            with self._lock:
+                self._collecting = 0
+
+            if stop:
+                return
+
+    def _group(self, pending):
+        # Batchable requests are grouped by key (keeping arrival order), the
+        # others each get a batch of their own
+        groups = {}
+        for request in pending:
+            if request.batchable:
+                groups.setdefault(("batch", request.group_key), []).append(request)
+            else:
+                groups[("solo", id(request))] = [request]
+
+        for requests in groups.values():
+            group_key = requests[0].group_key
+            for start in range(0, len(requests), self.max_batch_size):
+                yield group_key, requests[start:start + self.max_batch_size]
+
+    def _run_batch(self, group_key, requests):
+        # Drop requests whose callers cancelled them while they were queued
+        requests = [r for r in requests if r.future.set_running_or_notify_cancel()]
+        if not requests:
+            return
+
+        started = time.monotonic()
+        with self._lock:
+            size = len(requests)
+            self._stats["batches"] += 1
+            self._stats["batched_requests"] += size
+            self._stats["max_batch_size_seen"] = max(
+                self._stats["max_batch_size_seen"], size
+            )
+            histogram = self._stats["batch_size_histogram"]
+            histogram[size] = histogram.get(size, 0) + 1
+            self._stats["total_queue_wait_ms"] += sum(
+                (started - r.enqueued_at) * 1000.0 for r in requests
+            )
+
+        try:
+            results = self._batch_fn(group_key, [r.payload for r in requests])
+            if len(results) != len(requests):
+                raise RuntimeError(
+                    f"batch function returned {len(results)} results "
+                    f"for {len(requests)} requests"
+                )
+        except Exception as exc:
+            with self._lock:
+                self._stats["failed"] += len(requests)
+            for request in requests:
+                request.future.set_exception(exc)
+            return
+
+        with self._lock:
+            self._stats["completed"] += len(requests)
+        for request, result in zip(requests, results):
+            request.future.set_result(result)
@@ -0,0 +1,61 @@
+def plan_micro_batches(
+    lengths,
+    max_new_tokens: int,
+    token_budget: int = None,
+    max_batch_size: int = 32,
+    max_padding: float = 0.25
+):
+    """Group prompts into micro-batches of similar token length.
+
+    Prompts are sorted by length, so each batch only pads its prompts to the
+    length of its longest one. A batch is closed when adding the next prompt
+    would exceed ``max_batch_size``, make the batch's KV cache
+    (``batch size * (longest prompt + max_new_tokens)`` tokens) exceed
+    ``token_budget``, or push the share of padding tokens over
+    ``max_padding``.
+
+    Args:
+        lengths (list[int]): Token length of every prompt
+        max_new_tokens (int): Tokens generated per prompt
+        token_budget (int): Tokens the KV cache of one batch may hold, None
+            for no limit
+        max_batch_size (int): Largest number of prompts per batch
+        max_padding (float): Largest acceptable share of padding tokens
+
+    Returns:
+        list[list[int]]: Prompt indices per batch, shortest prompts first. A
+        prompt too long for the budget still gets a batch of its own.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    current = []
+    current_tokens = 0
+    for index in order:
+        length = lengths[index]
+        if current:
+            # Sorted ascending, so the new prompt is the longest of the batch
+            size = len(current) + 1
+            tokens = current_tokens + length
+            padding = 1 - tokens / (size * length) if length else 0.0
+            kv_tokens = size * (length + max_new_tokens)
+            fits = (
+                size <= max_batch_size
+                and (token_budget is None or kv_tokens <= token_budget)
+                and padding <= max_padding
+            )
+            if not fits:
+                batches.append(current)
+                current = []
+                current_tokens = 0
+        current.append(index)
+        current_tokens += length
+    if current:
+        batches.append(current)
+    return batches
+
+
+def padding_ratio(lengths, batches) -> float:
+    """Share of padding tokens when generating ``batches`` of ``lengths``."""
+    real = sum(lengths)
+    padded = sum(len(batch) * max(lengths[i] for i in batch) for batch in batches)
+    return 1 - real / padded if padded else 0.0
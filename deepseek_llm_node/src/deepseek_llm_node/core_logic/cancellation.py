@@ -0,0 +1,96 @@
+import threading
+
+# Why a generation ended: a stop string or end-of-sequence token, the token
+# budget, a cancelled token, the deadline, or the response cache
+FINISH_REASONS = ("stop", "length", "cancelled", "deadline", "cached")
+
+
+class CancellationToken:
+    """Thread-safe flag asking a generation to stop early.
+
+    Generation checks the token after every decoding step. Requests still
+    waiting in the queue are dropped right away through the registered
+    callbacks.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """Request cancellation; safe to call more than once."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback):
+        """Run ``callback()`` on cancellation, immediately if already
+        cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def child(self) -> "CancellationToken":
+        """A token that is also cancelled when this one is, e.g. to stop one
+        stream without cancelling the caller's token."""
+        return _ChildToken(self)
+
+
+class _ChildToken(CancellationToken):
+    """Cancelled on its own or with its parent, including parents that are
+    only polled, such as ComfyUI's interrupt token."""
+
+    def __init__(self, parent: CancellationToken):
+        super().__init__()
+        self._parent = parent
+        parent.add_callback(self.cancel)
+
+    @property
+    def cancelled(self) -> bool:
+        return super().cancelled or self._parent.cancelled
+
+
+class GenerationResult(str):
+    """Generated text that also tells why generation ended.
+
+    It is a `str`, so callers that only want the text need not change.
+
+    Attributes:
+        finish_reason (str): One of `FINISH_REASONS`
+        generated_tokens (int): Number of newly generated tokens
+    """
+
+    def __new__(cls, text: str, finish_reason: str = "stop", generated_tokens: int = 0):
+        if finish_reason not in FINISH_REASONS:
+            raise ValueError(f"unknown finish reason: {finish_reason!r}")
+        result = super().__new__(cls, text)
+        result.finish_reason = finish_reason
+        result.generated_tokens = generated_tokens
+        return result
+
+    @property
+    def text(self) -> str:
+        return str(self)
+
+    @property
+    def complete(self) -> bool:
+        """Whether generation ended on its own rather than being cut short."""
+        return self.finish_reason not in ("cancelled", "deadline")
+
+    def __reduce__(self):
+        # Keep the attributes when sent to or from a worker process
+        return (
+            GenerationResult,
+            (str(self), self.finish_reason, self.generated_tokens)
+        )
@@ -0,0 +1,115 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class ChatSession:
+    """State of one multi-turn conversation.
+
+    Besides the message history, a session keeps the KV state of the tokens
+    generated so far (``past_key_values``) together with those token ids
+    (``cached_ids``), so the next turn only has to prefill the new messages.
+    """
+
+    def __init__(self, session_id: str, model: str, system_prompt: str = None):
+        self.session_id = session_id
+        self.model = model
+        self.messages = []
+        if system_prompt:
+            self.messages.append({"role": "system", "content": system_prompt})
+        self.cached_ids = []
+        self.past_key_values = None
+        self.last_used = time.monotonic()
+        # Turns of one session must run one after the other
+        self.lock = threading.Lock()
+
+    def reset_cache(self):
+        """Forget the KV state, e.g. after a failed turn left it inconsistent."""
+        self.cached_ids = []
+        self.past_key_values = None
+
+
+class ChatSessionStore:
+    """Thread-safe collection of chat sessions with bounded memory.
+
+    Sessions idle for longer than ``idle_timeout`` seconds are dropped, and
+    the least recently used ones are evicted once there are more than
+    ``max_sessions``.
+    """
+
+    def __init__(self, max_sessions: int = 8, idle_timeout: float = 1800.0):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "expired": 0, "evicted": 0}
+
+    def get_or_create(
+        self, session_id: str = None, model: str = None, system_prompt: str = None
+    ) -> ChatSession:
+        """Return an existing session or start a new one.
+
+        A new session is created when ``session_id`` is empty or unknown
+        (e.g. expired), or when the session was started with another model.
+
+        Args:
+            session_id (str): Handle returned by a previous turn
+            model (str): Model the session runs on
+            system_prompt (str): System message of a new session
+
+        Returns:
+            ChatSession: The session, marked as most recently used
+        """
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None and session.model != model:
+                del self._sessions[session_id]
+                session = None
+
+            if session is None:
+                session = ChatSession(
+                    session_id or uuid.uuid4().hex, model, system_prompt
+                )
+                self._sessions[session.session_id] = session
+                self._stats["created"] += 1
+
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats["evicted"] += 1
+            return session
+
+    def get(self, session_id: str):
+        """Return a live session or None."""
+        with self._lock:
+            self._expire()
+            return self._sessions.get(session_id)
+
+    def close(self, session_id: str) -> bool:
+        """End a session and release its state."""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def clear(self, model: str = None):
+        """End all sessions, or only those running on one model."""
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                if model is None or session.model == model:
+                    del self._sessions[session_id]
+
+    def stats(self) -> dict:
+        """Counters of created, expired and evicted sessions."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["active"] = len(self._sessions)
+            return stats
+
+    def _expire(self):
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_used > self.idle_timeout:
+                del self._sessions[session_id]
+                self._stats["expired"] += 1
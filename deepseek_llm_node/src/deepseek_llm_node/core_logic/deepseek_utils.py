@@ -1,58 +1,2163 @@
 # Import required libraries for the DeepSeek LLM model
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (
+    AutoConfig,
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    DynamicCache,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+)
+
+try:
+    from transformers import SinkCache
+except ImportError:  # removed from recent transformers releases
+    SinkCache = None
+try:
+    # Their replacement: cache layers that drop keys and values outside the
+    # sliding window
+    from transformers.cache_utils import DynamicSlidingWindowLayer
+except ImportError:  # older transformers releases
+    DynamicSlidingWindowLayer = None
 import torch
+import asyncio
+import atexit
+import copy
+import importlib.util
 import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from .batching import BatchScheduler
+from .bucketing import plan_micro_batches
+from .cancellation import CancellationToken, GenerationResult
+from .chat_session import ChatSessionStore
+from .generation_config import KV_CACHE_MODES, GenerationConfig, apply_stop_strings
+from .metrics import (
+    CallMetrics,
+    JsonLinesExporter,
+    MetricsRegistry,
+    PrometheusFileExporter,
+)
+from .model_registry import ModelRegistry
+from .prefix_cache import PrefixCache
+from .remote_backend import OpenAICompatibleBackend
+from .profiler import SamplingProfiler
+from .quantization import (
+    PERSISTED_MODES,
+    PRECISION_MODES,
+    QUANTIZED_MODES,
+    artifact_dir,
+    load_quantized_model,
+    quantize_model,
+    save_quantized_model,
+)
+from .response_cache import ResponseCache, make_cache_key
+from .snapshot import (
+    ensure_snapshot,
+    has_safetensors,
+    snapshot_path,
+    weights_fingerprint,
+)
+from .truncation import truncate_tokens
+from .worker_pool import WorkerPool
 
 # Specify the model name/path for the DeepSeek 7B chat model
 model_name = "deepseek-ai/deepseek-llm-7b-chat"
 
-# Initialize the tokenizer for text preprocessing
-tokenizer = AutoTokenizer.from_pretrained(model_name)
+# Models offered on the node. DEEPSEEK_LLM_MODELS overrides the list with
+# comma-separated names or local paths; the first entry is the default.
+available_models = [
+    name.strip()
+    for name in os.environ.get(
+        "DEEPSEEK_LLM_MODELS",
+        ",".join([
+            model_name,
+            "deepseek-ai/deepseek-coder-1.3b-instruct",
+            "deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B",
+        ])
+    ).split(",")
+    if name.strip()
+]
+default_model_name = available_models[0]
 
-# Create cache directory for model weights offloading to manage memory usage
+# Draft models for speculative decoding, as comma-separated
+# "<model>=<draft model>" pairs. A draft has to share its model's tokenizer.
+draft_models = dict(
+    (target.strip(), draft.strip())
+    for target, _, draft in (
+        pair.partition("=")
+        for pair in os.environ.get("DEEPSEEK_LLM_DRAFT_MODELS", "").split(",")
+    )
+    if target.strip() and draft.strip()
+)
+
+# Cache directory for model weights offloading to manage memory usage.
+# It is only created once the model is actually loaded.
 cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "deepseek_llm")
-os.makedirs(cache_dir, exist_ok=True)
 
-# Load the DeepSeek LLM model with optimized settings:
-# - Using float16 for reduced memory usage
-# - Auto device mapping for optimal hardware utilization
-# - Offloading to disk cache to handle large model size
-model = AutoModelForCausalLM.from_pretrained(
-    model_name, 
-    torch_dtype=torch.float16,
-    device_map="auto",
-    offload_folder=cache_dir
+# Weight precision, see `quantization.PRECISION_MODES`. CPU-only hosts should
+# use bf16 or one of the int8/int4 modes.
+default_precision = os.environ.get("DEEPSEEK_LLM_PRECISION", "fp16")
+
+# DEEPSEEK_LLM_SNAPSHOT_DIR pins every hub model to a local snapshot in this
+# directory. It is downloaded on first use; afterwards the hub is never
+# contacted and every process loads the same local files.
+default_snapshot_root = os.environ.get("DEEPSEEK_LLM_SNAPSHOT_DIR")
+
+# DEEPSEEK_LLM_COMPILE=1 trades a slower start for faster decoding: the
+# forward pass is compiled with torch.compile and runs on a static KV cache of
+# DEEPSEEK_LLM_COMPILE_MAX_LEN tokens. Prompts are padded to the next of the
+# DEEPSEEK_LLM_COMPILE_BUCKETS lengths, so only one graph per bucket (plus the
+# decode step) is compiled, all of them while the model is loaded.
+default_compile = os.environ.get("DEEPSEEK_LLM_COMPILE", "").lower() in (
+    "1", "true", "yes"
+)
+compile_buckets = sorted(
+    int(length)
+    for length in os.environ.get(
+        "DEEPSEEK_LLM_COMPILE_BUCKETS", "32,64,128,256,512,1024"
+    ).split(",")
+    if length.strip()
 )
+compile_max_len = int(os.environ.get("DEEPSEEK_LLM_COMPILE_MAX_LEN", "2048"))
+
+# Tokens generated per bucket during the warm-up; two decode steps are
+# enough to compile the decode graph
+_WARMUP_NEW_TOKENS = 3
+
+
+@contextmanager
+def _timed(timings: dict, phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - started
+
+
+class DeepSeekModelManager:
+    """Owns the tokenizer and model and loads them lazily.
+
+    Nothing is loaded when the manager is created, so importing this module
+    (and the ComfyUI node wrapping it) stays cheap. The weights are loaded on
+    the first call to `load`, either implicitly by `run_deepseek_inference`
+    or explicitly through `preload`. A lock makes sure that concurrent first
+    calls load the model exactly once.
+
+    Weight-only quantized precisions are produced once and saved under
+    ``<cache_dir>/quantized`` as safetensors; later processes rebuild the
+    model from that artifact instead of quantizing again.
+
+    With a ``snapshot_root``, weights come from a local snapshot of the model
+    with hub access disabled, so loading never waits on the network.
+
+    With ``use_compile``, the forward pass is compiled for static-cache
+    decoding and warmed up over `compile_buckets` right after loading. If
+    compilation fails, the model keeps running eagerly and the error is
+    kept in `compile_error`.
+
+    The seconds spent in each load phase (``resolve``, ``tokenizer``,
+    ``weights``, ``quantize``, ``compile`` and ``total``) are kept in
+    `load_timings`.
+    """
+
+    def __init__(
+        self,
+        model_name: str = model_name,
+        cache_dir: str = cache_dir,
+        precision: str = None,
+        persist_quantized: bool = True,
+        snapshot_root: str = None,
+        use_compile: bool = None
+    ):
+        precision = precision or default_precision
+        if precision not in PRECISION_MODES:
+            raise ValueError(
+                f"Unknown precision '{precision}', expected one of {PRECISION_MODES}"
+            )
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.precision = precision
+        self.persist_quantized = persist_quantized
+        self.snapshot_root = snapshot_root or default_snapshot_root
+        self.load_timings = {}
+        self.use_compile = default_compile if use_compile is None else use_compile
+        self.compiled_forward = None
+        self.static_cache = None
+        self.static_cache_len = 0
+        self.compile_error = None
+        self._tokenizer = None
+        self._model = None
+        self._lock = threading.Lock()
+        self._warmup_thread = None
+        self._warmup_error = None
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the tokenizer and model are resident in memory."""
+        return self._model is not None
+
+    @property
+    def tokenizer(self):
+        """The tokenizer, loading it (and the model) on first access."""
+        return self.load()[0]
+
+    @property
+    def model(self):
+        """The model, loading it (and the tokenizer) on first access."""
+        return self.load()[1]
+
+    def load(self):
+        """Load the tokenizer and model if needed and return them.
+
+        Returns:
+            tuple: The ``(tokenizer, model)`` pair
+        """
+        # Fast path: once loaded, no locking is needed
+        if self._model is not None:
+            return self._tokenizer, self._model
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            if self._model is None:
+                timings = {}
+                started = time.perf_counter()
+                with _timed(timings, "resolve"):
+                    source, options = self._source()
+
+                # Initialize the tokenizer for text preprocessing
+                with _timed(timings, "tokenizer"):
+                    tokenizer = AutoTokenizer.from_pretrained(source, **options)
+
+                os.makedirs(self.cache_dir, exist_ok=True)
+                model = self._load_model(source, options, timings)
+                if self.use_compile:
+                    self._compile(tokenizer, model, timings)
+                timings["total"] = time.perf_counter() - started
+
+                # Publish the tokenizer first so readers on the fast path
+                # never see a model without its tokenizer
+                self._tokenizer = tokenizer
+                self._model = model
+                self.load_timings = timings
+
+        return self._tokenizer, self._model
+
+    def weights_identity(self) -> dict:
+        """What the weights depend on besides the model name.
+
+        The precision, and for local snapshots and model directories a
+        fingerprint of the weight files; part of the response cache key, so
+        responses of other weights are never served.
+        """
+        if os.path.isdir(self.model_name):
+            path = self.model_name
+        elif self.snapshot_root is not None:
+            path = snapshot_path(self.snapshot_root, self.model_name)
+        else:
+            path = None
+        return {
+            "precision": self.precision,
+            "snapshot": weights_fingerprint(path) if path else None,
+        }
+
+    def _source(self):
+        """Where to load the model from.
+
+        Returns:
+            tuple: The model name or snapshot directory, and the keyword
+            arguments for ``from_pretrained``
+        """
+        if self.snapshot_root is None:
+            return self.model_name, {}
+        path = ensure_snapshot(self.model_name, self.snapshot_root)
+        return path, {"local_files_only": True}
+
+    def _load_model(self, source: str, options: dict, timings: dict):
+        """Load the model weights in the configured precision.
+
+        Args:
+            source (str): Model name or local directory
+            options (dict): Extra ``from_pretrained`` arguments
+            timings (dict): Receives the seconds of the load phases
+        """
+        # The config takes no weight loading options
+        config_options = options
+        if has_safetensors(source):
+            # Never fall back to unpickling .bin checkpoints
+            options = dict(options, use_safetensors=True)
+
+        if self.precision == "fp16":
+            # Load the DeepSeek LLM model with optimized settings:
+            # - Using float16 for reduced memory usage
+            # - Auto device mapping for optimal hardware utilization
+            # - Offloading to disk cache to handle large model size
+            with _timed(timings, "weights"):
+                return AutoModelForCausalLM.from_pretrained(
+                    source,
+                    torch_dtype=torch.float16,
+                    device_map="auto",
+                    offload_folder=self.cache_dir,
+                    **options
+                )
+
+        def build_model():
+            # The bare architecture; persisted quantized weights go into it
+            config = AutoConfig.from_pretrained(source, **config_options)
+            return AutoModelForCausalLM.from_config(
+                config, torch_dtype=torch.bfloat16
+            )
+
+        # Reuse weights quantized by an earlier process
+        path = artifact_dir(self.cache_dir, self.model_name, self.precision)
+        if self.precision in PERSISTED_MODES:
+            with _timed(timings, "weights"):
+                model = load_quantized_model(
+                    path, self.model_name, self.precision, build_model
+                )
+            if model is not None:
+                return model
+
+        # bf16 keeps the model on the CPU without disk offload; it is also
+        # the starting point for quantization
+        with _timed(timings, "weights"):
+            model = AutoModelForCausalLM.from_pretrained(
+                source,
+                torch_dtype=torch.bfloat16,
+                low_cpu_mem_usage=True,
+                **options
+            )
+        if self.precision not in QUANTIZED_MODES:
+            return model.eval()
+
+        with _timed(timings, "quantize"):
+            model = quantize_model(model, self.precision)
+            if self.persist_quantized and self.precision in PERSISTED_MODES:
+                save_quantized_model(model, path, self.model_name, self.precision)
+        return model
+
+    def compile_model(self) -> bool:
+        """Compile and warm up the loaded model, loading it if needed.
+
+        Must not run concurrently with generation on the same model.
+
+        Returns:
+            bool: Whether the compiled path is active
+        """
+        tokenizer, model = self.load()
+        with self._lock:
+            if self.compiled_forward is None:
+                self._compile(tokenizer, model, self.load_timings)
+        return self.compiled_forward is not None
+
+    def disable_compile(self, error: Exception = None):
+        """Go back to eager mode, e.g. after the compiled path failed."""
+        self.compiled_forward = None
+        self.static_cache = None
+        self.static_cache_len = 0
+        if error is not None:
+            self.compile_error = f"{type(error).__name__}: {error}"
+
+    def _compile(self, tokenizer, model, timings: dict):
+        """Compile the forward pass and run it once per prompt bucket."""
+        context = getattr(model.config, "max_position_embeddings", None)
+        max_len = min(compile_max_len, context) if context else compile_max_len
+        pad_id = tokenizer.eos_token_id if tokenizer.eos_token_id is not None else 0
+        try:
+            with _timed(timings, "compile"):
+                # CUDA graphs cut the per-step launch overhead on GPUs
+                mode = "reduce-overhead" if model.device.type == "cuda" else None
+                compiled = torch.compile(model.forward, mode=mode)
+                cache = _static_kv_cache(model, max_len)
+                for length in compile_buckets:
+                    if length + _WARMUP_NEW_TOKENS > max_len:
+                        break
+                    input_ids = torch.full(
+                        (1, length), pad_id, dtype=torch.long, device=model.device
+                    )
+                    cache.reset()
+                    with torch.no_grad(), _forward_replaced(model, compiled):
+                        model.generate(
+                            input_ids=input_ids,
+                            attention_mask=torch.ones_like(input_ids),
+                            past_key_values=cache,
+                            max_new_tokens=_WARMUP_NEW_TOKENS,
+                            min_new_tokens=_WARMUP_NEW_TOKENS,
+                            do_sample=False,
+                            pad_token_id=pad_id
+                        )
+        except Exception as exc:
+            # Eager mode keeps working; compilation is optional
+            self.disable_compile(exc)
+            return
+        self.compiled_forward = compiled
+        self.static_cache = cache
+        self.static_cache_len = max_len
+        self.compile_error = None
+
+    def preload(self, background: bool = False):
+        """Load the model ahead of the first inference call.
+
+        Args:
+            background (bool): Load on a daemon thread instead of blocking
+
+        Returns:
+            threading.Thread | None: The warm-up thread when ``background``
+            is set, otherwise None
+        """
+        if not background:
+            self.load()
+            return None
+
+        with self._lock:
+            # Reuse a warm-up that is already running
+            if self._warmup_thread is not None and self._warmup_thread.is_alive():
+                return self._warmup_thread
+            self._warmup_error = None
+            self._warmup_thread = threading.Thread(
+                target=self._warmup,
+                name=f"deepseek-warmup-{self.model_name}",
+                daemon=True
+            )
+            self._warmup_thread.start()
+            return self._warmup_thread
+
+    def wait_until_loaded(self, timeout: float = None) -> bool:
+        """Wait for a background warm-up to finish.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait, None for ever
+
+        Returns:
+            bool: Whether the model is loaded
+
+        Raises:
+            Exception: Re-raises the error that made the warm-up fail
+        """
+        thread = self._warmup_thread
+        if thread is not None:
+            thread.join(timeout)
+        if self._warmup_error is not None:
+            raise self._warmup_error
+        return self.is_loaded
+
+    def memory_footprint(self) -> int:
+        """Bytes used by the loaded model's parameters and buffers."""
+        model = self._model
+        if model is None:
+            return 0
+        if hasattr(model, "get_memory_footprint"):
+            return int(model.get_memory_footprint())
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    def unload(self):
+        """Drop the tokenizer and model so their memory can be reclaimed."""
+        with self._lock:
+            self._tokenizer = None
+            self._model = None
+            self.compiled_forward = None
+            self.static_cache = None
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _warmup(self):
+        # Errors are kept so `wait_until_loaded` can report them; the next
+        # regular `load` call simply retries
+        try:
+            self.load()
+        except Exception as exc:
+            self._warmup_error = exc
+
+
+def _static_kv_cache(model, max_len: int):
+    """A single-sequence static KV cache of ``max_len`` tokens."""
+    from transformers import StaticCache
+
+    options = {"config": model.config, "max_cache_len": max_len}
+    tensors = {"device": model.device, "dtype": model.dtype}
+    # The batch size argument was renamed and later dropped
+    for batch in ({"batch_size": 1}, {"max_batch_size": 1}, {}):
+        try:
+            return StaticCache(**options, **batch, **tensors)
+        except TypeError:
+            continue
+    return StaticCache(**options)
+
+
+@contextmanager
+def _forward_replaced(model, forward):
+    """Temporarily route the model's forward pass through ``forward``."""
+    previous = model.__dict__.get("forward")
+    model.forward = forward
+    try:
+        yield
+    finally:
+        if previous is None:
+            del model.forward
+        else:
+            model.forward = previous
+
+
+def _memory_budget_bytes():
+    budget_gb = os.environ.get("DEEPSEEK_LLM_MEMORY_BUDGET_GB")
+    return int(float(budget_gb) * 2**30) if budget_gb else None
+
+
+# KV state of shared prompt prefixes (system prompts, few-shot examples), so
+# they are only prefilled once. Set DEEPSEEK_LLM_PREFIX_CACHE=0 to disable.
+prefix_cache = PrefixCache(
+    max_bytes=int(os.environ.get("DEEPSEEK_LLM_PREFIX_CACHE_MB", "1024")) << 20
+)
+prefix_cache_enabled = os.environ.get("DEEPSEEK_LLM_PREFIX_CACHE", "1") != "0"
+
+# Registered prefixes as text, so matching prompts can skip batching
+_registered_prefixes = set()
+
+# Multi-turn conversations keep their KV state between turns
+chat_sessions = ChatSessionStore(
+    max_sessions=int(os.environ.get("DEEPSEEK_LLM_MAX_SESSIONS", "8")),
+    idle_timeout=float(os.environ.get("DEEPSEEK_LLM_SESSION_TIMEOUT", "1800"))
+)
+
+
+def _on_model_evicted(name: str):
+    # Cached KV states are useless (and large) once their model is gone
+    prefix_cache.clear(name)
+    chat_sessions.clear(name)
+
+
+# Models are loaded by name on first use. When DEEPSEEK_LLM_MEMORY_BUDGET_GB
+# is set, the least recently used models are unloaded to stay within it.
+model_registry = ModelRegistry(
+    DeepSeekModelManager, _memory_budget_bytes(), on_evict=_on_model_evicted
+)
+
+# Manager of the default model; nothing is loaded until needed
+model_manager = model_registry.manager(default_model_name)
+
+
+def get_model_manager(name: str = None) -> DeepSeekModelManager:
+    """Return the (possibly not yet loaded) manager of a model.
+
+    Args:
+        name (str): Model name or path, the default model if None
+    """
+    return model_registry.manager(name or default_model_name)
+
+
+def get_load_timings(name: str = None) -> dict:
+    """Return the seconds spent in each phase of a model's last load.
+
+    Args:
+        name (str): Model name or path, the default model if None
+
+    Returns:
+        dict: Seconds per phase, empty if the model was not loaded in this
+        process
+    """
+    return dict(get_model_manager(name).load_timings)
+
+
+def get_compile_status(name: str = None) -> dict:
+    """Return whether a model runs compiled, and why not if compilation
+    failed."""
+    manager = get_model_manager(name)
+    return {
+        "enabled": manager.use_compile,
+        "compiled": manager.compiled_forward is not None,
+        "error": manager.compile_error,
+        "buckets": list(compile_buckets),
+        "static_cache_len": manager.static_cache_len,
+        "compile_seconds": manager.load_timings.get("compile"),
+    }
+
+
+def preload_model(background: bool = False, name: str = None):
+    """Load a DeepSeek model before the first inference call.
+
+    Args:
+        background (bool): Load on a daemon thread instead of blocking
+        name (str): Model name or path, the default model if None
+
+    Returns:
+        threading.Thread | None: The warm-up thread when ``background`` is set
+    """
+    name = name or default_model_name
+    if remote_backend is not None:
+        # Nothing to load in this process
+        return None
+    if worker_count:
+        if not background:
+            get_worker_pool().broadcast("preload", name=name)
+            return None
+        thread = threading.Thread(
+            target=preload_model, kwargs={"name": name}, name="deepseek-preload",
+            daemon=True
+        )
+        thread.start()
+        return thread
+    return model_registry.preload(name, background=background)
+
+
+def register_prompt_prefix(prefix: str, model: str = None):
+    """Register a fixed prompt preamble whose KV state should be cached.
+
+    Prompts starting with the prefix run unbatched and start generating from
+    the cached state, so the prefix is only prefilled once. Frequently seen
+    prefixes are also cached without registration.
+
+    Args:
+        prefix (str): The shared start of the prompts, e.g. a system prompt
+        model (str): Name or path of the model, the default model if None
+    """
+    model = model or default_model_name
+    if remote_backend is not None:
+        # Prefix caching is up to the inference server
+        return
+    if worker_count:
+        get_worker_pool().broadcast("register_prefix", prefix=prefix, model=model)
+        return
+    with model_registry.use(model) as (tokenizer, _):
+        prefix_cache.register(model, tokenizer(prefix)["input_ids"])
+    _registered_prefixes.add((model, prefix))
+
+
+def get_prefix_cache_stats() -> dict:
+    """Return hit/miss counters and memory used by the prefix cache."""
+    return prefix_cache.stats()
+
+
+def _has_registered_prefix(prompt: str, model: str) -> bool:
+    return any(
+        name == model and prompt.startswith(prefix)
+        for name, prefix in _registered_prefixes
+    )
+
+
+def _kv_cache_nbytes(cache) -> int:
+    """Bytes held by the key and value tensors of a KV cache."""
+    if hasattr(cache, "layers"):
+        # transformers 4.54+: one object per layer; unfilled layers hold None
+        tensors = [
+            t for layer in cache.layers
+            for t in (getattr(layer, "keys", None), getattr(layer, "values", None))
+        ]
+    elif hasattr(cache, "key_cache"):
+        tensors = list(cache.key_cache) + list(cache.value_cache)
+    else:
+        # Legacy tuple of (key, value) pairs
+        tensors = [t for layer in cache for t in layer]
+    return sum(t.numel() * t.element_size() for t in tensors if t is not None)
+
+
+def _cached_prefix_state(name: str, model, input_ids):
+    """Return the KV state of the longest cached prefix of a single prompt.
+
+    When the prompt's prefix just became worth caching (registered or seen
+    often enough), it is prefilled once and stored first.
+
+    Args:
+        name (str): Name or path of the model
+        model: The loaded model
+        input_ids (torch.Tensor): Token ids of one prompt, shape ``(1, n)``
+
+    Returns:
+        DynamicCache | None: A private copy of the cached state
+    """
+    ids = input_ids[0].tolist()
+    length = prefix_cache.observe(name, ids)
+    if length:
+        with torch.no_grad():
+            outputs = model(
+                input_ids=input_ids[:, :length],
+                past_key_values=DynamicCache(),
+                use_cache=True
+            )
+        state = outputs.past_key_values
+        prefix_cache.put(name, ids[:length], state, _kv_cache_nbytes(state))
+
+    _, state = prefix_cache.lookup(name, ids)
+    # generate() extends the cache in place, so every request gets a copy
+    return copy.deepcopy(state) if state is not None else None
+
+
+# Per-call phase timings, token counts and memory peaks. Set
+# DEEPSEEK_LLM_METRICS=0 to turn the bookkeeping off.
+metrics = MetricsRegistry(enabled=os.environ.get("DEEPSEEK_LLM_METRICS", "1") != "0")
+
+# DEEPSEEK_LLM_METRICS_FILE additionally exports the metrics to a file, in the
+# Prometheus text format or as one JSON line per call
+_metrics_file = os.environ.get("DEEPSEEK_LLM_METRICS_FILE")
+if _metrics_file:
+    if os.environ.get("DEEPSEEK_LLM_METRICS_FORMAT", "prometheus") == "jsonl":
+        metrics.add_hook(JsonLinesExporter(_metrics_file))
+    else:
+        metrics.add_hook(PrometheusFileExporter(metrics, _metrics_file))
+
+# Sampling profiler for the generation thread, off unless started through
+# `start_profiling` or DEEPSEEK_LLM_PROFILE
+profiler = SamplingProfiler(
+    interval_ms=float(os.environ.get("DEEPSEEK_LLM_PROFILE_INTERVAL_MS", "5")),
+    thread_prefixes=("deepseek-batcher",)
+)
+
+
+def get_inference_metrics() -> dict:
+    """Return the aggregated per-phase timings and token counts per model."""
+    return metrics.snapshot()
+
+
+def start_profiling():
+    """Start sampling the stacks of the generation thread."""
+    profiler.start()
+
+
+def stop_profiling(path: str = None, top: int = 20) -> list:
+    """Stop the sampling profiler and return its hottest functions.
+
+    Args:
+        path (str): Also write all samples in collapsed-stack format, which
+            flamegraph tools can render
+        top (int): Number of functions to return
+
+    Returns:
+        list: ``(function, self samples, total samples)`` tuples
+    """
+    profiler.stop()
+    if path:
+        profiler.write_collapsed(path)
+    return profiler.report(top)
+
+
+# DEEPSEEK_LLM_PROFILE=<path> profiles the whole process lifetime and writes
+# the collapsed stacks on exit
+if os.environ.get("DEEPSEEK_LLM_PROFILE"):
+    profiler.start()
+    atexit.register(stop_profiling, os.environ["DEEPSEEK_LLM_PROFILE"])
+
+
+def _process_peak_rss_bytes():
+    """Peak resident set size over the lifetime of the process."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _current_rss_bytes():
+    """Current resident set size, None where /proc is not available."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _PeakMemoryTracker:
+    """Peak memory while one batch is generated.
+
+    On GPUs this is the allocator's peak. On CPU-only hosts the resident set
+    size is sampled on a background thread: ``ru_maxrss`` alone is the peak
+    of the whole process, which every later and smaller request would report
+    as its own. It is only used when the batch raised that peak, as samples
+    can miss short spikes.
+    """
+
+    interval = 0.01
+
+    def __init__(self):
+        self._peak = None
+        self._process_peak = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+            return
+        self._process_peak = _process_peak_rss_bytes()
+        self._sample()
+        self._thread = threading.Thread(
+            target=self._run, name="deepseek-rss-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and return the peak in bytes, None if unknown."""
+        if torch.cuda.is_available():
+            return torch.cuda.max_memory_allocated()
+        self._done.set()
+        self._thread.join()
+        self._sample()
+        process_peak = _process_peak_rss_bytes()
+        if self._process_peak is not None and process_peak > self._process_peak:
+            return process_peak
+        return self._peak
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = _current_rss_bytes()
+        if rss is not None and (self._peak is None or rss > self._peak):
+            self._peak = rss
+
+
+class _PhaseClock(StoppingCriteria):
+    """Never stops generation; notes when the first new token was produced,
+    which separates the prefill from the decode phase."""
+
+    def __init__(self):
+        self.first_token_at = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        return torch.zeros(
+            input_ids.shape[0], dtype=torch.bool, device=input_ids.device
+        )
+
+
+def _record_generation(calls, started: float, clock: _PhaseClock, new_tokens, pad_id):
+    """Attribute a finished `generate` call to the prefill and decode phases.
+
+    Args:
+        calls (list[CallMetrics]): One entry per generated sequence
+        started (float): `time.perf_counter` before prefill began
+        clock (_PhaseClock): The clock passed to `generate`
+        new_tokens (torch.Tensor): The generated token ids, one row per call
+        pad_id (int): Padding token, not counted as generated
+    """
+    finished = time.perf_counter()
+    first = clock.first_token_at or finished
+    metrics.record_phase("prefill", calls, first - started)
+    metrics.record_phase("decode", calls, finished - first)
+    counts = (new_tokens != pad_id).sum(dim=1).tolist()
+    for call, count in zip(calls, counts):
+        call.generated_tokens = count
+
+
+def _request_kv_cap_bytes():
+    cap_mb = os.environ.get("DEEPSEEK_LLM_MAX_REQUEST_KV_MB")
+    return int(float(cap_mb) * 2**20) if cap_mb else None
+
+
+def _prompt_token_budget(model, config: GenerationConfig) -> int:
+    """Largest number of prompt tokens one sequence of a request may use.
+
+    The prompt and ``max_new_tokens`` have to fit into the model's context
+    and, when DEEPSEEK_LLM_MAX_REQUEST_KV_MB is set, the KV cache they need
+    has to fit into that cap. A sliding-window cache never holds more than
+    its window, so only the window is checked against the cap.
+
+    Raises:
+        ValueError: If not even a single prompt token fits
+    """
+    budget = config.max_prompt_tokens
+    context = getattr(model.config, "max_position_embeddings", None)
+    if context:
+        room = context - config.max_new_tokens
+        budget = room if budget is None else min(budget, room)
+
+    cap = _request_kv_cap_bytes()
+    if cap is not None:
+        per_token = _kv_bytes_per_token(model)
+        if config.kv_cache == "quantized":
+            # 4-bit keys and values instead of 16-bit ones
+            per_token //= 4
+        capacity = cap // per_token
+        if config.kv_cache == "sliding":
+            if config.kv_window > capacity:
+                raise ValueError(
+                    f"a KV window of {config.kv_window} tokens exceeds "
+                    f"DEEPSEEK_LLM_MAX_REQUEST_KV_MB ({capacity} tokens)"
+                )
+        else:
+            room = capacity - config.max_new_tokens
+            budget = room if budget is None else min(budget, room)
+
+    if budget is not None and budget < 1:
+        raise ValueError(
+            f"max_new_tokens={config.max_new_tokens} leaves no room for the prompt"
+        )
+    return budget
+
+
+def _encode_prompts(tokenizer, model, prompts, config: GenerationConfig):
+    """Tokenize prompts and shorten them to the request's token budget.
+
+    Returns:
+        list[list[int]]: Token ids per prompt
+    """
+    budget = _prompt_token_budget(model, config)
+    encoded = tokenizer(prompts)["input_ids"]
+    return [_truncate_ids(tokenizer, ids, budget, config) for ids in encoded]
+
+
+def _truncate_ids(tokenizer, ids, budget: int, config: GenerationConfig):
+    if budget is None:
+        return list(ids)
+    # Keep the beginning-of-sequence token whatever part is dropped
+    bos = tokenizer.bos_token_id
+    keep_prefix = 1 if bos is not None and ids and ids[0] == bos else 0
+    return truncate_tokens(ids, budget, config.truncation, keep_prefix)
+
+
+def _left_pad(encoded, pad_id: int, device, length: int = None) -> dict:
+    """Pad token ids on the left into one batch.
+
+    Padding here rather than through the tokenizer leaves the shared cached
+    tokenizer's `padding_side` and `pad_token` as other callers set them.
+
+    Args:
+        encoded (list[list[int]]): Token ids per prompt
+        pad_id (int): Padding token
+        device: Device of the returned tensors
+        length (int): Padded length; defaults to the longest prompt
+
+    Returns:
+        dict: ``input_ids`` and ``attention_mask`` tensors
+    """
+    length = length or max(len(ids) for ids in encoded)
+    input_ids = torch.full((len(encoded), length), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(encoded), length), dtype=torch.long)
+    for row, ids in enumerate(encoded):
+        if ids:
+            input_ids[row, length - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, length - len(ids):] = 1
+    return {
+        "input_ids": input_ids.to(device),
+        "attention_mask": attention_mask.to(device),
+    }
+
+
+# Why a KV cache layout cannot run, see `available_kv_cache_modes`
+_KV_CACHE_REQUIREMENTS = {
+    "sliding": "a transformers release with SinkCache or sliding-window layers",
+    "quantized": "the optimum-quanto package (extra 'quantized-kv')",
+}
+
+
+def available_kv_cache_modes() -> list:
+    """The `KV_CACHE_MODES` that can run with the installed packages.
+
+    ``sliding`` needs either SinkCache (older transformers) or sliding-window
+    cache layers (newer ones); ``quantized`` needs optimum-quanto.
+    """
+    available = {
+        "dynamic": True,
+        "sliding": SinkCache is not None or DynamicSlidingWindowLayer is not None,
+        "quantized": _has_module("optimum.quanto"),
+    }
+    return [mode for mode in KV_CACHE_MODES if available[mode]]
+
+
+def _has_module(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ImportError:  # the parent package is missing
+        return False
+
+
+def _sliding_kv_cache(model, config: GenerationConfig):
+    """A KV cache holding only the last ``kv_window`` tokens."""
+    if SinkCache is not None:
+        # Also keeps a few leading "sink" tokens that stabilize attention
+        return SinkCache(window_length=config.kv_window, num_sink_tokens=4)
+    # Built for a copy of the model's config that declares every layer as
+    # sliding-window attention, so each layer drops the older entries
+    window_config = copy.deepcopy(model.config)
+    window_config.sliding_window = config.kv_window
+    window_config.layer_types = (
+        ["sliding_attention"] * window_config.num_hidden_layers
+    )
+    return DynamicCache(config=window_config)
+
+
+class _InferenceRequest:
+    """A prompt queued on the batch scheduler."""
+
+    __slots__ = (
+        "prompt", "streamer", "metrics", "cancel_token", "deadline", "submitted_at"
+    )
+
+    def __init__(
+        self,
+        prompt: str,
+        streamer=None,
+        call: CallMetrics = None,
+        cancel_token: CancellationToken = None,
+        deadline: float = None
+    ):
+        self.prompt = prompt
+        # Only set for streaming requests, which always run on their own
+        self.streamer = streamer
+        self.metrics = call
+        self.cancel_token = cancel_token
+        # Wall-clock time (`time.time`) after which generation stops
+        self.deadline = deadline
+        self.submitted_at = time.perf_counter()
+
+
+def _interruption(cancel_token: CancellationToken, deadline: float):
+    """Return why a request has to stop early, None if it may go on."""
+    if cancel_token is not None and cancel_token.cancelled:
+        return "cancelled"
+    if deadline is not None and time.time() >= deadline:
+        return "deadline"
+    return None
+
+
+class _StopOnInterruption(StoppingCriteria):
+    """Stops each sequence once its request is cancelled or past its deadline.
+
+    Checked after every decoding step, so an interrupted request frees the
+    model within one step. Other sequences of the batch keep generating.
+
+    Args:
+        controls (list[tuple]): ``(cancel token, deadline)`` per sequence
+    """
 
-def run_deepseek_inference(prompt: str) -> str:
+    def __init__(self, controls):
+        self.controls = controls
+        self.reasons = [None] * len(controls)
+
+    def update(self) -> list:
+        """Note newly interrupted sequences; return the reason per sequence."""
+        for index, (cancel_token, deadline) in enumerate(self.controls):
+            if self.reasons[index] is None:
+                self.reasons[index] = _interruption(cancel_token, deadline)
+        return self.reasons
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor(
+            [reason is not None for reason in self.update()],
+            dtype=torch.bool,
+            device=input_ids.device
+        )
+
+
+class _StopOnStrings(StoppingCriteria):
+    """Stops each sequence once its generated text contains a stop string.
+
+    Only the last few tokens are decoded at every step, which is enough to
+    spot any of the stop strings.
+    """
+
+    def __init__(self, tokenizer, stop_strings, prompt_length: int):
+        self.tokenizer = tokenizer
+        self.stop_strings = stop_strings
+        self.prompt_length = prompt_length
+        # A token decodes to at least one character, plus slack for tokens
+        # merging across the window boundary
+        self.window = max(len(s) for s in stop_strings) + 2
+
+    def __call__(self, input_ids, scores, **kwargs):
+        start = max(self.prompt_length, input_ids.shape[1] - self.window)
+        tails = self.tokenizer.batch_decode(
+            input_ids[:, start:], skip_special_tokens=True
+        )
+        return torch.tensor(
+            [any(s in tail for s in self.stop_strings) for tail in tails],
+            dtype=torch.bool,
+            device=input_ids.device
+        )
+
+
+class _ChatTurn:
+    """A chat turn queued on the batch scheduler; always runs on its own."""
+
+    __slots__ = ("session", "message", "metrics", "submitted_at")
+
+    def __init__(self, session, message: str, call: CallMetrics = None):
+        self.session = session
+        self.message = message
+        self.metrics = call
+        self.submitted_at = time.perf_counter()
+
+
+class _PromptBatch:
+    """A micro-batch of prompts planned by `run_deepseek_batch`."""
+
+    __slots__ = ("prompts", "calls", "submitted_at")
+
+    def __init__(self, prompts, calls):
+        self.prompts = prompts
+        self.calls = calls
+        self.submitted_at = time.perf_counter()
+
+
+def _generate_batch(group_key, requests):
+    """Entry point of the batch scheduler.
+
+    Args:
+        group_key (tuple): The ``(model name, GenerationConfig)`` shared by
+            the batch
+        requests (list): The `_InferenceRequest` prompts to generate for, or
+            a single `_ChatTurn` or `_PromptBatch`
+
+    Returns:
+        list: One decoded response per request, in order; the list of
+        responses for a `_PromptBatch`
+    """
+    name, config = group_key
+    started = time.perf_counter()
+    if isinstance(requests[0], _PromptBatch):
+        # Planned by `run_deepseek_batch`, always submitted on its own
+        prompts = requests[0].prompts
+        calls = requests[0].calls
+        waits = [started - requests[0].submitted_at] * len(calls)
+    else:
+        prompts = [getattr(request, "prompt", None) for request in requests]
+        calls = [request.metrics or CallMetrics(name) for request in requests]
+        waits = [started - request.submitted_at for request in requests]
+    for call, wait in zip(calls, waits):
+        metrics.record_phase("queue", [call], wait)
+        call.batch_size = len(calls)
+    peak_memory = _PeakMemoryTracker()
+    peak_memory.start()
+
+    streamer = None
+    controls = None
+    if isinstance(requests[0], _InferenceRequest):
+        if len(requests) == 1:
+            streamer = requests[0].streamer
+        controls = [(r.cancel_token, r.deadline) for r in requests]
+    # The models stay pinned while generating, so loads requested from other
+    # threads never evict them halfway
+    pinned = [name]
+    if config.speculative and name in draft_models:
+        pinned.append(draft_models[name])
+    try:
+        with model_registry.use(*pinned):
+            if isinstance(requests[0], _ChatTurn):
+                return [_generate_chat_turn(requests[0], name, config, calls)]
+            responses = _generate(prompts, name, config, calls, streamer, controls)
+        if isinstance(requests[0], _PromptBatch):
+            return [responses]
+        return responses
+    except Exception as exc:
+        for call in calls:
+            call.error = f"{type(exc).__name__}: {exc}"
+        # Unblock a consumer still iterating over the streamer
+        if streamer is not None:
+            streamer.end()
+        raise
+    finally:
+        peak = peak_memory.stop()
+        for call in calls:
+            call.peak_memory_bytes = peak
+            metrics.record_call(call)
+
+
+def _generate(
+    prompts,
+    name: str,
+    config: GenerationConfig,
+    calls,
+    streamer=None,
+    controls=None
+):
+    """Generate responses for several prompts with a single `generate` call.
+
+    Args:
+        prompts (list[str]): The prompts to generate responses for
+        name (str): Name or path of the model to use
+        config (GenerationConfig): Generation parameters
+        calls (list[CallMetrics]): Receive the measurements, one per prompt
+        streamer (TextIteratorStreamer): Receives tokens as they are produced
+        controls (list[tuple]): ``(cancel token, deadline)`` per prompt,
+            either may be None
+
+    Returns:
+        list[GenerationResult]: One decoded response per prompt, in order,
+        without the prompt and cut at the first stop string
+
+    Raises:
+        ValueError: If the configured KV cache layout cannot run here
+    """
+    if config.kv_cache not in available_kv_cache_modes():
+        raise ValueError(
+            f"kv_cache={config.kv_cache!r} needs "
+            f"{_KV_CACHE_REQUIREMENTS[config.kv_cache]}"
+        )
+    interruption = None
+    if controls and any(c != (None, None) for c in controls):
+        interruption = _StopOnInterruption(controls)
+        # Requests interrupted while queued do not even start
+        if all(interruption.update()):
+            if streamer is not None:
+                streamer.end()
+            return [GenerationResult("", reason) for reason in interruption.reasons]
+
+    tokenizer, model = model_registry.acquire(name)
+
+    # Decoder-only models continue from the last position, so prompts of
+    # different lengths are padded on the left to line up their endings.
+    # Tokenizers without a padding token pad with end-of-sequence.
+    pad_id = (
+        tokenizer.pad_token_id
+        if tokenizer.pad_token_id is not None
+        else tokenizer.eos_token_id
+    )
+
+    # Convert prompts to model input format, shortened to the token budget,
+    # and move them to the same device as the model
+    manager = model_registry.manager(name)
+    with metrics.phase("tokenize", calls):
+        encoded = _encode_prompts(tokenizer, model, prompts, config)
+        # The compiled path pads the prompt to its bucket length
+        bucket = _compile_bucket(manager, name, encoded, config)
+        inputs = _left_pad(encoded, pad_id, model.device, bucket)
+    prompt_length = inputs["input_ids"].shape[1]
+    for call, count in zip(calls, inputs["attention_mask"].sum(dim=1).tolist()):
+        call.prompt_tokens = count
+
+    # Seeded requests always run on their own, so the seed fully determines
+    # the sampled tokens
+    if config.seed is not None:
+        torch.manual_seed(config.seed)
+
+    clock = _PhaseClock()
+    stopping_criteria = StoppingCriteriaList([clock])
+    if config.stop_strings:
+        stopping_criteria.append(
+            _StopOnStrings(tokenizer, config.stop_strings, prompt_length)
+        )
+    if interruption is not None:
+        stopping_criteria.append(interruption)
+
+    # Speculative requests always run on their own, as assisted generation
+    # only supports a single sequence and the regular cache
+    draft = None
+    dynamic_kv = config.kv_cache == "dynamic"
+    if config.speculative and len(prompts) == 1 and dynamic_kv:
+        draft = _draft_model(name, tokenizer)
+
+    # A single prompt can resume from the cached state of its prefix; only
+    # the remaining tokens are prefilled. Padding rules this out for batches,
+    # and the draft model would lack the cached state.
+    started = time.perf_counter()
+    use_prefix_cache = (
+        len(prompts) == 1 and prefix_cache_enabled and draft is None
+        and dynamic_kv and bucket is None
+    )
+    if use_prefix_cache:
+        past_key_values = _cached_prefix_state(name, model, inputs["input_ids"])
+        if past_key_values is not None:
+            inputs["past_key_values"] = past_key_values
+    if config.kv_cache == "sliding":
+        inputs["past_key_values"] = _sliding_kv_cache(model, config)
+
+    # Generate at most `max_new_tokens` tokens after the prompt, sampling or
+    # decoding greedily as configured
+    # Forward passes are only counted when a draft model is involved
+    target_passes = _ForwardCounter(model if draft is not None else None)
+    draft_passes = _ForwardCounter(draft)
+    generate_kwargs = dict(
+        config.to_generate_kwargs(),
+        assistant_model=draft,
+        pad_token_id=pad_id,
+        stopping_criteria=stopping_criteria,
+        streamer=streamer
+    )
+    with target_passes, draft_passes:
+        if bucket is not None:
+            outputs = _generate_compiled(manager, model, inputs, generate_kwargs)
+        else:
+            outputs = model.generate(**inputs, **generate_kwargs)
+    _record_generation(
+        calls, started, clock, outputs[:, prompt_length:], pad_id
+    )
+    _record_speculation(calls[0].generated_tokens, target_passes, draft_passes)
+
+    # Decode only the newly generated tokens, removing special tokens
+    # (including the padding)
+    responses = tokenizer.batch_decode(
+        outputs[:, prompt_length:], skip_special_tokens=True
+    )
+    reasons = interruption.reasons if interruption else [None] * len(prompts)
+    results = []
+    for response, reason, call in zip(responses, reasons, calls):
+        response, stopped = apply_stop_strings(response, config.stop_strings)
+        if reason is None:
+            # Ended by a stop string, the end-of-sequence token or the budget
+            full = call.generated_tokens >= config.max_new_tokens
+            reason = "length" if full and not stopped else "stop"
+        results.append(GenerationResult(response, reason, call.generated_tokens))
+    return results
+
+
+def _compile_bucket(manager, name: str, encoded, config: GenerationConfig):
+    """Padded prompt length for the compiled path, None to run eagerly.
+
+    Only single sequences on the regular KV cache qualify, and prompt plus
+    ``max_new_tokens`` have to fit into the static cache.
+    """
+    if (
+        manager.compiled_forward is None
+        or len(encoded) != 1
+        or config.kv_cache != "dynamic"
+        or (config.speculative and name in draft_models)
+    ):
+        return None
+    for length in compile_buckets:
+        if length >= len(encoded[0]):
+            if length + config.max_new_tokens <= manager.static_cache_len:
+                return length
+            return None
+    return None
+
+
+def _generate_compiled(manager, model, inputs, generate_kwargs):
+    """Generate on the static cache with the compiled forward pass.
+
+    Should the compiled path fail, the model is switched to eager mode for
+    good and the request is generated again.
+    """
+    try:
+        manager.static_cache.reset()
+        with _forward_replaced(model, manager.compiled_forward):
+            return model.generate(
+                **inputs, past_key_values=manager.static_cache, **generate_kwargs
+            )
+    except Exception as exc:
+        manager.disable_compile(exc)
+        return model.generate(**inputs, **generate_kwargs)
+
+
+# Forward passes of target and draft models during speculative generation,
+# from which the draft acceptance rate is derived
+_speculation_stats = {
+    "generations": 0,
+    "generated_tokens": 0,
+    "target_forwards": 0,
+    "draft_forwards": 0,
+}
+_speculation_lock = threading.Lock()
+# Drafts already checked against their model's tokenizer
+_checked_drafts = set()
+
+
+def _draft_model(name: str, tokenizer):
+    """Return the loaded draft model of a model, None if it has none.
+
+    Raises:
+        ValueError: If the draft's tokenizer differs from the model's, in
+            which case its proposals would be meaningless
+    """
+    draft_name = draft_models.get(name)
+    if draft_name is None:
+        return None
+    draft_tokenizer, draft = model_registry.acquire(draft_name)
+    if draft_name not in _checked_drafts:
+        probe = "DeepSeek speculative decoding probe: 0123 äöü\n"
+        if (
+            len(draft_tokenizer) != len(tokenizer)
+            or draft_tokenizer(probe)["input_ids"] != tokenizer(probe)["input_ids"]
+        ):
+            raise ValueError(
+                f"draft model {draft_name!r} does not share the tokenizer of {name!r}"
+            )
+        _checked_drafts.add(draft_name)
+    return draft
+
+
+class _ForwardCounter:
+    """Counts the forward passes of a model while active."""
+
+    def __init__(self, model):
+        self.model = model
+        self.count = 0
+        self._handle = None
+
+    def __enter__(self):
+        if self.model is not None:
+            self._handle = self.model.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._handle is not None:
+            self._handle.remove()
+
+    def _hook(self, module, args, output):
+        self.count += 1
+
+
+def _record_speculation(generated: int, target, draft):
+    """Add the forward passes of a generation to the speculation stats.
+
+    Args:
+        generated (int): Tokens generated
+        target (_ForwardCounter): Passes of the model
+        draft (_ForwardCounter): Passes of the draft model, if any
+    """
+    if draft.model is None:
+        return
+    with _speculation_lock:
+        _speculation_stats["generations"] += 1
+        _speculation_stats["generated_tokens"] += generated
+        _speculation_stats["target_forwards"] += target.count
+        _speculation_stats["draft_forwards"] += draft.count
+
+
+def get_speculation_stats() -> dict:
+    """Return how well the draft models' proposals are accepted.
+
+    Every forward pass of the target model verifies the drafted tokens and
+    contributes one token of its own, so the tokens generated beyond the
+    number of target passes are accepted draft tokens. Each draft pass
+    proposes one token.
+
+    Returns:
+        dict: Raw counters plus ``acceptance_rate`` (accepted share of the
+        proposed tokens) and ``tokens_per_target_forward`` (1.0 means no
+        speedup)
+    """
+    with _speculation_lock:
+        stats = dict(_speculation_stats)
+    accepted = max(stats["generated_tokens"] - stats["target_forwards"], 0)
+    stats["acceptance_rate"] = (
+        accepted / stats["draft_forwards"] if stats["draft_forwards"] else 0.0
+    )
+    stats["tokens_per_target_forward"] = (
+        stats["generated_tokens"] / stats["target_forwards"]
+        if stats["target_forwards"] else 0.0
+    )
+    return stats
+
+
+def _common_prefix_length(a, b) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+def _generate_chat_turn(turn: _ChatTurn, name: str, config: GenerationConfig, calls):
+    """Answer the next user message of a chat session.
+
+    The conversation is rendered with the tokenizer's chat template. Tokens
+    already covered by the session's KV state are not prefilled again, so
+    each turn only pays for the new messages.
+
+    Over-long conversations are truncated like prompts; the session's own
+    KV state always uses the dynamic cache, whatever ``kv_cache`` says.
+
+    Args:
+        turn (_ChatTurn): The session and the new user message
+        name (str): Name or path of the model
+        config (GenerationConfig): Generation parameters
+        calls (list[CallMetrics]): Receives the measurements of the turn
+
+    Returns:
+        str: The assistant's reply, cut at the first stop string
+    """
+    session = turn.session
+    tokenizer, model = model_registry.acquire(name)
+
+    messages = session.messages + [{"role": "user", "content": turn.message}]
+    with metrics.phase("tokenize", calls):
+        # Ask for plain token ids: newer transformers return a dict by default
+        ids = tokenizer.apply_chat_template(
+            messages, add_generation_prompt=True, tokenize=True, return_dict=False
+        )
+        ids = _truncate_ids(
+            tokenizer, ids, _prompt_token_budget(model, config), config
+        )
+    input_ids = torch.tensor([ids], device=model.device)
+    calls[0].prompt_tokens = len(ids)
+
+    # Reuse the cached state up to where the rendered conversation still
+    # matches it; at least one token has to be fed to the model. A fresh
+    # cache is passed otherwise, as transformers < 4.47 returns a legacy
+    # tuple when generate() was not given a Cache object.
+    past_key_values = DynamicCache()
+    reused = min(_common_prefix_length(session.cached_ids, ids), len(ids) - 1)
+    if session.past_key_values is not None and reused > 0:
+        past_key_values = session.past_key_values
+        past_key_values.crop(reused)
+
+    if config.seed is not None:
+        torch.manual_seed(config.seed)
+
+    clock = _PhaseClock()
+    stopping_criteria = StoppingCriteriaList([clock])
+    if config.stop_strings:
+        stopping_criteria.append(
+            _StopOnStrings(tokenizer, config.stop_strings, len(ids))
+        )
+
+    pad_id = (
+        tokenizer.pad_token_id
+        if tokenizer.pad_token_id is not None
+        else tokenizer.eos_token_id
+    )
+    draft = _draft_model(name, tokenizer) if config.speculative else None
+    # Forward passes are only counted when a draft model is involved
+    target_passes = _ForwardCounter(model if draft is not None else None)
+    draft_passes = _ForwardCounter(draft)
+    started = time.perf_counter()
+    try:
+        with target_passes, draft_passes:
+            outputs = model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=past_key_values,
+                **config.replace(kv_cache="dynamic").to_generate_kwargs(),
+                assistant_model=draft,
+                pad_token_id=pad_id,
+                stopping_criteria=stopping_criteria,
+                return_dict_in_generate=True
+            )
+    except Exception:
+        # The state may have been extended halfway; start over next turn
+        session.reset_cache()
+        raise
+
+    sequence = outputs.sequences[0]
+    _record_generation(
+        calls, started, clock, outputs.sequences[:, len(ids):], pad_id
+    )
+    _record_speculation(calls[0].generated_tokens, target_passes, draft_passes)
+    response, _ = apply_stop_strings(
+        tokenizer.decode(sequence[len(ids):], skip_special_tokens=True),
+        config.stop_strings
+    )
+
+    # Remember the state; it covers every token except the last sampled one
+    state = outputs.past_key_values
+    session.past_key_values = state
+    session.cached_ids = sequence.tolist()[:state.get_seq_length()]
+    session.messages = messages + [{"role": "assistant", "content": response}]
+    return response
+
+
+# Prompts arriving within a short window are generated together. Both knobs
+# can be tuned through the environment or `configure_batching`.
+batch_scheduler = BatchScheduler(
+    _generate_batch,
+    max_batch_size=int(os.environ.get("DEEPSEEK_LLM_MAX_BATCH_SIZE", "8")),
+    batch_window_ms=float(os.environ.get("DEEPSEEK_LLM_BATCH_WINDOW_MS", "10"))
+)
+
+
+def configure_batching(max_batch_size: int = None, batch_window_ms: float = None):
+    """Tune the dynamic batching used by `run_deepseek_inference`.
+
+    Args:
+        max_batch_size (int): Largest number of prompts per `generate` call
+        batch_window_ms (float): How long to wait for more prompts to arrive
+    """
+    batch_scheduler.configure(
+        max_batch_size=max_batch_size, batch_window_ms=batch_window_ms
+    )
+
+
+def get_batching_stats() -> dict:
+    """Return queue depth and batch size statistics of the scheduler."""
+    return batch_scheduler.stats()
+
+
+# DEEPSEEK_LLM_WORKERS=N runs the models in N worker processes instead of
+# this one, see `WorkerPool`. The pool is started on first use.
+worker_count = int(os.environ.get("DEEPSEEK_LLM_WORKERS", "0"))
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Return the worker pool, starting it if needed; None in in-process mode."""
+    global _worker_pool
+    if not worker_count:
+        return None
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            threads = os.environ.get("DEEPSEEK_LLM_WORKER_THREADS")
+            _worker_pool = WorkerPool(
+                worker_count, threads_per_worker=int(threads) if threads else None
+            )
+            _worker_pool.start()
+            atexit.register(_worker_pool.shutdown)
+        return _worker_pool
+
+
+# Where generation runs: "local" uses the models of this process (or its
+# worker pool), "openai" sends the requests to an OpenAI-compatible server at
+# DEEPSEEK_LLM_REMOTE_URL, so no weights are loaded here at all
+BACKENDS = ("local", "openai")
+backend = os.environ.get("DEEPSEEK_LLM_BACKEND", "local")
+if backend not in BACKENDS:
+    raise ValueError(
+        f"DEEPSEEK_LLM_BACKEND must be one of {BACKENDS}, got {backend!r}"
+    )
+
+remote_backend = None
+if backend == "openai":
+    remote_backend = OpenAICompatibleBackend(
+        os.environ.get("DEEPSEEK_LLM_REMOTE_URL", "http://localhost:8000/v1"),
+        api_key=os.environ.get("DEEPSEEK_LLM_REMOTE_API_KEY"),
+        max_concurrency=int(os.environ.get("DEEPSEEK_LLM_REMOTE_CONCURRENCY", "8")),
+        max_retries=int(os.environ.get("DEEPSEEK_LLM_REMOTE_RETRIES", "3")),
+        metrics=metrics
+    )
+
+
+# Deterministic generations are memoized in memory and on disk, next to the
+# offload folder. Set DEEPSEEK_LLM_RESPONSE_CACHE=0 to disable the cache.
+response_cache = ResponseCache(
+    memory_budget_bytes=int(os.environ.get("DEEPSEEK_LLM_CACHE_MEMORY_MB", "64")) << 20,
+    disk_dir=os.path.join(cache_dir, "responses"),
+    disk_budget_bytes=int(os.environ.get("DEEPSEEK_LLM_CACHE_DISK_MB", "1024")) << 20
+)
+response_cache_enabled = os.environ.get("DEEPSEEK_LLM_RESPONSE_CACHE", "1") != "0"
+
+
+def get_response_cache_stats() -> dict:
+    """Return hit/miss counters and sizes of the response cache."""
+    return response_cache.stats()
+
+
+def _cached_response(prompt: str, name: str, config: GenerationConfig):
+    """Look up a deterministic request in the response cache.
+
+    Returns:
+        tuple: The cache key (None if the request is not cacheable) and the
+        cached response (None on a miss)
+    """
+    if not response_cache_enabled or not config.deterministic:
+        return None, None
+    # The remote server's weights are out of our sight
+    weights = (
+        model_registry.manager(name).weights_identity()
+        if remote_backend is None else None
+    )
+    cache_key = make_cache_key(
+        name, prompt, config.cache_params(), config.seed, weights
+    )
+    return cache_key, response_cache.get(cache_key)
+
+
+def _watch_interruption(future, cancel_token: CancellationToken, deadline: float):
+    """Drop a queued request as soon as it is cancelled or its deadline
+    passes; once running, `_StopOnInterruption` stops it instead."""
+    if cancel_token is not None:
+        cancel_token.add_callback(future.cancel)
+    if deadline is not None:
+        timer = threading.Timer(max(deadline - time.time(), 0.0), future.cancel)
+        timer.daemon = True
+        timer.start()
+        future.add_done_callback(lambda _: timer.cancel())
+
+
+def run_deepseek_inference(
+    prompt: str,
+    config: GenerationConfig = None,
+    model: str = None,
+    cancel_token: CancellationToken = None,
+    deadline: float = None,
+    **overrides
+) -> GenerationResult:
     """Run inference using DeepSeek-LLM model.
-    
+
+    Concurrent calls are collected by the batch scheduler and generated
+    together, so throughput grows with the number of parallel workflows.
+    Deterministic requests (sampling disabled or seeded) are served from the
+    response cache when the same prompt was generated before.
+
+    A cancelled request or one past its deadline stops after the current
+    decoding step, freeing the model for the next queued request, and
+    returns the text generated so far; in worker processes as well. The
+    non-streaming remote backend honours neither.
+
     Args:
         prompt (str): The input text prompt to generate a response for
-        
+        config (GenerationConfig): Generation parameters, defaults if None
+        model (str): Name or path of the model, the default model if None
+        cancel_token (CancellationToken): Stops generation when cancelled
+        deadline (float): Wall-clock time, as returned by `time.time`, at
+            which generation stops
+        **overrides: Individual `GenerationConfig` fields to change, e.g.
+            ``max_new_tokens=64`` or ``do_sample=False``
+
     Returns:
-        str: The generated text response from the model
-        
+        GenerationResult: The newly generated text, without the prompt; its
+        ``finish_reason`` tells whether it was cut short
+
     The function handles:
-    1. Tokenization of input prompt
-    2. Moving tensors to appropriate device
-    3. Text generation with specified parameters
-    4. Decoding the output tokens to readable text
-    """
-    # Convert prompt to model input format and move to same device as model
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    
-    # Generate text with the following parameters:
-    # - max_length: Maximum number of tokens in the output
-    # - temperature: Controls randomness (higher = more random)
-    # - do_sample: Enable sampling for more diverse outputs
-    outputs = model.generate(
-        **inputs,
-        max_length=2048,
-        temperature=0.7,
-        do_sample=True
-    )
-    
-    # Decode the generated tokens back to text, removing special tokens
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    return response 
\ No newline at end of file
+    1. Looking up deterministic requests in the response cache
+    2. Loading the selected model on first use
+    3. Batching the prompt with concurrent requests, in a worker process
+       when DEEPSEEK_LLM_WORKERS is set
+    4. Tokenization of input prompts
+    5. Text generation with specified parameters
+    6. Decoding the output tokens to readable text
+    """
+    config = GenerationConfig.from_options(config, **overrides)
+    model = model or default_model_name
+
+    cache_key, cached = _cached_response(prompt, model, config)
+    if cached is not None:
+        return GenerationResult(cached, "cached")
+
+    if remote_backend is not None:
+        response = remote_backend.generate(prompt, config, model)
+    elif worker_count:
+        extra = {"deadline": deadline} if deadline is not None else {}
+        response = get_worker_pool().generate(
+            prompt, config, model, cancel_token=cancel_token, **extra
+        )
+        response = response.result()
+    else:
+        future = batch_scheduler.submit(
+            _InferenceRequest(
+                prompt, call=CallMetrics(model), cancel_token=cancel_token,
+                deadline=deadline
+            ),
+            group_key=(model, config),
+            batchable=(
+                config.seed is None
+                and not config.speculative
+                and not _has_registered_prefix(prompt, model)
+            )
+        )
+        _watch_interruption(future, cancel_token, deadline)
+        try:
+            response = future.result()
+        except CancelledError:
+            # Dropped before it started. The deadline timer runs on the
+            # monotonic clock and may fire a hair before time.time() reaches
+            # the deadline; only the token and the timer cancel the future.
+            reason = _interruption(cancel_token, deadline) or "deadline"
+            return GenerationResult("", reason)
+
+    # Partial responses must not be served to later requests
+    if cache_key is not None and response.complete:
+        response_cache.put(cache_key, response)
+    return response
+
+
+def _kv_bytes_per_token(model) -> int:
+    """Bytes of KV cache one token occupies in a model."""
+    config = model.config
+    heads = getattr(config, "num_key_value_heads", None) or config.num_attention_heads
+    head_dim = (
+        getattr(config, "head_dim", None)
+        or config.hidden_size // config.num_attention_heads
+    )
+    # Quantized weights still compute (and cache) in a floating-point dtype
+    dtype = model.dtype if model.dtype.is_floating_point else torch.bfloat16
+    element_size = torch.tensor([], dtype=dtype).element_size()
+    return 2 * config.num_hidden_layers * heads * head_dim * element_size
+
+
+def _available_memory_bytes(device):
+    """Free memory on the model's device, None if it cannot be determined."""
+    if device.type == "cuda":
+        return torch.cuda.mem_get_info(device)[0]
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _micro_batch_token_budget(model):
+    """Tokens the KV cache of one micro-batch may hold.
+
+    A share (DEEPSEEK_LLM_BATCH_MEMORY_FRACTION) of the currently free memory
+    is set aside for the KV cache; the rest covers activations and whatever
+    else is running.
+    """
+    available = _available_memory_bytes(model.device)
+    if available is None:
+        return None
+    fraction = float(os.environ.get("DEEPSEEK_LLM_BATCH_MEMORY_FRACTION", "0.5"))
+    return int(available * fraction) // _kv_bytes_per_token(model)
+
+
+def run_deepseek_batch(
+    prompts,
+    config: GenerationConfig = None,
+    model: str = None,
+    progress=None,
+    **overrides
+):
+    """Generate responses for many prompts at once.
+
+    Prompts are sorted and bucketed by token length so little compute goes
+    into padding, and each bucket is split into micro-batches whose KV cache
+    fits into the free memory. Deterministic prompts already in the response
+    cache are not generated again.
+
+    Args:
+        prompts (list[str]): The prompts to generate responses for
+        config (GenerationConfig): Generation parameters, defaults if None
+        model (str): Name or path of the model, the default model if None
+        progress (callable): Called as ``progress(done, total)`` whenever
+            responses have been completed
+        **overrides: Individual `GenerationConfig` fields to change
+
+    Returns:
+        list[GenerationResult]: One response per prompt, in the order of
+        ``prompts``; its ``finish_reason`` is ``cached`` for responses taken
+        from the response cache
+    """
+    config = GenerationConfig.from_options(config, **overrides)
+    model = model or default_model_name
+    prompts = list(prompts)
+    responses = [None] * len(prompts)
+
+    # Serve what we can from the response cache
+    pending = []
+    cache_keys = {}
+    for index, prompt in enumerate(prompts):
+        cache_key, cached = _cached_response(prompt, model, config)
+        if cached is not None:
+            responses[index] = GenerationResult(cached, "cached")
+        else:
+            pending.append(index)
+            cache_keys[index] = cache_key
+
+    done = len(prompts) - len(pending)
+    if progress is not None:
+        progress(done, len(prompts))
+
+    def finish(indices, texts):
+        nonlocal done
+        for index, text in zip(indices, texts):
+            responses[index] = text
+            if cache_keys[index] is not None:
+                response_cache.put(cache_keys[index], text)
+        done += len(indices)
+        if progress is not None:
+            progress(done, len(prompts))
+
+    if not pending:
+        return responses
+
+    if remote_backend is not None:
+        # The server does its own batching; keep its request slots busy
+        with ThreadPoolExecutor(max_workers=remote_backend.max_concurrency) as pool:
+            futures = {
+                pool.submit(remote_backend.generate, prompts[i], config, model): i
+                for i in pending
+            }
+            for future in as_completed(futures):
+                finish([futures[future]], [future.result()])
+        return responses
+
+    if worker_count:
+        # Spread the prompts over the workers, which plan their own batches
+        pool = get_worker_pool()
+        chunks = [pending[i::worker_count] for i in range(worker_count)]
+        futures = [
+            (chunk, pool.submit(
+                "generate_batch", prompts=[prompts[i] for i in chunk],
+                config=config, model=model
+            ))
+            for chunk in chunks if chunk
+        ]
+        for chunk, future in futures:
+            finish(chunk, future.result())
+        return responses
+
+    max_batch_size = int(os.environ.get("DEEPSEEK_LLM_MAX_MICRO_BATCH", "32"))
+    # Seeded and speculative prompts run one at a time, like in
+    # `run_deepseek_inference`, so they give the same responses
+    if config.seed is not None or config.speculative:
+        max_batch_size = 1
+    with model_registry.use(model) as (tokenizer, loaded):
+        encoded = _encode_prompts(
+            tokenizer, loaded, [prompts[i] for i in pending], config
+        )
+        plan = plan_micro_batches(
+            [len(ids) for ids in encoded],
+            config.max_new_tokens,
+            token_budget=_micro_batch_token_budget(loaded),
+            max_batch_size=max_batch_size
+        )
+    # Keep no reference to the weights while waiting; the scheduler pins
+    # the model while generating
+    del loaded
+
+    # Queue all micro-batches at once so the scheduler never idles between them
+    futures = []
+    for batch in plan:
+        indices = [pending[i] for i in batch]
+        payload = _PromptBatch(
+            [prompts[i] for i in indices],
+            [CallMetrics(model, kind="batch") for _ in indices]
+        )
+        future = batch_scheduler.submit(
+            payload, group_key=(model, config), batchable=False
+        )
+        futures.append((indices, future))
+    for indices, future in futures:
+        finish(indices, future.result())
+    return responses
+
+
+def stream_deepseek_inference(
+    prompt: str,
+    config: GenerationConfig = None,
+    model: str = None,
+    cancel_token: CancellationToken = None,
+    deadline: float = None,
+    **overrides
+):
+    """Generate a response and yield the decoded text as tokens arrive.
+
+    Generation runs on the batch scheduler's worker thread while the caller
+    consumes the text, so the first chunk is available right after prefill.
+    Streaming requests are never batched with others. Deterministic requests
+    share the response cache with `run_deepseek_inference`; a cache hit is
+    yielded as a single chunk. Cancellation and the deadline end the stream
+    early, as in `run_deepseek_inference`.
+
+    Args:
+        prompt (str): The input text prompt to generate a response for
+        config (GenerationConfig): Generation parameters, defaults if None
+        model (str): Name or path of the model, the default model if None
+        cancel_token (CancellationToken): Stops generation when cancelled
+        deadline (float): Wall-clock time (`time.time`) at which generation
+            stops
+        **overrides: Individual `GenerationConfig` fields to change
+
+    Yields:
+        str: Chunks of newly generated text, without the prompt
+    """
+    config = GenerationConfig.from_options(config, **overrides)
+    model = model or default_model_name
+
+    cache_key, cached = _cached_response(prompt, model, config)
+    if cached is not None:
+        yield cached
+        return
+
+    delegate = remote_backend or get_worker_pool()
+    if delegate is not None:
+        # The server or worker already applies the stop strings. Workers
+        # enforce the deadline and cancellation themselves; the remote
+        # stream is abandoned once interrupted.
+        extra = {}
+        if delegate is not remote_backend:
+            extra["cancel_token"] = cancel_token
+            if deadline is not None:
+                extra["deadline"] = deadline
+        text = ""
+        chunks = delegate.stream(prompt, config, model, **extra)
+        for chunk in chunks:
+            text += chunk
+            yield chunk
+            if _interruption(cancel_token, deadline) is not None:
+                chunks.close()
+                return
+        # A cancelled worker ends the stream early without raising
+        if cache_key is not None and _interruption(cancel_token, deadline) is None:
+            response_cache.put(cache_key, text)
+        return
+
+    # Only the tokenizer is kept; the scheduler pins the model while
+    # generating
+    tokenizer = model_registry.acquire(model)[0]
+
+    # The streamer decodes tokens incrementally and hands out text on word
+    # boundaries; the prompt itself is not echoed back
+    streamer = TextIteratorStreamer(
+        tokenizer, skip_prompt=True, skip_special_tokens=True
+    )
+    future = batch_scheduler.submit(
+        _InferenceRequest(
+            prompt, streamer=streamer, call=CallMetrics(model, kind="stream"),
+            cancel_token=cancel_token, deadline=deadline
+        ),
+        group_key=(model, config),
+        batchable=False
+    )
+    # A request dropped from the queue never ends the streamer itself
+    future.add_done_callback(lambda f: f.cancelled() and streamer.end())
+    _watch_interruption(future, cancel_token, deadline)
+
+    # Hold back enough characters to never emit the start of a stop string
+    holdback = max((len(s) for s in config.stop_strings), default=1) - 1
+    text = ""
+    emitted = 0
+    stopped = False
+    for chunk in streamer:
+        if stopped:
+            # Drain the rest so the generation thread never blocks
+            continue
+        text += chunk
+        text, stopped = apply_stop_strings(text, config.stop_strings)
+        safe = len(text) if stopped else max(emitted, len(text) - holdback)
+        if safe > emitted:
+            yield text[emitted:safe]
+            emitted = safe
+
+    # Surface generation errors to the consumer
+    try:
+        result = future.result()
+    except CancelledError:
+        return
+    if emitted < len(text):
+        yield text[emitted:]
+
+    if cache_key is not None and result.complete:
+        response_cache.put(cache_key, text)
+
+
+async def astream_deepseek_inference(
+    prompt: str,
+    config: GenerationConfig = None,
+    model: str = None,
+    cancel_token: CancellationToken = None,
+    deadline: float = None,
+    **overrides
+):
+    """Asynchronous variant of `stream_deepseek_inference`.
+
+    With worker processes the chunks come from the pool's async client;
+    otherwise the stream is consumed on a background thread. Either way the
+    event loop is never blocked, and leaving the loop early stops the
+    generation.
+
+    Args:
+        prompt (str): The input text prompt to generate a response for
+        config (GenerationConfig): Generation parameters, defaults if None
+        model (str): Name or path of the model, the default model if None
+        cancel_token (CancellationToken): Stops generation when cancelled
+        deadline (float): Wall-clock time (`time.time`) at which generation
+            stops
+        **overrides: Individual `GenerationConfig` fields to change
+
+    Yields:
+        str: Chunks of newly generated text, without the prompt
+    """
+    config = GenerationConfig.from_options(config, **overrides)
+    model = model or default_model_name
+
+    pool = get_worker_pool() if remote_backend is None else None
+    if pool is not None:
+        cache_key, cached = _cached_response(prompt, model, config)
+        if cached is not None:
+            yield cached
+            return
+        extra = {"deadline": deadline} if deadline is not None else {}
+        text = ""
+        async for chunk in pool.astream(
+            prompt, config, model, cancel_token=cancel_token, **extra
+        ):
+            text += chunk
+            yield chunk
+        if cache_key is not None and _interruption(cancel_token, deadline) is None:
+            response_cache.put(cache_key, text)
+        return
+
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    stop = cancel_token.child() if cancel_token else CancellationToken()
+
+    def push(kind, value=None):
+        try:
+            loop.call_soon_threadsafe(items.put_nowait, (kind, value))
+        except RuntimeError:
+            # The event loop is closed; nobody is listening any more
+            pass
+
+    def produce():
+        try:
+            for chunk in stream_deepseek_inference(
+                prompt, config, model, cancel_token=stop, deadline=deadline
+            ):
+                push("chunk", chunk)
+        except Exception as exc:
+            push("error", exc)
+        else:
+            push("end")
+
+    threading.Thread(target=produce, name="deepseek-astream", daemon=True).start()
+    try:
+        while True:
+            kind, value = await items.get()
+            if kind == "end":
+                break
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.cancel()
+
+
+def run_chat_turn(
+    message: str,
+    session_id: str = None,
+    config: GenerationConfig = None,
+    model: str = None,
+    system_prompt: str = None,
+    **overrides
+):
+    """Send a user message to a chat session and return the reply.
+
+    Sessions keep their history and KV state between turns, so only the new
+    message is prefilled. Idle sessions expire after
+    DEEPSEEK_LLM_SESSION_TIMEOUT seconds and at most DEEPSEEK_LLM_MAX_SESSIONS
+    are kept; an expired or unknown handle silently starts a new session.
+
+    Args:
+        message (str): The user's message
+        session_id (str): Handle of an existing session, None to start one
+        config (GenerationConfig): Generation parameters, defaults if None
+        model (str): Name or path of the model, the default model if None
+        system_prompt (str): System message used when a session is started
+        **overrides: Individual `GenerationConfig` fields to change
+
+    Returns:
+        tuple: The assistant's reply and the session handle for the next turn
+    """
+    config = GenerationConfig.from_options(config, **overrides)
+    model = model or default_model_name
+    if worker_count and remote_backend is None:
+        return get_worker_pool().chat(
+            message, session_id, config=config, model=model,
+            system_prompt=system_prompt
+        )
+
+    session = chat_sessions.get_or_create(session_id, model, system_prompt)
+    if remote_backend is not None:
+        # The server is stateless; it receives the whole conversation
+        with session.lock:
+            messages = session.messages + [{"role": "user", "content": message}]
+            response = remote_backend.chat(messages, config, model)
+            session.messages = messages + [{"role": "assistant", "content": response}]
+        return response, session.session_id
+
+    with session.lock:
+        future = batch_scheduler.submit(
+            _ChatTurn(session, message, call=CallMetrics(model, kind="chat")),
+            group_key=(model, config),
+            batchable=False
+        )
+        response = future.result()
+    return response, session.session_id
+
+
+def end_chat_session(session_id: str) -> bool:
+    """Close a chat session and free its KV state."""
+    if worker_count and remote_backend is None:
+        return get_worker_pool().end_chat(session_id)
+    return chat_sessions.close(session_id)
@@ -0,0 +1,174 @@
+import dataclasses
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# Generation modes exposed on the ComfyUI node
+GENERATION_MODES = ("sampling", "greedy")
+
+# Which part of an over-long prompt is kept: the end, the beginning, or both
+# ends without the middle; "error" rejects the prompt instead
+TRUNCATION_POLICIES = ("tail", "head", "middle", "error")
+
+# KV cache layouts: grows with the sequence, keeps a fixed window of recent
+# tokens, or stores 4-bit keys and values. Not every layout can run with
+# every transformers release, see `deepseek_utils.available_kv_cache_modes`
+KV_CACHE_MODES = ("dynamic", "sliding", "quantized")
+
+
+@dataclass(frozen=True)
+class GenerationConfig:
+    """Validated, hashable set of generation parameters.
+
+    Instances are immutable so they can be shared between threads, used as a
+    batching group key and hashed into response cache keys.
+
+    Attributes:
+        max_new_tokens (int): Budget of generated tokens, excluding the prompt
+        do_sample (bool): Sample tokens instead of decoding greedily
+        temperature (float): Sampling temperature, ignored when greedy
+        top_p (float): Nucleus sampling probability mass, ignored when greedy
+        repetition_penalty (float): Penalty for repeated tokens, 1.0 disables it
+        seed (int): Sampling seed, None for an unseeded generator
+        stop_strings (tuple[str]): Generation stops once any of them appears
+        speculative (bool): Let a small draft model propose tokens that the
+            model verifies (assisted generation); greedy outputs are unchanged
+        truncation (str): How over-long prompts are shortened, one of
+            `TRUNCATION_POLICIES`
+        max_prompt_tokens (int): Prompt token budget, None for the model's
+            context length minus ``max_new_tokens``
+        kv_cache (str): KV cache layout, one of `KV_CACHE_MODES`
+        kv_window (int): Tokens kept by the sliding-window cache
+    """
+
+    max_new_tokens: int = 512
+    do_sample: bool = True
+    temperature: float = 0.7
+    top_p: float = 1.0
+    repetition_penalty: float = 1.0
+    seed: Optional[int] = None
+    stop_strings: Tuple[str, ...] = ()
+    speculative: bool = False
+    truncation: str = "tail"
+    max_prompt_tokens: Optional[int] = None
+    kv_cache: str = "dynamic"
+    kv_window: int = 1024
+
+    def __post_init__(self):
+        # Accept any iterable of stop strings but store a hashable tuple
+        stop_strings = self.stop_strings
+        if isinstance(stop_strings, str):
+            stop_strings = (stop_strings,)
+        object.__setattr__(
+            self, "stop_strings", tuple(s for s in stop_strings if s)
+        )
+
+        # The seed is meaningless for greedy decoding; dropping it keeps
+        # equivalent configs equal
+        if not self.do_sample:
+            object.__setattr__(self, "seed", None)
+
+        if not isinstance(self.max_new_tokens, int) or self.max_new_tokens < 1:
+            raise ValueError("max_new_tokens must be a positive integer")
+        if self.temperature <= 0:
+            raise ValueError("temperature must be greater than 0")
+        if not 0 < self.top_p <= 1:
+            raise ValueError("top_p must be in (0, 1]")
+        if self.repetition_penalty <= 0:
+            raise ValueError("repetition_penalty must be greater than 0")
+        if self.seed is not None and (not isinstance(self.seed, int) or self.seed < 0):
+            raise ValueError("seed must be a non-negative integer or None")
+        if self.truncation not in TRUNCATION_POLICIES:
+            raise ValueError(f"truncation must be one of {TRUNCATION_POLICIES}")
+        if self.max_prompt_tokens is not None and (
+            not isinstance(self.max_prompt_tokens, int) or self.max_prompt_tokens < 1
+        ):
+            raise ValueError("max_prompt_tokens must be a positive integer or None")
+        if self.kv_cache not in KV_CACHE_MODES:
+            raise ValueError(f"kv_cache must be one of {KV_CACHE_MODES}")
+        if not isinstance(self.kv_window, int) or self.kv_window < 8:
+            raise ValueError("kv_window must be an integer of at least 8")
+
+    @property
+    def deterministic(self) -> bool:
+        """Whether the same prompt always produces the same response."""
+        return not self.do_sample or self.seed is not None
+
+    def replace(self, **changes) -> "GenerationConfig":
+        """Return a copy with some parameters changed (and re-validated)."""
+        return dataclasses.replace(self, **changes)
+
+    def to_generate_kwargs(self) -> dict:
+        """Keyword arguments for `model.generate`, except the draft model."""
+        kwargs = {
+            "max_new_tokens": self.max_new_tokens,
+            "do_sample": self.do_sample,
+            "repetition_penalty": self.repetition_penalty,
+        }
+        if self.do_sample:
+            kwargs["temperature"] = self.temperature
+            kwargs["top_p"] = self.top_p
+        if self.kv_cache == "quantized":
+            # Needs the optimum-quanto package
+            kwargs["cache_implementation"] = "quantized"
+            kwargs["cache_config"] = {"backend": "quanto", "nbits": 4}
+        return kwargs
+
+    def cache_params(self) -> dict:
+        """Parameters that influence the output, excluding the seed."""
+        params = dataclasses.asdict(self)
+        params.pop("seed")
+        params["stop_strings"] = list(self.stop_strings)
+        if not self.do_sample:
+            params.pop("temperature")
+            params.pop("top_p")
+            # Speculation never changes greedy outputs
+            params.pop("speculative")
+        if self.kv_cache != "sliding":
+            params.pop("kv_window")
+        return params
+
+    @classmethod
+    def from_options(cls, config: "GenerationConfig" = None, **overrides):
+        """Build a config from an optional base config and keyword overrides.
+
+        Args:
+            config (GenerationConfig): Base config, defaults are used if None
+            **overrides: Individual parameters to change
+
+        Returns:
+            GenerationConfig: The validated config
+        """
+        base = config if config is not None else cls()
+        return base.replace(**overrides) if overrides else base
+
+    @staticmethod
+    def parse_stop_strings(text: str) -> Tuple[str, ...]:
+        """Parse one stop string per line, as entered on the node.
+
+        The escapes ``\\n`` and ``\\t`` are expanded so stop sequences can
+        contain line breaks.
+        """
+        if not text:
+            return ()
+        return tuple(
+            line.replace("\\n", "\n").replace("\\t", "\t")
+            for line in text.splitlines()
+            if line
+        )
+
+
+def apply_stop_strings(text: str, stop_strings) -> Tuple[str, bool]:
+    """Cut the text at the earliest stop string.
+
+    Args:
+        text (str): Generated text
+        stop_strings (tuple[str]): Stop sequences to look for
+
+    Returns:
+        tuple: The text before the first stop string and whether one was found
+    """
+    positions = [text.find(s) for s in stop_strings]
+    positions = [p for p in positions if p >= 0]
+    if not positions:
+        return text, False
+    return text[:min(positions)], True
@@ -0,0 +1,307 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Phases of an inference call, in the order they happen
+PHASES = ("queue", "tokenize", "prefill", "decode")
+
+# Upper bounds (seconds) of the duration histogram buckets
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0, 120.0
+)
+
+
+class CallMetrics:
+    """Measurements of a single inference call.
+
+    ``phases`` maps a phase name (see `PHASES`) to its duration in seconds.
+    Prompts generated in one batch share the tokenize, prefill and decode
+    timings of that batch.
+    """
+
+    def __init__(self, model: str, kind: str = "generate"):
+        self.model = model
+        self.kind = kind
+        self.timestamp = time.time()
+        self.phases = {}
+        self.batch_size = 1
+        self.prompt_tokens = 0
+        self.generated_tokens = 0
+        self.peak_memory_bytes = None
+        self.error = None
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.phases.values())
+
+    @property
+    def tokens_per_sec(self) -> float:
+        """Generated tokens per second of prefill plus decode time."""
+        seconds = self.phases.get("prefill", 0.0) + self.phases.get("decode", 0.0)
+        return self.generated_tokens / seconds if seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "timestamp": self.timestamp,
+            "model": self.model,
+            "kind": self.kind,
+            "phases": dict(self.phases),
+            "total_seconds": self.total_seconds,
+            "batch_size": self.batch_size,
+            "prompt_tokens": self.prompt_tokens,
+            "generated_tokens": self.generated_tokens,
+            "tokens_per_sec": self.tokens_per_sec,
+            "peak_memory_bytes": self.peak_memory_bytes,
+            "error": self.error,
+        }
+
+
+class MetricsHook:
+    """Base class of hooks notified by a `MetricsRegistry`.
+
+    Override either method; both run on the thread doing the generation, so
+    they should return quickly.
+    """
+
+    def on_phase(self, call: CallMetrics, phase: str, seconds: float):
+        """Called when a phase of ``call`` has finished."""
+
+    def on_call(self, call: CallMetrics):
+        """Called once a call has finished, successfully or not."""
+
+
+class _Histogram:
+    """Cumulative histogram in the Prometheus sense."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """In-process store of per-phase timings, token counts and memory peaks.
+
+    Instrumented code wraps each phase in `phase` (or reports a measured
+    duration with `record_phase`) and hands the finished call to
+    `record_call`. Registered hooks see every phase and call as it happens,
+    which is how the file exporters are attached.
+    """
+
+    def __init__(self, enabled: bool = True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._hooks = []
+        self._lock = threading.Lock()
+        self.reset()
+
+    def add_hook(self, hook: MetricsHook):
+        """Attach a hook; it is notified of every later phase and call."""
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook: MetricsHook):
+        with self._lock:
+            if hook in self._hooks:
+                self._hooks.remove(hook)
+
+    @contextmanager
+    def phase(self, name: str, calls):
+        """Time a phase shared by one or more calls.
+
+        Args:
+            name (str): Phase name, see `PHASES`
+            calls (list[CallMetrics]): The calls the phase belongs to
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, calls, time.perf_counter() - start)
+
+    def record_phase(self, name: str, calls, seconds: float):
+        """Add an already measured phase duration to one or more calls."""
+        if not self.enabled:
+            return
+        with self._lock:
+            hooks = list(self._hooks)
+        for call in calls:
+            call.phases[name] = call.phases.get(name, 0.0) + seconds
+            for hook in hooks:
+                hook.on_phase(call, name, seconds)
+
+    def record_call(self, call: CallMetrics):
+        """Aggregate a finished call and notify the hooks."""
+        if not self.enabled:
+            return
+        with self._lock:
+            key = (call.model, call.kind)
+            counters = self._counters.setdefault(key, {
+                "calls": 0, "errors": 0, "prompt_tokens": 0, "generated_tokens": 0
+            })
+            counters["calls"] += 1
+            counters["errors"] += call.error is not None
+            counters["prompt_tokens"] += call.prompt_tokens
+            counters["generated_tokens"] += call.generated_tokens
+
+            for name, seconds in call.phases.items():
+                self._histogram((call.model, name)).observe(seconds)
+            self._histogram((call.model, "total")).observe(call.total_seconds)
+            if call.generated_tokens:
+                self._throughput.setdefault(
+                    call.model, _Histogram(())
+                ).observe(call.tokens_per_sec)
+            if call.peak_memory_bytes is not None:
+                self._peak_memory[call.model] = max(
+                    self._peak_memory.get(call.model, 0), call.peak_memory_bytes
+                )
+            hooks = list(self._hooks)
+
+        for hook in hooks:
+            hook.on_call(call)
+
+    def snapshot(self) -> dict:
+        """Aggregated metrics per model as a JSON-serializable dict."""
+        with self._lock:
+            models = {}
+            for (model, kind), counters in self._counters.items():
+                entry = models.setdefault(model, {"calls": {}, "phases": {}})
+                entry["calls"][kind] = dict(counters)
+            for (model, name), histogram in self._durations.items():
+                entry = models.setdefault(model, {"calls": {}, "phases": {}})
+                entry["phases"][name] = histogram.snapshot()
+            for model, histogram in self._throughput.items():
+                models[model]["tokens_per_sec"] = histogram.snapshot()
+            for model, peak in self._peak_memory.items():
+                models[model]["peak_memory_bytes"] = peak
+            return models
+
+    def to_prometheus(self, prefix: str = "deepseek_llm") -> str:
+        """Render the aggregated metrics in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            for field in ("calls", "errors", "prompt_tokens", "generated_tokens"):
+                lines.append(f"# TYPE {prefix}_{field}_total counter")
+                for (model, kind), counters in sorted(self._counters.items()):
+                    labels = _labels(model=model, kind=kind)
+                    value = counters[field]
+                    lines.append(f"{prefix}_{field}_total{{{labels}}} {value}")
+
+            lines.append(f"# TYPE {prefix}_phase_seconds histogram")
+            for (model, name), histogram in sorted(self._durations.items()):
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    labels = _labels(model=model, phase=name, le=repr(bound))
+                    lines.append(f"{prefix}_phase_seconds_bucket{{{labels}}} {count}")
+                labels = _labels(model=model, phase=name, le="+Inf")
+                lines.append(
+                    f"{prefix}_phase_seconds_bucket{{{labels}}} {histogram.count}"
+                )
+                labels = _labels(model=model, phase=name)
+                lines.append(f"{prefix}_phase_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(
+                    f"{prefix}_phase_seconds_count{{{labels}}} {histogram.count}"
+                )
+
+            lines.append(f"# TYPE {prefix}_tokens_per_second gauge")
+            for model, histogram in sorted(self._throughput.items()):
+                average = histogram.sum / histogram.count
+                lines.append(
+                    f"{prefix}_tokens_per_second{{{_labels(model=model)}}} {average}"
+                )
+
+            lines.append(f"# TYPE {prefix}_peak_memory_bytes gauge")
+            for model, peak in sorted(self._peak_memory.items()):
+                labels = _labels(model=model)
+                lines.append(f"{prefix}_peak_memory_bytes{{{labels}}} {peak}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Drop all aggregated metrics; hooks stay attached."""
+        with self._lock:
+            self._counters = {}
+            self._durations = {}
+            self._throughput = {}
+            self._peak_memory = {}
+
+    def _histogram(self, key) -> _Histogram:
+        histogram = self._durations.get(key)
+        if histogram is None:
+            histogram = self._durations[key] = _Histogram(self.buckets)
+        return histogram
+
+
+def _labels(**labels) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{key}="{escape(value)}"' for key, value in labels.items())
+
+
+class PrometheusFileExporter(MetricsHook):
+    """Rewrites a Prometheus text file after calls, e.g. for the node
+    exporter's textfile collector.
+
+    The file is replaced atomically and at most every ``min_interval``
+    seconds.
+    """
+
+    def __init__(self, registry: MetricsRegistry, path: str, min_interval: float = 1.0):
+        self.registry = registry
+        self.path = path
+        self.min_interval = min_interval
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def on_call(self, call: CallMetrics):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_write < self.min_interval:
+                return
+            self._last_write = now
+        self.write()
+
+    def write(self):
+        """Write the current metrics regardless of the interval."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.registry.to_prometheus())
+        os.replace(tmp_path, self.path)
+
+
+class JsonLinesExporter(MetricsHook):
+    """Appends one JSON object per finished call to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def on_call(self, call: CallMetrics):
+        line = json.dumps(call.to_dict())
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
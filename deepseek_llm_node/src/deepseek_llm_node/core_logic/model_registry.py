@@ -0,0 +1,183 @@
+import gc
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class ModelRegistry:
+    """Loads models by name on demand and keeps them within a memory budget.
+
+    Each model is owned by a manager created through ``manager_factory(name)``.
+    Managers must provide ``load()``, ``unload()``, ``is_loaded`` and
+    ``memory_footprint()`` (resident bytes of the loaded model). ``load()``
+    runs without the registry lock held, so loading one model never blocks
+    callers of the others; managers serialize concurrent loads themselves.
+
+    The registry tracks the resident memory of every loaded model. When
+    loading a model would exceed ``memory_budget_bytes``, the least recently
+    used models are unloaded first. The size of a model is only known once it
+    has been loaded, so a first load can temporarily overshoot the budget; the
+    other models are then evicted right after.
+
+    Models in use are pinned (see `use`) and never evicted to make room, so
+    their weights are not kept alive next to a newly loaded model; pinned
+    models may push the usage over the budget instead.
+
+    ``on_evict(name)`` is called after a model has been unloaded, so state
+    derived from it (caches etc.) can be dropped as well.
+    """
+
+    def __init__(
+        self, manager_factory, memory_budget_bytes: int = None, on_evict=None
+    ):
+        self._manager_factory = manager_factory
+        self.memory_budget_bytes = memory_budget_bytes
+        self._on_evict = on_evict
+        self._managers = {}
+        # Loaded models in LRU order: name -> resident bytes
+        self._resident = OrderedDict()
+        # Sizes measured on earlier loads, used to make room before reloading
+        self._known_sizes = {}
+        # Models in use: name -> number of pins
+        self._pins = {}
+        self._lock = threading.RLock()
+        self._stats = {"loads": 0, "evictions": 0, "hits": 0}
+
+    def manager(self, name: str):
+        """Return the manager of a model, creating it (unloaded) if needed."""
+        with self._lock:
+            manager = self._managers.get(name)
+            if manager is None:
+                manager = self._manager_factory(name)
+                self._managers[name] = manager
+            return manager
+
+    def acquire(self, name: str, pin: bool = False):
+        """Load a model if needed, mark it most recently used and return it.
+
+        Args:
+            name (str): Model name or path
+            pin (bool): Keep the model from being evicted until `release`
+                is called
+
+        Returns:
+            tuple: The ``(tokenizer, model)`` pair of the manager
+        """
+        manager = self.manager(name)
+        with self._lock:
+            if pin:
+                self._pins[name] = self._pins.get(name, 0) + 1
+            if name in self._resident and manager.is_loaded:
+                self._resident.move_to_end(name)
+                self._stats["hits"] += 1
+                return manager.load()
+
+            # Make room for the model if we know how big it is
+            self._evict_until_fits(self._known_sizes.get(name, 0), keep=name)
+
+        try:
+            loaded = manager.load()
+        except BaseException:
+            if pin:
+                self.release(name)
+            raise
+
+        with self._lock:
+            if name not in self._resident:
+                # Not yet recorded by a concurrent load of the same model
+                size = manager.memory_footprint()
+                self._known_sizes[name] = size
+                self._resident[name] = size
+                self._stats["loads"] += 1
+            self._resident.move_to_end(name)
+
+            # The measured size may be larger than expected
+            self._evict_until_fits(0, keep=name)
+            return loaded
+
+    def release(self, name: str):
+        """Undo one ``acquire(name, pin=True)``."""
+        with self._lock:
+            count = self._pins.get(name, 0) - 1
+            if count > 0:
+                self._pins[name] = count
+            else:
+                self._pins.pop(name, None)
+
+    @contextmanager
+    def use(self, *names: str):
+        """Acquire and pin models for the duration of a ``with`` block.
+
+        Args:
+            *names (str): Model names or paths
+
+        Yields:
+            tuple: The ``(tokenizer, model)`` pair of the first model
+        """
+        pinned = []
+        try:
+            for name in names:
+                pinned.append((name, self.acquire(name, pin=True)))
+            yield pinned[0][1]
+        finally:
+            for name, _ in pinned:
+                self.release(name)
+
+    def preload(self, name: str, background: bool = False):
+        """Acquire a model ahead of its first use.
+
+        Args:
+            name (str): Model name or path
+            background (bool): Load on a daemon thread instead of blocking
+
+        Returns:
+            threading.Thread | None: The loading thread when ``background``
+            is set
+        """
+        if not background:
+            self.acquire(name)
+            return None
+        thread = threading.Thread(
+            target=self.acquire, args=(name,), name=f"deepseek-preload-{name}",
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def evict(self, name: str) -> bool:
+        """Unload a model. Returns whether it was loaded."""
+        with self._lock:
+            if name not in self._resident:
+                return False
+            self._resident.pop(name)
+            self._managers[name].unload()
+            self._stats["evictions"] += 1
+            if self._on_evict is not None:
+                self._on_evict(name)
+        # Make sure the weights are actually released before loading others
+        gc.collect()
+        return True
+
+    def resident(self) -> dict:
+        """Loaded models and their resident bytes, least recently used first."""
+        with self._lock:
+            return dict(self._resident)
+
+    def stats(self) -> dict:
+        """Load/hit/eviction counters and the current memory usage."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["resident_bytes"] = sum(self._resident.values())
+            stats["memory_budget_bytes"] = self.memory_budget_bytes
+            stats["resident_models"] = list(self._resident)
+            stats["pinned_models"] = sorted(self._pins)
+            return stats
+
+    def _evict_until_fits(self, needed: int, keep: str):
+        if self.memory_budget_bytes is None:
+            return
+        for name in list(self._resident):
+            if sum(self._resident.values()) + needed <= self.memory_budget_bytes:
+                return
+            if name != keep and not self._pins.get(name):
+                self.evict(name)
@@ -0,0 +1,144 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class PrefixCache:
+    """Keeps the KV state of frequently used prompt prefixes.
+
+    A prefix becomes cacheable either because it was registered explicitly
+    (e.g. a fixed system prompt) or because the same block-aligned prefix has
+    been seen ``promote_after`` times. Entries are keyed by model and token
+    ids and evicted least-recently-used first once ``max_entries`` or
+    ``max_bytes`` is exceeded.
+
+    The cache does not interpret the stored state; callers pass its size in
+    bytes along with it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 16,
+        max_bytes: int = 1024 * 1024 * 1024,
+        block_size: int = 64,
+        promote_after: int = 2,
+        max_tracked: int = 4096
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.promote_after = promote_after
+        self.max_tracked = max_tracked
+        self._lock = threading.Lock()
+        # (model, prefix ids) -> (state, bytes), in LRU order
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Explicitly registered prefixes per model
+        self._registered = {}
+        # Sightings of block-aligned prefixes: (model, digest) -> count
+        self._seen = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def register(self, model: str, prefix_ids):
+        """Mark a token prefix as worth caching the next time it is used."""
+        with self._lock:
+            self._registered.setdefault(model, set()).add(tuple(prefix_ids))
+
+    def lookup(self, model: str, token_ids):
+        """Find the longest cached prefix of ``token_ids``.
+
+        At least one token is always left uncached, since generation needs
+        an input to start from.
+
+        Returns:
+            tuple: ``(prefix length, state)``, or ``(0, None)`` on a miss
+        """
+        token_ids = tuple(token_ids)
+        with self._lock:
+            best = None
+            for key in self._entries:
+                entry_model, prefix = key
+                if entry_model != model or len(prefix) >= len(token_ids):
+                    continue
+                if best is not None and len(prefix) <= len(best[1]):
+                    continue
+                if token_ids[:len(prefix)] == prefix:
+                    best = key
+            if best is None:
+                self._stats["misses"] += 1
+                return 0, None
+            self._entries.move_to_end(best)
+            self._stats["hits"] += 1
+            return len(best[1]), self._entries[best][0]
+
+    def observe(self, model: str, token_ids) -> int:
+        """Record a prompt and decide whether one of its prefixes should be
+        cached now.
+
+        Returns:
+            int: Length of the prefix to cache, 0 for none
+        """
+        token_ids = tuple(token_ids)
+        with self._lock:
+            # Registered prefixes take precedence, longest first
+            registered = self._registered.get(model, ())
+            for prefix in sorted(registered, key=len, reverse=True):
+                if len(prefix) >= len(token_ids):
+                    continue
+                if token_ids[:len(prefix)] == prefix:
+                    if (model, prefix) not in self._entries:
+                        return len(prefix)
+                    break
+
+            # Count block-aligned prefixes with a rolling digest, so each
+            # prompt is only hashed once
+            promote = 0
+            digest = hashlib.sha1(model.encode("utf-8"))
+            for end in range(self.block_size, len(token_ids), self.block_size):
+                block = token_ids[end - self.block_size:end]
+                digest.update(",".join(map(str, block)).encode("ascii"))
+                key = (model, digest.hexdigest())
+                count = self._seen.pop(key, 0) + 1
+                self._seen[key] = count
+                if count >= self.promote_after:
+                    promote = end
+            while len(self._seen) > self.max_tracked:
+                self._seen.popitem(last=False)
+
+            if promote and (model, token_ids[:promote]) not in self._entries:
+                return promote
+            return 0
+
+    def put(self, model: str, prefix_ids, state, nbytes: int):
+        """Store the state of a prefix, evicting old entries as needed."""
+        if nbytes > self.max_bytes:
+            return
+        key = (model, tuple(prefix_ids))
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (state, nbytes)
+            self._bytes += nbytes
+            self._stats["stores"] += 1
+            while (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, (_, old_bytes) = self._entries.popitem(last=False)
+                self._bytes -= old_bytes
+                self._stats["evictions"] += 1
+
+    def clear(self, model: str = None):
+        """Drop the cached states, of one model or all of them."""
+        with self._lock:
+            for key in list(self._entries):
+                if model is None or key[0] == model:
+                    self._bytes -= self._entries.pop(key)[1]
+
+    def stats(self) -> dict:
+        """Hit/miss counters and the memory held by cached states."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            return stats
@@ -0,0 +1,123 @@
+import sys
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    """Low-overhead statistical profiler for the generation hot path.
+
+    A daemon thread periodically captures the Python stacks of the profiled
+    threads and counts identical stacks. Nothing is traced in between, so the
+    overhead stays small enough to leave it running in production while
+    investigating a slowdown.
+
+    Only threads whose name starts with one of ``thread_prefixes`` are
+    sampled (all other threads if empty). The result can be printed with
+    `report` or written in the collapsed-stack format understood by
+    flamegraph tools with `write_collapsed`.
+    """
+
+    def __init__(self, interval_ms: float = 5.0, thread_prefixes=()):
+        if interval_ms <= 0:
+            raise ValueError("interval_ms must be positive")
+        self.interval = interval_ms / 1000.0
+        self.thread_prefixes = tuple(thread_prefixes)
+        self._stacks = Counter()
+        self._samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        """Start sampling; does nothing if already running."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="deepseek-profiler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop sampling; the collected samples are kept."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def clear(self):
+        with self._lock:
+            self._stacks.clear()
+            self._samples = 0
+
+    def report(self, top: int = 20) -> list:
+        """Functions that were executing in the most samples.
+
+        Returns:
+            list: ``(function, self samples, total samples)`` tuples sorted by
+            self samples, where "self" counts samples in which the function
+            was the innermost frame
+        """
+        own = Counter()
+        total = Counter()
+        with self._lock:
+            stacks = list(self._stacks.items())
+        for stack, count in stacks:
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+        return [(frame, count, total[frame]) for frame, count in own.most_common(top)]
+
+    def write_collapsed(self, path: str):
+        """Write the samples as ``frame;frame;frame count`` lines."""
+        with self._lock:
+            stacks = sorted(self._stacks.items())
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks:
+                f.write(f"{';'.join(stack)} {count}\n")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "samples": self._samples,
+                "unique_stacks": len(self._stacks),
+            }
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            sampled = []
+            for thread_id, frame in frames.items():
+                name = names.get(thread_id, "")
+                if thread_id == own_id or not self._wanted(name):
+                    continue
+                sampled.append(_stack(frame))
+            with self._lock:
+                self._samples += 1
+                self._stacks.update(sampled)
+
+    def _wanted(self, thread_name: str) -> bool:
+        if not self.thread_prefixes:
+            return True
+        return thread_name.startswith(self.thread_prefixes)
+
+
+def _stack(frame) -> tuple:
+    # Outermost frame first, as in the collapsed-stack format
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
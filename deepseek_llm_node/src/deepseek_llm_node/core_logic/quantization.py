@@ -0,0 +1,315 @@
+import itertools
+import json
+import os
+
+import torch
+from safetensors.torch import load_file, save_file
+from torch import nn
+import torch.nn.functional as F
+
+# Precision modes understood by the model manager:
+# - fp16: float16 weights with automatic device mapping (GPU hosts)
+# - bf16: bfloat16 weights on the CPU
+# - int8-dynamic: dynamically quantized int8 linear layers (CPU)
+# - int8-weight / int4-weight: weight-only quantized linear layers that are
+#   dequantized on the fly, trading some speed for a much smaller footprint
+PRECISION_MODES = ("fp16", "bf16", "int8-dynamic", "int8-weight", "int4-weight")
+
+# Modes that are produced by quantizing a bf16 model
+QUANTIZED_MODES = ("int8-dynamic", "int8-weight", "int4-weight")
+
+# Modes whose weights can be persisted as plain tensors; int8-dynamic layers
+# keep packed parameters that safetensors cannot store, and are quantized
+# again on every start
+PERSISTED_MODES = ("int8-weight", "int4-weight")
+
+# Bump when the artifact layout changes so stale artifacts are rebuilt
+ARTIFACT_FORMAT = 2
+
+
+class WeightOnlyInt8Linear(nn.Module):
+    """Linear layer storing int8 weights with one scale per output channel."""
+
+    def __init__(self, in_features: int, out_features: int, bias: bool, dtype):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.register_buffer(
+            "qweight", torch.zeros(out_features, in_features, dtype=torch.int8)
+        )
+        self.register_buffer("scale", torch.ones(out_features, dtype=dtype))
+        self.register_buffer(
+            "bias", torch.zeros(out_features, dtype=dtype) if bias else None
+        )
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear) -> "WeightOnlyInt8Linear":
+        weight = linear.weight.detach()
+        module = cls(
+            linear.in_features, linear.out_features, linear.bias is not None,
+            weight.dtype
+        )
+        # Symmetric per-channel quantization to [-127, 127]
+        scale = weight.abs().amax(dim=1).float().clamp(min=1e-8) / 127.0
+        qweight = torch.round(weight.float() / scale[:, None]).clamp(-127, 127)
+        module.qweight.copy_(qweight.to(torch.int8))
+        module.scale.copy_(scale.to(weight.dtype))
+        if linear.bias is not None:
+            module.bias.copy_(linear.bias.detach())
+        return module
+
+    def forward(self, x):
+        weight = self.qweight.to(x.dtype) * self.scale.to(x.dtype)[:, None]
+        return F.linear(x, weight, self.bias)
+
+
+class WeightOnlyInt4Linear(nn.Module):
+    """Linear layer storing packed int4 weights with per-group scales.
+
+    Two 4-bit values are packed into every byte; each group of
+    ``group_size`` input features shares one scale.
+    """
+
+    def __init__(
+        self, in_features: int, out_features: int, bias: bool, dtype,
+        group_size: int = 128
+    ):
+        super().__init__()
+        if in_features % group_size or group_size % 2:
+            raise ValueError(
+                "in_features must be a multiple of an even group_size"
+            )
+        self.in_features = in_features
+        self.out_features = out_features
+        self.group_size = group_size
+        self.register_buffer(
+            "qweight",
+            torch.zeros(out_features, in_features // 2, dtype=torch.uint8)
+        )
+        self.register_buffer(
+            "scale",
+            torch.ones(out_features, in_features // group_size, dtype=dtype)
+        )
+        self.register_buffer(
+            "bias", torch.zeros(out_features, dtype=dtype) if bias else None
+        )
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, group_size: int = 128):
+        weight = linear.weight.detach()
+        module = cls(
+            linear.in_features, linear.out_features, linear.bias is not None,
+            weight.dtype, group_size
+        )
+        # Symmetric per-group quantization to [-7, 7], stored with an offset
+        # of 8 so each value fits in an unsigned nibble
+        grouped = weight.float().reshape(linear.out_features, -1, group_size)
+        scale = grouped.abs().amax(dim=2).clamp(min=1e-8) / 7.0
+        q = torch.round(grouped / scale[:, :, None]).clamp(-7, 7) + 8
+        q = q.reshape(linear.out_features, linear.in_features).to(torch.uint8)
+        module.qweight.copy_(q[:, 0::2] | (q[:, 1::2] << 4))
+        module.scale.copy_(scale.to(weight.dtype))
+        if linear.bias is not None:
+            module.bias.copy_(linear.bias.detach())
+        return module
+
+    def forward(self, x):
+        low = (self.qweight & 0x0F).to(x.dtype) - 8
+        high = (self.qweight >> 4).to(x.dtype) - 8
+        weight = torch.stack((low, high), dim=2).reshape(
+            self.out_features, -1, self.group_size
+        )
+        weight = (weight * self.scale.to(x.dtype)[:, :, None]).reshape(
+            self.out_features, self.in_features
+        )
+        return F.linear(x, weight, self.bias)
+
+
+def _replace_linears(model: nn.Module, convert, skip_modules):
+    """Swap every nn.Linear (except the skipped ones) for `convert(linear)`."""
+    for name, module in list(model.named_modules()):
+        for child_name, child in list(module.named_children()):
+            full_name = f"{name}.{child_name}" if name else child_name
+            if not isinstance(child, nn.Linear):
+                continue
+            if child_name in skip_modules or full_name in skip_modules:
+                continue
+            setattr(module, child_name, convert(child))
+
+
+def quantize_model(model: nn.Module, precision: str, skip_modules=("lm_head",)):
+    """Quantize a (bf16) model in place for CPU inference.
+
+    Layers are converted one at a time, so peak memory stays close to the
+    size of the input model.
+
+    Args:
+        model (nn.Module): The model to quantize
+        precision (str): One of `QUANTIZED_MODES`
+        skip_modules (tuple[str]): Linear layers kept in full precision; the
+            output head is sensitive to quantization error
+
+    Returns:
+        nn.Module: The quantized model, in eval mode
+    """
+    if precision == "int8-dynamic":
+        # Dynamically quantized layers compute in float32, so the remaining
+        # (small) non-linear parameters are promoted to match
+        for module in model.modules():
+            if isinstance(module, nn.Linear):
+                continue
+            for param in module.parameters(recurse=False):
+                param.data = param.data.float()
+            for buffer_name, buffer in module.named_buffers(recurse=False):
+                if buffer is not None and buffer.is_floating_point():
+                    setattr(module, buffer_name, buffer.float())
+
+        def convert(linear):
+            linear = linear.float()
+            linear.qconfig = torch.ao.quantization.default_dynamic_qconfig
+            return torch.ao.nn.quantized.dynamic.Linear.from_float(linear)
+
+        # The skipped layers still have to run in float32
+        for name, module in model.named_modules():
+            if not isinstance(module, nn.Linear):
+                continue
+            if name in skip_modules or name.split(".")[-1] in skip_modules:
+                module.float()
+    elif precision == "int8-weight":
+        convert = WeightOnlyInt8Linear.from_linear
+    elif precision == "int4-weight":
+        def convert(linear):
+            # Fall back to int8 for layers that don't split into groups
+            if linear.in_features % 128:
+                return WeightOnlyInt8Linear.from_linear(linear)
+            return WeightOnlyInt4Linear.from_linear(linear)
+    else:
+        raise ValueError(
+            f"Unknown quantized precision '{precision}', "
+            f"expected one of {QUANTIZED_MODES}"
+        )
+
+    with torch.no_grad():
+        _replace_linears(model, convert, skip_modules)
+    return model.eval()
+
+
+def artifact_dir(cache_dir: str, model_name: str, precision: str) -> str:
+    """Directory holding the persisted quantized weights of a model."""
+    safe_name = model_name.strip("/").replace("/", "--")
+    return os.path.join(cache_dir, "quantized", f"{safe_name}-{precision}")
+
+
+def _artifact_meta(model_name: str, precision: str) -> dict:
+    import transformers
+
+    return {
+        "format": ARTIFACT_FORMAT,
+        "model_name": model_name,
+        "precision": precision,
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+    }
+
+
+def _layer_layout(model: nn.Module) -> dict:
+    """Quantized layer of every converted module, by module name."""
+    layout = {}
+    for name, module in model.named_modules():
+        if isinstance(module, WeightOnlyInt4Linear):
+            layout[name] = {"type": "int4", "group_size": module.group_size}
+        elif isinstance(module, WeightOnlyInt8Linear):
+            layout[name] = {"type": "int8"}
+    return layout
+
+
+def _apply_layout(model: nn.Module, layout: dict):
+    """Replace the linear layers named in ``layout`` by empty quantized ones."""
+    for name, spec in layout.items():
+        parent_name, _, child_name = name.rpartition(".")
+        parent = model.get_submodule(parent_name)
+        linear = getattr(parent, child_name)
+        args = (
+            linear.in_features, linear.out_features, linear.bias is not None,
+            linear.weight.dtype
+        )
+        if spec["type"] == "int4":
+            layer = WeightOnlyInt4Linear(*args, group_size=spec["group_size"])
+        else:
+            layer = WeightOnlyInt8Linear(*args)
+        setattr(parent, child_name, layer)
+
+
+def _named_tensors(model: nn.Module) -> dict:
+    # Non-persistent buffers (e.g. rotary frequencies) are included, as the
+    # model is rebuilt from empty tensors; tied weights are stored once
+    return {
+        name: tensor.detach().contiguous()
+        for name, tensor in itertools.chain(
+            model.named_parameters(), model.named_buffers()
+        )
+    }
+
+
+def save_quantized_model(
+    model: nn.Module, path: str, model_name: str, precision: str
+):
+    """Persist a quantized model so later processes can skip quantization.
+
+    The tensors are stored as safetensors and the quantized layers are
+    described in ``meta.json``; nothing is pickled, so loading an artifact
+    never runs code from the cache directory.
+    """
+    if precision not in PERSISTED_MODES:
+        raise ValueError(f"{precision} models cannot be persisted")
+    os.makedirs(path, exist_ok=True)
+    tmp_path = os.path.join(path, "model.safetensors.tmp")
+    save_file(_named_tensors(model), tmp_path)
+    os.replace(tmp_path, os.path.join(path, "model.safetensors"))
+    meta = dict(_artifact_meta(model_name, precision), layout=_layer_layout(model))
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_quantized_model(path: str, model_name: str, precision: str, build_model):
+    """Load a persisted quantized model.
+
+    Args:
+        path (str): The artifact directory, see `artifact_dir`
+        model_name (str): Name of the model, which must match the artifact
+        precision (str): One of `PERSISTED_MODES`
+        build_model (callable): Returns the unquantized model architecture;
+            it is called on the meta device, so no weights are allocated
+
+    Returns:
+        nn.Module | None: The model, or None when there is no artifact or it
+        was written by another torch/transformers version
+    """
+    try:
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    layout = meta.pop("layout", None)
+    if meta != _artifact_meta(model_name, precision) or layout is None:
+        return None
+
+    try:
+        tensors = load_file(os.path.join(path, "model.safetensors"))
+    except (OSError, RuntimeError):
+        return None
+    with torch.device("meta"):
+        model = build_model()
+        _apply_layout(model, layout)
+    model.to_empty(device="cpu")
+    # `to_empty` unties shared weights such as the output head
+    if hasattr(model, "tie_weights"):
+        model.tie_weights()
+
+    expected = _named_tensors(model)
+    if set(expected) != set(tensors):
+        return None
+    with torch.no_grad():
+        for name, tensor in tensors.items():
+            expected[name].copy_(tensor)
+    return model.eval()
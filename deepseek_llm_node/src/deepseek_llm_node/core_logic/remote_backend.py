@@ -0,0 +1,317 @@
+import http.client
+import json
+import random
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+from .cancellation import GenerationResult
+from .generation_config import GenerationConfig, apply_stop_strings
+from .metrics import CallMetrics
+
+# Statuses worth retrying: rate limiting and transient server failures
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RemoteBackendError(RuntimeError):
+    """The inference server could not be reached or rejected a request."""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class _ConnectionPool:
+    """Keep-alive HTTP(S) connections to a single server."""
+
+    def __init__(self, base_url: str, max_idle: int, timeout: float):
+        url = urllib.parse.urlsplit(base_url)
+        if url.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported URL scheme: {base_url!r}")
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.base_path = url.path.rstrip("/")
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def acquire(self):
+        """Return ``(connection, reused)``, preferring an idle connection."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+            self.created += 1
+        cls = (
+            http.client.HTTPSConnection if self.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        return cls(self.host, self.port, timeout=self.timeout), False
+
+    def release(self, conn, reusable: bool = True):
+        with self._lock:
+            if reusable and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class OpenAICompatibleBackend:
+    """Generates text on a remote OpenAI-compatible server (vLLM, TGI, ...).
+
+    Requests reuse pooled keep-alive connections, at most
+    ``max_concurrency`` of them are in flight at once, and connection errors
+    as well as 429/5xx responses are retried with exponential backoff
+    (honouring ``Retry-After``). Streaming uses server-sent events.
+
+    Args:
+        base_url (str): Server URL including the API prefix, e.g.
+            ``http://localhost:8000/v1``
+        api_key (str): Sent as a bearer token when set
+        max_concurrency (int): Requests in flight at the same time
+        max_retries (int): Retries after the first attempt
+        backoff (float): Delay before the first retry in seconds, doubled
+            after every further attempt
+        timeout (float): Socket timeout in seconds
+        metrics (MetricsRegistry): Receives per-call measurements
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str = None,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 300.0,
+        metrics=None
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.metrics = metrics
+        self._pool = _ConnectionPool(base_url, max_concurrency, timeout)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "failed": 0}
+
+    def generate(
+        self, prompt: str, config: GenerationConfig, model: str
+    ) -> GenerationResult:
+        """Complete a prompt and return the generated text."""
+        # Unpacking runs the generator to its end, releasing the slot
+        result, = self._complete(prompt, config, model, stream=False)
+        return result
+
+    def stream(self, prompt: str, config: GenerationConfig, model: str):
+        """Complete a prompt and yield the text as the server produces it."""
+        yield from self._complete(prompt, config, model, stream=True)
+
+    def chat(self, messages, config: GenerationConfig, model: str) -> str:
+        """Answer a conversation given as a list of role/content messages."""
+        payload = self._payload(config, model)
+        payload["messages"] = messages
+        call = CallMetrics(model, kind="chat")
+        with self._slot(call):
+            started = time.perf_counter()
+            conn, response = self._post("/chat/completions", payload)
+            data = self._read_json(conn, response)
+            self._record(call, started, started, data.get("usage"))
+        text = data["choices"][0]["message"]["content"] or ""
+        return apply_stop_strings(text, config.stop_strings)[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["connections_created"] = self._pool.created
+        return stats
+
+    def close(self):
+        """Close the idle connections."""
+        self._pool.close()
+
+    def _complete(self, prompt: str, config: GenerationConfig, model: str, stream):
+        payload = self._payload(config, model)
+        payload["prompt"] = prompt
+        if stream:
+            payload["stream"] = True
+            # Ask for token counts in the final event
+            payload["stream_options"] = {"include_usage": True}
+        call = CallMetrics(model, kind="remote-stream" if stream else "remote")
+
+        with self._slot(call):
+            started = time.perf_counter()
+            conn, response = self._post("/completions", payload)
+            if not stream:
+                data = self._read_json(conn, response)
+                # Without streaming, prefill and decode cannot be told apart
+                self._record(call, started, started, data.get("usage"))
+                choice = data["choices"][0]
+                yield GenerationResult(
+                    apply_stop_strings(choice["text"], config.stop_strings)[0],
+                    "length" if choice.get("finish_reason") == "length" else "stop",
+                    (data.get("usage") or {}).get("completion_tokens", 0)
+                )
+                return
+
+            first = None
+            usage = None
+            finished = False
+            try:
+                for event in self._events(response):
+                    usage = event.get("usage") or usage
+                    if not event.get("choices"):
+                        continue
+                    chunk = event["choices"][0].get("text") or ""
+                    if chunk:
+                        first = first or time.perf_counter()
+                        yield chunk
+                finished = True
+            finally:
+                # A stream abandoned halfway leaves unread data behind
+                self._pool.release(conn, finished and not response.will_close)
+            self._record(call, started, first, usage)
+
+    def _payload(self, config: GenerationConfig, model: str) -> dict:
+        payload = {
+            "model": model,
+            "max_tokens": config.max_new_tokens,
+            # Greedy decoding is temperature 0 in the OpenAI API
+            "temperature": config.temperature if config.do_sample else 0.0,
+            "top_p": config.top_p if config.do_sample else 1.0,
+        }
+        if config.seed is not None:
+            payload["seed"] = config.seed
+        if config.stop_strings:
+            payload["stop"] = list(config.stop_strings)
+        if config.repetition_penalty != 1.0:
+            # Not part of the OpenAI API, but understood by vLLM and TGI
+            payload["repetition_penalty"] = config.repetition_penalty
+        return payload
+
+    @contextmanager
+    def _slot(self, call: CallMetrics):
+        # Bounded concurrency; the wait for a free slot counts as queueing
+        started = time.perf_counter()
+        with self._slots:
+            if self.metrics is not None:
+                self.metrics.record_phase(
+                    "queue", [call], time.perf_counter() - started
+                )
+            try:
+                yield
+            except Exception as exc:
+                call.error = f"{type(exc).__name__}: {exc}"
+                raise
+            finally:
+                if self.metrics is not None:
+                    self.metrics.record_call(call)
+
+    def _post(self, path: str, payload: dict):
+        """Send a request, retrying transient failures.
+
+        Returns:
+            tuple: The connection and its response with status 200; the
+            caller reads the body and releases the connection
+        """
+        body = json.dumps(payload).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": (
+                "text/event-stream" if payload.get("stream") else "application/json"
+            ),
+        }
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+
+        with self._lock:
+            self._stats["requests"] += 1
+        attempt = 0
+        while True:
+            conn, reused = self._pool.acquire()
+            retry_after = None
+            try:
+                conn.request(
+                    "POST", self._pool.base_path + path, body=body, headers=headers
+                )
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException) as exc:
+                conn.close()
+                if reused:
+                    # The server closed the idle connection; not a real failure
+                    continue
+                error = RemoteBackendError(f"request to {path} failed: {exc}")
+            else:
+                if response.status == 200:
+                    return conn, response
+                detail = response.read()[:500].decode("utf-8", "replace")
+                self._pool.release(conn, not response.will_close)
+                error = RemoteBackendError(
+                    f"{path} returned HTTP {response.status}: {detail}",
+                    status=response.status
+                )
+                if response.status not in RETRY_STATUSES:
+                    self._count("failed")
+                    raise error
+                retry_after = response.getheader("Retry-After")
+
+            if attempt >= self.max_retries:
+                self._count("failed")
+                raise error
+            delay = self.backoff * 2 ** attempt
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            # Jitter keeps many clients from retrying in lockstep
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
+            self._count("retries")
+
+    def _read_json(self, conn, response) -> dict:
+        try:
+            data = json.loads(response.read())
+        finally:
+            self._pool.release(conn, not response.will_close)
+        return data
+
+    def _events(self, response):
+        # Server-sent events: "data: <json>" lines, terminated by [DONE]
+        while True:
+            line = response.readline()
+            if not line:
+                return
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            data = line[len(b"data:"):].strip()
+            if data == b"[DONE]":
+                # Drain the rest so the connection can be reused
+                response.read()
+                return
+            yield json.loads(data)
+
+    def _record(self, call: CallMetrics, started: float, first: float, usage):
+        if self.metrics is None:
+            return
+        finished = time.perf_counter()
+        first = first or finished
+        self.metrics.record_phase("prefill", [call], first - started)
+        self.metrics.record_phase("decode", [call], finished - first)
+        if usage:
+            call.prompt_tokens = usage.get("prompt_tokens", 0)
+            call.generated_tokens = usage.get("completion_tokens", 0)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
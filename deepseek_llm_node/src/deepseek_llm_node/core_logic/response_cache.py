@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def make_cache_key(
+    model_name: str, prompt: str, params: dict, seed=None, weights: dict = None
+) -> str:
+    """Build a content address for a generation request.
+
+    Args:
+        model_name (str): Name or path of the model producing the response
+        prompt (str): The input prompt
+        params (dict): Generation parameters that influence the output
+        seed (int): Sampling seed, None when sampling is disabled
+        weights (dict): What the loaded weights depend on besides the model
+            name, e.g. their precision and snapshot
+
+    Returns:
+        str: Hex SHA-256 digest identifying the request
+    """
+    blob = json.dumps(
+        {
+            "model": model_name,
+            "prompt": prompt,
+            "params": params,
+            "seed": seed,
+            "weights": weights,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache for generated responses.
+
+    Responses are kept in an in-memory LRU bounded by ``memory_budget_bytes``
+    and, when ``disk_dir`` is set, persisted as one small file per key in that
+    directory. The disk tier is bounded by ``disk_budget_bytes``; the least
+    recently used files are evicted first. Disk hits are promoted back into
+    memory.
+    """
+
+    def __init__(
+        self,
+        memory_budget_bytes: int = 64 * 1024 * 1024,
+        disk_dir: str = None,
+        disk_budget_bytes: int = 1024 * 1024 * 1024
+    ):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.disk_dir = disk_dir
+        self.disk_budget_bytes = disk_budget_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # Lazily built index of the files on disk: key -> (size, last use)
+        self._disk_index = None
+        self._disk_bytes = 0
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    def get(self, key: str):
+        """Look a response up, returning None on a miss."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return value
+
+            value = self._disk_get(key)
+            if value is not None:
+                self._stats["disk_hits"] += 1
+                self._memory_put(key, value)
+                return value
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str):
+        """Store a response in both tiers."""
+        with self._lock:
+            self._memory_put(key, value)
+            self._disk_put(key, value)
+
+    def clear(self):
+        """Remove every cached response from memory and disk."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for key in list(self._load_disk_index()):
+                self._disk_remove(key)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current tier sizes."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+            stats["disk_entries"] = len(self._disk_index or {})
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+    # Memory tier
+
+    @staticmethod
+    def _entry_size(key: str, value: str) -> int:
+        return len(key) + len(value.encode("utf-8"))
+
+    def _memory_put(self, key: str, value: str):
+        size = self._entry_size(key, value)
+        if size > self.memory_budget_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= self._entry_size(key, previous)
+        self._memory[key] = value
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_budget_bytes:
+            old_key, old_value = self._memory.popitem(last=False)
+            self._memory_bytes -= self._entry_size(old_key, old_value)
+            self._stats["memory_evictions"] += 1
+
+    # Disk tier
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_disk_index(self) -> dict:
+        if not self.disk_dir:
+            return {}
+        if self._disk_index is not None:
+            return self._disk_index
+
+        os.makedirs(self.disk_dir, exist_ok=True)
+        index = {}
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                index[entry.name[:-len(".json")]] = (stat.st_size, stat.st_mtime)
+        self._disk_index = index
+        self._disk_bytes = sum(size for size, _ in index.values())
+        return index
+
+    def _disk_get(self, key: str):
+        index = self._load_disk_index()
+        if key not in index:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)["response"]
+            # Bump the modification time so eviction keeps recently used files
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self._disk_remove(key)
+            return None
+        index[key] = (index[key][0], os.path.getmtime(path))
+        return value
+
+    def _disk_put(self, key: str, value: str):
+        if not self.disk_dir:
+            return
+        index = self._load_disk_index()
+        data = json.dumps({"response": value}, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.disk_budget_bytes:
+            return
+
+        # Write to a temporary file first so readers never see partial entries
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        if key in index:
+            self._disk_bytes -= index[key][0]
+        index[key] = (len(data), os.path.getmtime(path))
+        self._disk_bytes += len(data)
+
+        if self._disk_bytes > self.disk_budget_bytes:
+            for old_key, _ in sorted(index.items(), key=lambda item: item[1][1]):
+                if self._disk_bytes <= self.disk_budget_bytes:
+                    break
+                if old_key != key:
+                    self._disk_remove(old_key)
+                    self._stats["disk_evictions"] += 1
+
+    def _disk_remove(self, key: str):
+        size, _ = self._disk_index.pop(key, (0, 0))
+        self._disk_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+# Files needed to run a model: config, tokenizer and safetensors weights.
+# Pickled .bin checkpoints are skipped; safetensors load without unpickling.
+SNAPSHOT_PATTERNS = ("*.json", "*.safetensors", "*.model", "*.txt", "*.tiktoken")
+
+# Written last, so a half-finished download is never used
+COMPLETE_MARKER = ".snapshot-complete"
+
+
+def snapshot_path(root: str, model_name: str) -> str:
+    """Directory holding the local snapshot of a hub model."""
+    safe_name = model_name.strip("/").replace("/", "--")
+    return os.path.join(root, safe_name)
+
+
+def has_safetensors(path: str) -> bool:
+    """Whether a model directory contains safetensors weights."""
+    try:
+        return any(name.endswith(".safetensors") for name in os.listdir(path))
+    except OSError:
+        return False
+
+
+def weights_fingerprint(path: str):
+    """Identify the weights in a model directory.
+
+    The fingerprint covers the names, sizes and modification times of the
+    config and safetensors files, so it changes when the weights are
+    replaced but is cheap enough to compute for every request.
+
+    Returns:
+        str | None: Hex digest, None if ``path`` is not a directory
+    """
+    try:
+        entries = sorted(
+            (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+            for entry in os.scandir(path)
+            if entry.name.endswith((".safetensors", ".json"))
+        )
+    except OSError:
+        return None
+    return hashlib.sha256(repr(entries).encode("utf-8")).hexdigest()
+
+
+def _hub_download(model_name: str, target: str):
+    from huggingface_hub import snapshot_download
+
+    snapshot_download(
+        model_name, local_dir=target, allow_patterns=list(SNAPSHOT_PATTERNS)
+    )
+
+
+def ensure_snapshot(model_name: str, root: str, download=_hub_download) -> str:
+    """Return a local directory with the model's files, downloading them once.
+
+    Local paths are returned unchanged. Hub models are downloaded into a
+    staging directory next to the snapshot and renamed into place once
+    complete, so concurrent processes and interrupted downloads never see a
+    partial snapshot. Afterwards the hub is not contacted again.
+
+    Args:
+        model_name (str): Hub model id or local path
+        root (str): Directory holding the snapshots
+        download (callable): Called as ``download(model_name, directory)`` to
+            fetch the files
+
+    Returns:
+        str: The snapshot directory
+
+    Raises:
+        ValueError: If the model has no safetensors weights
+    """
+    if os.path.isdir(model_name):
+        return model_name
+    path = snapshot_path(root, model_name)
+    if os.path.exists(os.path.join(path, COMPLETE_MARKER)):
+        return path
+
+    os.makedirs(root, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".download-", dir=root)
+    try:
+        download(model_name, staging)
+        if not has_safetensors(staging):
+            raise ValueError(f"{model_name!r} has no safetensors weights")
+        open(os.path.join(staging, COMPLETE_MARKER), "w").close()
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # Another process may have finished the same snapshot first
+            if not os.path.exists(os.path.join(path, COMPLETE_MARKER)):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return path
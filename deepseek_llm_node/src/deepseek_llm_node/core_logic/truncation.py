@@ -0,0 +1,42 @@
+from .generation_config import TRUNCATION_POLICIES
+
+
+def truncate_tokens(ids, budget: int, policy: str = "tail", keep_prefix: int = 0):
+    """Shorten a token sequence to at most ``budget`` tokens.
+
+    Args:
+        ids (list[int]): Token ids of the prompt
+        budget (int): Largest number of tokens to keep
+        policy (str): One of `TRUNCATION_POLICIES`: keep the last tokens
+            (``tail``), the first ones (``head``), both ends (``middle``,
+            dropping tokens from the center) or raise (``error``)
+        keep_prefix (int): Leading tokens that are always kept, e.g. the
+            beginning-of-sequence token
+
+    Returns:
+        list[int]: The ids, unchanged when they fit into the budget
+
+    Raises:
+        ValueError: If the prompt is too long and the policy is ``error``, or
+            the budget leaves no room beyond the kept prefix
+    """
+    ids = list(ids)
+    if len(ids) <= budget:
+        return ids
+    if policy not in TRUNCATION_POLICIES:
+        raise ValueError(f"truncation must be one of {TRUNCATION_POLICIES}")
+    if policy == "error":
+        raise ValueError(f"prompt has {len(ids)} tokens, at most {budget} fit")
+    room = budget - keep_prefix
+    if room < 1:
+        raise ValueError(f"a prompt budget of {budget} tokens leaves no room")
+
+    prefix, body = ids[:keep_prefix], ids[keep_prefix:]
+    if policy == "head":
+        body = body[:room]
+    elif policy == "tail":
+        body = body[len(body) - room:]
+    else:
+        head = (room + 1) // 2
+        body = body[:head] + body[len(body) - (room - head):]
+    return prefix + body
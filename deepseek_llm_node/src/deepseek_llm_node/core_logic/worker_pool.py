@@ -0,0 +1,549 @@
+import asyncio
+import importlib
+import itertools
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+
+from .cancellation import CancellationToken
+
+# Sentinel closing the chunk queue of a streaming request
+_END = object()
+
+# Seconds between checks of the cancellation tokens of pending requests
+_POLL_INTERVAL = 0.1
+
+
+class WorkerCrashedError(RuntimeError):
+    """A worker process died while it was handling a request."""
+
+
+class WorkerRequestError(RuntimeError):
+    """A request failed inside a worker; carries the remote error message."""
+
+
+class _Worker:
+    """Client-side handle of one worker process."""
+
+    def __init__(self, index: int, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        # request id -> (Future, chunk callback, cancellation token); the
+        # token is dropped once the worker has been asked to cancel
+        self.pending = {}
+        self.alive = True
+        self.reader = None
+
+
+class WorkerPool:
+    """Runs inference in separate worker processes.
+
+    Each worker is a fresh interpreter that imports ``deepseek_utils`` in
+    in-process mode and owns its own model copy, so a long `generate` call
+    never holds the GIL of the calling process and a crash only takes down
+    the worker. Requests travel over a local `multiprocessing` connection
+    authenticated with a random key; every worker serves several requests at
+    once, which keeps its batch scheduler fed.
+
+    Crashed workers fail their pending requests with `WorkerCrashedError`
+    and are restarted, up to ``max_restarts`` times per worker. Chat
+    sessions stay on the worker that created them.
+
+    Requests may carry a `CancellationToken`. Once it is cancelled, or a
+    stream is closed early, the worker is told to stop the generation, which
+    then ends after the current decoding step and frees the model.
+
+    Workers load weights the same way as the main process, each into its
+    own memory, so the pool needs ``num_workers`` times the model's memory.
+    A snapshot directory (DEEPSEEK_LLM_SNAPSHOT_DIR) at least spares them
+    the hub downloads.
+
+    Args:
+        num_workers (int): Number of worker processes
+        threads_per_worker (int): Intra-op threads per worker; by default the
+            CPU cores are split evenly between the workers
+        env (dict): Extra environment variables for the workers
+        start_timeout (float): Seconds to wait for a worker to connect
+        handler (str): Module implementing the operations in the workers,
+            ``deepseek_utils`` by default
+        max_restarts (int): How often a crashed worker is restarted
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        threads_per_worker: int = None,
+        env: dict = None,
+        start_timeout: float = 600.0,
+        handler: str = None,
+        max_restarts: int = 5
+    ):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or max(
+            1, (os.cpu_count() or 1) // num_workers
+        )
+        self.env = dict(env or {})
+        self.start_timeout = start_timeout
+        self.handler = handler or f"{__name__.rsplit('.', 1)[0]}.deepseek_utils"
+        self.max_restarts = max_restarts
+        self._restarts = [0] * num_workers
+        self._authkey = secrets.token_bytes(32)
+        self._listener = None
+        self._workers = []
+        self._sessions = {}
+        self._ids = itertools.count()
+        self._lock = threading.RLock()
+        # Serializes accepting connections of newly started workers
+        self._spawn_lock = threading.Lock()
+        self._closed = False
+        self._stopped = threading.Event()
+        self._stats = {"requests": 0, "failed": 0, "restarts": 0}
+
+    def start(self):
+        """Start the worker processes; blocks until all are connected."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("worker pool has been shut down")
+            if self._workers:
+                return
+            self._listener = Listener(("127.0.0.1", 0), authkey=self._authkey)
+            for index in range(self.num_workers):
+                self._workers.append(self._spawn(index))
+            threading.Thread(
+                target=self._watch_cancellation, name="deepseek-worker-cancel",
+                daemon=True
+            ).start()
+
+    def submit(
+        self, op: str, on_chunk=None, cancel_token: CancellationToken = None,
+        **kwargs
+    ) -> Future:
+        """Send a request to the least busy worker.
+
+        Args:
+            op (str): ``stream`` or one of `_OPERATIONS`
+            on_chunk (callable): Receives streamed chunks, for ``stream``
+            cancel_token (CancellationToken): Stops the request in the
+                worker when cancelled, for ``stream`` and ``generate``
+            **kwargs: Arguments of the operation
+
+        Returns:
+            Future: Resolves to the operation's result
+        """
+        return self._send(self._pick(), op, kwargs, on_chunk, cancel_token)
+
+    def broadcast(self, op: str, **kwargs) -> list:
+        """Run an operation on every worker, e.g. to preload a model."""
+        self.start()
+        futures = [
+            self._send(index, op, kwargs) for index in range(self.num_workers)
+        ]
+        return [future.result() for future in futures]
+
+    def generate(
+        self, prompt: str, config, model: str,
+        cancel_token: CancellationToken = None, **kwargs
+    ) -> Future:
+        """Generate on a worker; extra arguments such as ``deadline`` are
+        passed on to the handler."""
+        return self.submit(
+            "generate", cancel_token=cancel_token, prompt=prompt, config=config,
+            model=model, **kwargs
+        )
+
+    async def agenerate(self, prompt: str, config, model: str, **kwargs) -> str:
+        """Awaitable variant of `generate` for asyncio callers."""
+        return await asyncio.wrap_future(
+            self.generate(prompt, config, model, **kwargs)
+        )
+
+    def stream(
+        self, prompt: str, config, model: str,
+        cancel_token: CancellationToken = None, **kwargs
+    ):
+        """Yield text chunks as the worker produces them.
+
+        Cancelling ``cancel_token`` ends the stream after the worker's current
+        decoding step; closing the generator early stops the worker as well.
+        """
+        stop = cancel_token.child() if cancel_token else CancellationToken()
+        chunks = queue.Queue()
+        future = self.submit(
+            "stream", on_chunk=chunks.put, cancel_token=stop, prompt=prompt,
+            config=config, model=model, **kwargs
+        )
+        future.add_done_callback(lambda _: chunks.put(_END))
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is _END:
+                    break
+                yield chunk
+        finally:
+            stop.cancel()
+        # Surface errors of the remote generation
+        future.result()
+
+    async def astream(
+        self, prompt: str, config, model: str,
+        cancel_token: CancellationToken = None, **kwargs
+    ):
+        """Asynchronous variant of `stream` for asyncio callers."""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+
+        def push(item):
+            try:
+                loop.call_soon_threadsafe(chunks.put_nowait, item)
+            except RuntimeError:
+                # The event loop is closed; nobody is listening any more
+                pass
+
+        stop = cancel_token.child() if cancel_token else CancellationToken()
+        future = self.submit(
+            "stream", on_chunk=push, cancel_token=stop, prompt=prompt,
+            config=config, model=model, **kwargs
+        )
+        future.add_done_callback(lambda _: push(_END))
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is _END:
+                    break
+                yield chunk
+        finally:
+            stop.cancel()
+        future.result()
+
+    def chat(self, message: str, session_id: str = None, **kwargs):
+        """Run a chat turn on the worker owning the session.
+
+        Returns:
+            tuple: The reply and the session id, as `run_chat_turn` does
+        """
+        index = self._pick(session_id)
+        future = self._send(
+            index, "chat", dict(kwargs, message=message, session_id=session_id)
+        )
+        response, new_session_id = future.result()
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._sessions[new_session_id] = index
+        return response, new_session_id
+
+    def end_chat(self, session_id: str) -> bool:
+        with self._lock:
+            index = self._sessions.pop(session_id, None)
+        if index is None:
+            return False
+        return self._send(index, "end_chat", {"session_id": session_id}).result()
+
+    def stats(self) -> dict:
+        """Request counters and the state of every worker."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["workers"] = [
+                {
+                    "pid": worker.process.pid,
+                    "alive": worker.alive,
+                    "pending": len(worker.pending),
+                }
+                for worker in self._workers
+            ]
+            stats["sessions"] = len(self._sessions)
+            return stats
+
+    def shutdown(self, timeout: float = 10.0):
+        """Stop all workers; pending requests fail with `WorkerCrashedError`."""
+        self._stopped.set()
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+            self._workers = []
+        for worker in workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in workers:
+            try:
+                worker.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+            worker.conn.close()
+        if self._listener is not None:
+            self._listener.close()
+
+    def _pick(self, session_id: str = None) -> int:
+        # The worker owning a chat session, otherwise the least busy one
+        self.start()
+        with self._lock:
+            index = self._sessions.get(session_id) if session_id else None
+            if index is not None:
+                return index
+            alive = [worker for worker in self._workers if worker.alive]
+            if not alive:
+                raise WorkerCrashedError("no worker process is running")
+            return min(alive, key=lambda worker: len(worker.pending)).index
+
+    def _send(
+        self, index: int, op: str, kwargs: dict, on_chunk=None,
+        cancel_token: CancellationToken = None
+    ) -> Future:
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("worker pool has been shut down")
+            worker = self._workers[index]
+            if not worker.alive:
+                future.set_exception(
+                    WorkerCrashedError(f"worker {index} is restarting")
+                )
+                return future
+            request_id = next(self._ids)
+            worker.pending[request_id] = (future, on_chunk, cancel_token)
+            self._stats["requests"] += 1
+
+        try:
+            with worker.send_lock:
+                worker.conn.send((request_id, op, kwargs))
+        except (OSError, ValueError) as exc:
+            with self._lock:
+                entry = worker.pending.pop(request_id, None)
+            if entry is not None:
+                future.set_exception(WorkerCrashedError(str(exc)))
+            return future
+        if cancel_token is not None:
+            # Tokens cancelled explicitly are forwarded right away, polled
+            # ones (ComfyUI's interrupt) by `_watch_cancellation`
+            cancel_token.add_callback(lambda: self._cancel(worker, request_id))
+        return future
+
+    def _cancel(self, worker: _Worker, request_id: int):
+        # Ask the worker to stop a request, at most once
+        with self._lock:
+            entry = worker.pending.get(request_id)
+            if entry is None or entry[2] is None:
+                return
+            worker.pending[request_id] = entry[:2] + (None,)
+        try:
+            with worker.send_lock:
+                worker.conn.send((request_id, "cancel", {}))
+        except (OSError, ValueError):
+            # The worker is gone; `_on_worker_exit` fails the request
+            pass
+
+    def _watch_cancellation(self):
+        while not self._stopped.wait(_POLL_INTERVAL):
+            with self._lock:
+                cancelled = [
+                    (worker, request_id)
+                    for worker in self._workers
+                    for request_id, (_, _, token) in worker.pending.items()
+                    if token is not None and token.cancelled
+                ]
+            for worker, request_id in cancelled:
+                self._cancel(worker, request_id)
+
+    def _spawn(self, index: int) -> _Worker:
+        env = dict(os.environ)
+        env.update(self.env)
+        env.update({
+            # Workers run the model in-process and must not start pools
+            "DEEPSEEK_LLM_WORKERS": "0",
+            # The parent process already caches responses
+            "DEEPSEEK_LLM_RESPONSE_CACHE": "0",
+            "DEEPSEEK_LLM_WORKER_AUTHKEY": self._authkey.hex(),
+            "DEEPSEEK_LLM_WORKER_HANDLER": self.handler,
+            # Keep the workers from oversubscribing the CPU cores
+            "OMP_NUM_THREADS": str(self.threads_per_worker),
+            "MKL_NUM_THREADS": str(self.threads_per_worker),
+        })
+
+        # The next connection is the new worker; workers are only started
+        # under the spawn lock, so connections cannot be mixed up
+        result = {}
+        with self._spawn_lock:
+            env["DEEPSEEK_LLM_WORKER_ADDRESS"] = "%s:%d" % self._listener.address
+            process = subprocess.Popen(
+                [sys.executable, "-c", _bootstrap_code()], env=env
+            )
+            acceptor = threading.Thread(
+                target=lambda: result.setdefault("conn", self._listener.accept()),
+                daemon=True
+            )
+            acceptor.start()
+            acceptor.join(self.start_timeout)
+            if "conn" not in result:
+                process.kill()
+                # Replace the listener so the stuck accept cannot grab the
+                # connection of the next worker
+                self._listener.close()
+                self._listener = Listener(("127.0.0.1", 0), authkey=self._authkey)
+                raise WorkerCrashedError(f"worker {index} did not start in time")
+
+        worker = _Worker(index, process, result["conn"])
+        worker.reader = threading.Thread(
+            target=self._read, args=(worker,), name=f"deepseek-worker-{index}",
+            daemon=True
+        )
+        worker.reader.start()
+        return worker
+
+    def _read(self, worker: _Worker):
+        # Route replies of one worker to their futures until it goes away
+        while True:
+            try:
+                request_id, kind, value = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                entry = worker.pending.get(request_id)
+                if entry is not None and kind != "chunk":
+                    del worker.pending[request_id]
+            if entry is None:
+                continue
+            future, on_chunk, _ = entry
+            if kind == "chunk":
+                if on_chunk is not None:
+                    on_chunk(value)
+            elif kind == "result":
+                future.set_result(value)
+            else:
+                with self._lock:
+                    self._stats["failed"] += 1
+                future.set_exception(WorkerRequestError(value))
+        self._on_worker_exit(worker)
+
+    def _on_worker_exit(self, worker: _Worker):
+        with self._lock:
+            worker.alive = False
+            pending = list(worker.pending.values())
+            worker.pending.clear()
+            self._stats["failed"] += len(pending)
+            # Sessions on the worker are gone with it
+            for session_id, index in list(self._sessions.items()):
+                if index == worker.index:
+                    del self._sessions[session_id]
+            restart = (
+                not self._closed
+                and worker in self._workers
+                and self._restarts[worker.index] < self.max_restarts
+            )
+            if restart:
+                self._restarts[worker.index] += 1
+
+        try:
+            code = worker.process.wait(10)
+        except subprocess.TimeoutExpired:
+            # The connection broke but the process hangs; don't leave it behind
+            worker.process.kill()
+            code = worker.process.wait()
+        for future, _, _ in pending:
+            future.set_exception(
+                WorkerCrashedError(f"worker {worker.index} exited with code {code}")
+            )
+
+        if not restart:
+            return
+        try:
+            replacement = self._spawn(worker.index)
+        except (OSError, WorkerCrashedError):
+            return
+        with self._lock:
+            if self._closed:
+                replacement.conn.send(None)
+                return
+            self._stats["restarts"] += 1
+            self._workers[worker.index] = replacement
+
+
+def _bootstrap_code() -> str:
+    """Python code starting a worker in a fresh interpreter.
+
+    The package is imported under the same name as in this process, so the
+    pickled requests (e.g. `GenerationConfig`) resolve to the same classes.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    for _ in __name__.split(".")[:-1]:
+        root = os.path.dirname(root)
+    return (
+        f"import sys; sys.path.insert(0, {root!r}); "
+        f"from {__name__} import worker_main; worker_main()"
+    )
+
+
+def worker_main():
+    """Entry point of a worker process: serve requests until told to stop."""
+    host, port = os.environ["DEEPSEEK_LLM_WORKER_ADDRESS"].rsplit(":", 1)
+    authkey = bytes.fromhex(os.environ["DEEPSEEK_LLM_WORKER_AUTHKEY"])
+    conn = Client((host, int(port)), authkey=authkey)
+    handler = importlib.import_module(os.environ["DEEPSEEK_LLM_WORKER_HANDLER"])
+
+    send_lock = threading.Lock()
+    # request id -> cancellation token of the running cancellable requests
+    tokens = {}
+
+    def reply(request_id, kind, value):
+        with send_lock:
+            conn.send((request_id, kind, value))
+
+    def handle(request_id, op, kwargs):
+        try:
+            if op == "stream":
+                for chunk in handler.stream_deepseek_inference(**kwargs):
+                    reply(request_id, "chunk", chunk)
+                result = None
+            else:
+                result = getattr(handler, _OPERATIONS[op])(**kwargs)
+        except Exception as exc:
+            reply(request_id, "error", f"{type(exc).__name__}: {exc}")
+        else:
+            reply(request_id, "result", result)
+        finally:
+            tokens.pop(request_id, None)
+
+    # Requests are handled concurrently so the batch scheduler can group them
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            request_id, op, kwargs = message
+            if op == "cancel":
+                token = tokens.get(request_id)
+                if token is not None:
+                    token.cancel()
+                continue
+            if op in _CANCELLABLE:
+                kwargs["cancel_token"] = tokens[request_id] = CancellationToken()
+            executor.submit(handle, request_id, op, kwargs)
+    conn.close()
+
+
+# Operations a worker accepts besides ``stream``, mapped to the functions of
+# the handler module
+_OPERATIONS = {
+    "generate": "run_deepseek_inference",
+    "generate_batch": "run_deepseek_batch",
+    "chat": "run_chat_turn",
+    "end_chat": "end_chat_session",
+    "preload": "preload_model",
+    "register_prefix": "register_prompt_prefix",
+}
+
+# Operations that take a ``cancel_token`` and can be stopped by the client
+_CANCELLABLE = ("stream", "generate")
@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tmp_path_factory):
+    """Directory of the tiny random-weight benchmark model, built once.
+
+    Tests using it are skipped where torch or transformers are missing.
+    """
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from benchmarks.make_tiny_model import build_model, build_tokenizer
+
+    path = tmp_path_factory.mktemp("tiny-model")
+    tokenizer = build_tokenizer(vocab_size=512, seed=0)
+    model = build_model(tokenizer, hidden_size=64, layers=2, seed=0)
+    tokenizer.save_pretrained(path)
+    model.save_pretrained(path, safe_serialization=True)
+    return str(path)
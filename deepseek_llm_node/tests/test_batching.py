@@ -0,0 +1,59 @@
+import threading
+
+from src.deepseek_llm_node.core_logic.batching import BatchScheduler
+
+
+def test_concurrent_requests_are_batched_and_routed_back():
+    calls = []
+
+    def batch_fn(group_key, prompts):
+        calls.append(list(prompts))
+        return [p.upper() for p in prompts]
+
+    scheduler = BatchScheduler(batch_fn, max_batch_size=4, batch_window_ms=200)
+    futures = [scheduler.submit(f"p{i}") for i in range(4)]
+
+    assert [f.result(timeout=5) for f in futures] == ["P0", "P1", "P2", "P3"]
+    assert calls == [["p0", "p1", "p2", "p3"]]
+    stats = scheduler.stats()
+    assert stats["batches"] == 1
+    assert stats["max_batch_size_seen"] == 4
+    assert stats["queue_depth"] == 0
+    scheduler.shutdown()
+
+
+def test_groups_and_solo_requests_are_not_mixed():
+    calls = []
+    lock = threading.Lock()
+
+    def batch_fn(group_key, prompts):
+        with lock:
+            calls.append((group_key, len(prompts)))
+        return prompts
+
+    scheduler = BatchScheduler(batch_fn, max_batch_size=8, batch_window_ms=200)
+    futures = [
+        scheduler.submit("a", group_key="x"),
+        scheduler.submit("b", group_key="y"),
+        scheduler.submit("c", group_key="x"),
+        scheduler.submit("d", group_key="x", batchable=False),
+    ]
+    assert [f.result(timeout=5) for f in futures] == ["a", "b", "c", "d"]
+    assert sorted(calls) == [("x", 1), ("x", 2), ("y", 1)]
+    scheduler.shutdown()
+
+
+def test_errors_propagate_to_every_caller():
+    def batch_fn(group_key, prompts):
+        raise RuntimeError("boom")
+
+    scheduler = BatchScheduler(batch_fn, batch_window_ms=0)
+    future = scheduler.submit("a")
+    try:
+        future.result(timeout=5)
+    except RuntimeError as exc:
+        assert str(exc) == "boom"
+    else:
+        raise AssertionError("expected the batch error")
+    assert scheduler.stats()["failed"] == 1
+    scheduler.shutdown()
@@ -0,0 +1,44 @@
+from src.deepseek_llm_node.core_logic.bucketing import padding_ratio, plan_micro_batches
+
+
+def test_prompts_are_bucketed_by_length():
+    lengths = [100, 5, 98, 6, 50, 7, 51]
+    batches = plan_micro_batches(lengths, max_new_tokens=10)
+
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    assert [sorted(batch) for batch in batches] == [[1, 3, 5], [4, 6], [0, 2]]
+    assert padding_ratio(lengths, batches) < 0.05
+    # One batch in arrival order would be mostly padding
+    assert padding_ratio(lengths, [list(range(len(lengths)))]) > 0.4
+
+
+def test_batches_respect_size_and_token_budget():
+    lengths = [10] * 10
+    assert [len(b) for b in plan_micro_batches(lengths, 10, max_batch_size=4)] == [
+        4, 4, 2
+    ]
+    # Each prompt needs 20 KV tokens, so 3 fit into a budget of 60
+    assert [len(b) for b in plan_micro_batches(lengths, 10, token_budget=60)] == [
+        3, 3, 3, 1
+    ]
+    # Prompts too long for the budget still run, one at a time
+    assert plan_micro_batches([500, 600], 10, token_budget=100) == [[0], [1]]
+    assert plan_micro_batches([], 10) == []
+
+
+def test_batches_leave_the_shared_tokenizer_unchanged(tiny_model, monkeypatch):
+    from src.deepseek_llm_node.core_logic import deepseek_utils
+
+    monkeypatch.setattr(deepseek_utils, "response_cache_enabled", False)
+    tokenizer, _ = deepseek_utils.model_registry.acquire(tiny_model)
+    monkeypatch.setattr(tokenizer, "padding_side", "right")
+    options = {"model": tiny_model, "do_sample": False, "max_new_tokens": 4}
+    prompts = ["the video frame", "a quiet city at night with rain on the road"]
+
+    batched = deepseek_utils.run_deepseek_batch(prompts, **options)
+    # Left padding lines up the prompt endings, as if each ran on its own
+    assert batched == [
+        deepseek_utils.run_deepseek_inference(prompt, **options) for prompt in prompts
+    ]
+    assert tokenizer.padding_side == "right"
+    assert tokenizer.pad_token == "<pad>"
@@ -0,0 +1,56 @@
+import pickle
+from concurrent.futures import Future
+
+import pytest
+
+from src.deepseek_llm_node.core_logic.cancellation import (
+    CancellationToken,
+    GenerationResult,
+)
+
+
+def test_cancel_runs_callbacks_once():
+    token = CancellationToken()
+    queued = Future()
+    calls = []
+    token.add_callback(queued.cancel)
+    token.add_callback(lambda: calls.append(1))
+    assert not token.cancelled
+
+    token.cancel()
+    token.cancel()
+    assert token.cancelled
+    assert queued.cancelled()
+    assert calls == [1]
+
+    # Registered after cancellation: runs right away
+    token.add_callback(lambda: calls.append(2))
+    assert calls == [1, 2]
+
+
+def test_generation_result_is_a_string_with_a_reason():
+    result = GenerationResult("partial", "deadline", generated_tokens=3)
+    assert result == "partial"
+    assert result.text == "partial" and type(result.text) is str
+    assert not result.complete
+    assert GenerationResult("done", "length").complete
+
+    # Survives the trip to and from worker processes
+    copy = pickle.loads(pickle.dumps(result))
+    assert (copy, copy.finish_reason, copy.generated_tokens) == (
+        "partial", "deadline", 3
+    )
+
+    with pytest.raises(ValueError):
+        GenerationResult("x", "timeout")
+
+
+def test_child_token_follows_its_parent():
+    parent = CancellationToken()
+    child = parent.child()
+    child.cancel()
+    assert child.cancelled and not parent.cancelled
+
+    other = parent.child()
+    parent.cancel()
+    assert other.cancelled
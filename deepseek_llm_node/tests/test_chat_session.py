@@ -0,0 +1,56 @@
+from src.deepseek_llm_node.core_logic.chat_session import ChatSessionStore
+
+
+def test_sessions_are_resumed_by_handle():
+    store = ChatSessionStore()
+    session = store.get_or_create(model="m", system_prompt="Be brief.")
+    assert session.messages == [{"role": "system", "content": "Be brief."}]
+    assert store.get_or_create(session.session_id, model="m") is session
+    # Switching models starts over
+    assert store.get_or_create(session.session_id, model="other") is not session
+
+
+def test_idle_and_excess_sessions_are_evicted():
+    store = ChatSessionStore(max_sessions=2, idle_timeout=60)
+    first = store.get_or_create(model="m")
+    store.get_or_create(model="m")
+    store.get_or_create(model="m")
+    assert store.get(first.session_id) is None
+    assert store.stats()["evicted"] == 1
+
+    expired = store.get_or_create(model="m")
+    expired.last_used -= 120
+    assert store.get(expired.session_id) is None
+    assert store.stats()["expired"] == 1
+
+
+def test_second_turn_prefills_only_new_tokens(tiny_model):
+    from src.deepseek_llm_node.core_logic import deepseek_utils
+
+    tokenizer, model = deepseek_utils.model_registry.acquire(tiny_model)
+    forwards = []
+    handle = model.register_forward_pre_hook(
+        lambda module, args, kwargs: forwards.append(kwargs["input_ids"].shape[1]),
+        with_kwargs=True
+    )
+    options = {"model": tiny_model, "do_sample": False, "max_new_tokens": 4}
+    try:
+        _, session_id = deepseek_utils.run_chat_turn("the video frame", **options)
+        session = deepseek_utils.chat_sessions.get(session_id)
+        cached_ids = list(session.cached_ids)
+        forwards.clear()
+        deepseek_utils.run_chat_turn("a quiet city", session_id, **options)
+    finally:
+        handle.remove()
+
+    messages = session.messages[:-1]
+    ids = tokenizer.apply_chat_template(
+        messages, add_generation_prompt=True, tokenize=True, return_dict=False
+    )
+    reused = 0
+    while reused < len(cached_ids) and cached_ids[reused] == ids[reused]:
+        reused += 1
+    # The first turn's tokens come from the cache; only the rest is prefilled
+    assert reused > 0
+    assert forwards[0] == len(ids) - min(reused, len(ids) - 1)
+    assert forwards[0] < len(ids)
@@ -0,0 +1,70 @@
+import pytest
+
+
+@pytest.fixture
+def compile_setup(tiny_model, monkeypatch):
+    """The tiny model's manager with small compile buckets; compiled state
+    and cached responses never leak into other tests."""
+    from src.deepseek_llm_node.core_logic import deepseek_utils
+
+    monkeypatch.setattr(deepseek_utils, "compile_buckets", [32])
+    monkeypatch.setattr(deepseek_utils, "compile_max_len", 64)
+    monkeypatch.setattr(deepseek_utils, "response_cache_enabled", False)
+    manager = deepseek_utils.model_registry.manager(tiny_model)
+    yield deepseek_utils, manager
+    manager.disable_compile()
+    manager.compile_error = None
+
+
+def _generate(deepseek_utils, model):
+    return deepseek_utils.run_deepseek_inference(
+        "the video frame", model=model, do_sample=False, max_new_tokens=8
+    )
+
+
+def test_compiled_output_matches_eager(compile_setup, tiny_model, mocker):
+    deepseek_utils, manager = compile_setup
+    eager = _generate(deepseek_utils, tiny_model)
+    assert eager.generated_tokens == 8
+
+    assert manager.compile_model(), manager.compile_error
+    compiled = mocker.spy(deepseek_utils, "_generate_compiled")
+    bucket = mocker.spy(deepseek_utils, "_compile_bucket")
+    result = _generate(deepseek_utils, tiny_model)
+
+    # The prompt was padded to its bucket and ran on the static cache
+    assert bucket.spy_return == 32
+    assert compiled.call_count == 1
+    assert manager.compiled_forward is not None
+    assert (result, result.finish_reason) == (eager, eager.finish_reason)
+
+
+def test_failed_compilation_keeps_eager_mode(compile_setup, tiny_model, mocker):
+    deepseek_utils, manager = compile_setup
+    eager = _generate(deepseek_utils, tiny_model)
+
+    mocker.patch.object(
+        deepseek_utils.torch, "compile", side_effect=RuntimeError("no compiler")
+    )
+    assert not manager.compile_model()
+    assert manager.compile_error == "RuntimeError: no compiler"
+    assert deepseek_utils.get_compile_status(tiny_model)["compiled"] is False
+    assert _generate(deepseek_utils, tiny_model) == eager
+
+
+def test_compiled_path_falls_back_to_eager(compile_setup, tiny_model):
+    deepseek_utils, manager = compile_setup
+    eager = _generate(deepseek_utils, tiny_model)
+
+    def broken_forward(*args, **kwargs):
+        raise RuntimeError("graph break")
+
+    _, model = deepseek_utils.model_registry.acquire(tiny_model)
+    manager.compiled_forward = broken_forward
+    manager.static_cache = deepseek_utils._static_kv_cache(model, 64)
+    manager.static_cache_len = 64
+
+    # The request is generated again eagerly and compilation stays off
+    assert _generate(deepseek_utils, tiny_model) == eager
+    assert manager.compiled_forward is None
+    assert manager.compile_error == "RuntimeError: graph break"
@@ -1,4 +1,6 @@
-import pytest  # noqa: F401
+import os
+
+import pytest
 from src.deepseek_llm_node.core_logic.deepseek_utils import run_deepseek_inference
 
 def test_run_deepseek_inference(mocker):
@@ -11,3 +13,75 @@ def test_run_deepseek_inference(mocker):
     
     result = run_deepseek_inference("Test prompt")
     assert result == "Mocked response"
+
+
+def test_model_manager_loads_lazily_and_once(mocker):
+    import threading
+    from src.deepseek_llm_node.core_logic import deepseek_utils
+
+    mock_model = mocker.patch.object(deepseek_utils, "AutoModelForCausalLM")
+    mock_tokenizer = mocker.patch.object(deepseek_utils, "AutoTokenizer")
+
+    manager = deepseek_utils.DeepSeekModelManager(cache_dir="/tmp/deepseek_llm_test")
+    assert not manager.is_loaded
+    mock_model.from_pretrained.assert_not_called()
+
+    # Concurrent first calls must only trigger a single load
+    threads = [threading.Thread(target=manager.load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert manager.is_loaded
+    assert mock_model.from_pretrained.call_count == 1
+    assert mock_tokenizer.from_pretrained.call_count == 1
+
+
+def test_queued_request_dropped_by_the_deadline_timer(mocker):
+    from concurrent.futures import Future
+
+    from src.deepseek_llm_node.core_logic import deepseek_utils
+
+    # The request never starts, and the wall clock lags behind the timer
+    mocker.patch.object(deepseek_utils.batch_scheduler, "submit", return_value=Future())
+    mocker.patch.object(deepseek_utils.time, "time", return_value=1000.0)
+    result = deepseek_utils.run_deepseek_inference(
+        "Hi", model="m", deadline=1000.05, do_sample=True
+    )
+    assert (result, result.finish_reason) == ("", "deadline")
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/statm"), reason="needs /proc to sample RSS"
+)
+def test_peak_memory_is_measured_per_call(mocker):
+    from src.deepseek_llm_node.core_logic import deepseek_utils
+
+    mocker.patch.object(deepseek_utils.torch.cuda, "is_available", return_value=False)
+    # An earlier, larger request raised the peak of the whole process
+    big = bytearray(256 * 2**20)
+    big[::4096] = b"x" * len(big[::4096])
+    del big
+
+    tracker = deepseek_utils._PeakMemoryTracker()
+    tracker.start()
+    peak = tracker.stop()
+    assert 0 < peak < deepseek_utils._process_peak_rss_bytes() - 128 * 2**20
+
+
+def test_response_cache_key_follows_the_loaded_weights(tmp_path):
+    from src.deepseek_llm_node.core_logic import deepseek_utils
+
+    fp16 = deepseek_utils.DeepSeekModelManager("org/m", precision="fp16")
+    int4 = deepseek_utils.DeepSeekModelManager("org/m", precision="int4-weight")
+    assert fp16.weights_identity() != int4.weights_identity()
+
+    # A local snapshot of the model is identified by its weight files
+    snapshot = deepseek_utils.DeepSeekModelManager(
+        "org/m", precision="fp16", snapshot_root=str(tmp_path)
+    )
+    path = tmp_path / "org--m"
+    path.mkdir()
+    (path / "model.safetensors").write_bytes(b"weights")
+    assert snapshot.weights_identity()["snapshot"] is not None
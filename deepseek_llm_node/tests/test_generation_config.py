@@ -0,0 +1,90 @@
+import pytest
+
+from src.deepseek_llm_node.core_logic.generation_config import (
+    GenerationConfig,
+    apply_stop_strings,
+)
+
+
+def test_generate_kwargs_budget_new_tokens_only():
+    greedy = GenerationConfig(max_new_tokens=32, do_sample=False, seed=7)
+    assert greedy.seed is None
+    assert greedy.deterministic
+    assert greedy.to_generate_kwargs() == {
+        "max_new_tokens": 32,
+        "do_sample": False,
+        "repetition_penalty": 1.0,
+    }
+    assert "temperature" in GenerationConfig().to_generate_kwargs()
+    assert not GenerationConfig().deterministic
+    assert GenerationConfig(seed=3).deterministic
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"max_new_tokens": 0},
+        {"temperature": 0},
+        {"top_p": 1.5},
+        {"repetition_penalty": 0},
+        {"seed": -2},
+        {"truncation": "left"},
+        {"max_prompt_tokens": 0},
+        {"kv_cache": "paged"},
+        {"kv_window": 4},
+    ],
+)
+def test_invalid_configs_are_rejected(options):
+    with pytest.raises(ValueError):
+        GenerationConfig(**options)
+
+
+def test_stop_strings():
+    stops = GenerationConfig.parse_stop_strings("User:\n\\n\\n\n")
+    assert stops == ("User:", "\n\n")
+    assert hash(GenerationConfig(stop_strings=list(stops)))
+    assert apply_stop_strings("Hi there\n\nUser: more", stops) == ("Hi there", True)
+    assert apply_stop_strings("Hi there", stops) == ("Hi there", False)
+
+
+def test_speculation_only_matters_for_sampled_cache_keys():
+    greedy = GenerationConfig(do_sample=False)
+    assert greedy.replace(speculative=True).cache_params() == greedy.cache_params()
+    sampled = GenerationConfig(seed=1)
+    assert sampled.replace(speculative=True).cache_params() != sampled.cache_params()
+    assert "speculative" not in GenerationConfig(speculative=True).to_generate_kwargs()
+
+
+def test_kv_cache_options():
+    quantized = GenerationConfig(kv_cache="quantized").to_generate_kwargs()
+    assert quantized["cache_implementation"] == "quantized"
+    assert "cache_implementation" not in GenerationConfig().to_generate_kwargs()
+    # The window only matters for the sliding-window cache
+    assert "kv_window" not in GenerationConfig().cache_params()
+    sliding = GenerationConfig(kv_cache="sliding")
+    assert sliding.replace(kv_window=64).cache_params() != sliding.cache_params()
+
+
+def test_sliding_kv_cache_runs_on_the_installed_transformers(tiny_model, monkeypatch):
+    from src.deepseek_llm_node.core_logic import deepseek_utils
+
+    monkeypatch.setattr(deepseek_utils, "response_cache_enabled", False)
+    assert "sliding" in deepseek_utils.available_kv_cache_modes()
+    prompt = " ".join(["the video frame shows a quiet city"] * 8)
+    result = deepseek_utils.run_deepseek_inference(
+        prompt, model=tiny_model, do_sample=False, max_new_tokens=24,
+        kv_cache="sliding", kv_window=16
+    )
+    assert result.generated_tokens == 24
+
+
+def test_unavailable_kv_cache_modes_are_rejected(tiny_model, monkeypatch):
+    from src.deepseek_llm_node.core_logic import deepseek_utils
+
+    monkeypatch.setattr(deepseek_utils, "response_cache_enabled", False)
+    monkeypatch.setattr(deepseek_utils, "_has_module", lambda name: False)
+    assert "quantized" not in deepseek_utils.available_kv_cache_modes()
+    with pytest.raises(ValueError, match="optimum-quanto"):
+        deepseek_utils.run_deepseek_inference(
+            "the video frame", model=tiny_model, kv_cache="quantized"
+        )
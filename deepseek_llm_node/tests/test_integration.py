@@ -1,7 +1,50 @@
+import asyncio
+
 import pytest
 from src.deepseek_llm_node.comfyui_nodes.deepseek_llm_node import DeepSeekLLMNode
 
 def test_deepseek_node():
     node = DeepSeekLLMNode()
     assert node.CATEGORY == "Custom/LLM"
-    assert "prompt" in node.INPUT_TYPES()["required"]
\ No newline at end of file
+    assert "prompt" in node.INPUT_TYPES()["required"]
+
+def test_deepseek_node_streams_response(mocker):
+    from src.deepseek_llm_node.comfyui_nodes import deepseek_llm_node
+
+    async def stream(*args, **kwargs):
+        for chunk in ["Hello", ", ", "world"]:
+            yield chunk
+
+    mocker.patch.object(deepseek_llm_node, "astream_deepseek_inference", stream)
+    node = DeepSeekLLMNode()
+    assert asyncio.run(node.execute("Say hello")) == ("Hello, world",)
+
+def test_batch_node_keeps_prompt_order(mocker):
+    from src.deepseek_llm_node.comfyui_nodes import deepseek_llm_node
+
+    mocker.patch.object(
+        deepseek_llm_node,
+        "run_deepseek_batch",
+        side_effect=lambda prompts, *args, **kwargs: [p.upper() for p in prompts],
+    )
+    node = deepseek_llm_node.DeepSeekBatchNode()
+    responses, text = node.execute(["a cat\n\nb dog", "c bird"], mode=["greedy"])
+    assert responses == ["A CAT", "B DOG", "C BIRD"]
+    assert text == "A CAT\nB DOG\nC BIRD"
+
+def test_is_changed_fingerprint():
+    fingerprint = DeepSeekLLMNode.IS_CHANGED("Say hello", mode="greedy")
+    assert fingerprint == DeepSeekLLMNode.IS_CHANGED("Say hello", mode="greedy")
+    assert fingerprint != DeepSeekLLMNode.IS_CHANGED("Say hi", mode="greedy")
+    assert fingerprint != DeepSeekLLMNode.IS_CHANGED(
+        "Say hello", mode="greedy", max_new_tokens=8
+    )
+    seeded = DeepSeekLLMNode.IS_CHANGED("Say hello", seed=7)
+    assert seeded == DeepSeekLLMNode.IS_CHANGED("Say hello", seed=7)
+    assert seeded != DeepSeekLLMNode.IS_CHANGED("Say hello", seed=8)
+
+    # Unseeded sampling and timeouts always re-run
+    unseeded = DeepSeekLLMNode.IS_CHANGED("Say hello")
+    assert unseeded != unseeded
+    timed = DeepSeekLLMNode.IS_CHANGED("Say hello", mode="greedy", timeout=5.0)
+    assert timed != timed
@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+
+from src.deepseek_llm_node.core_logic.metrics import (
+    CallMetrics,
+    JsonLinesExporter,
+    MetricsHook,
+    MetricsRegistry,
+    PrometheusFileExporter,
+)
+from src.deepseek_llm_node.core_logic.profiler import SamplingProfiler
+
+
+def _finished_call(registry, model="m", generated=10):
+    call = CallMetrics(model)
+    registry.record_phase("queue", [call], 0.002)
+    with registry.phase("tokenize", [call]):
+        pass
+    registry.record_phase("prefill", [call], 0.5)
+    registry.record_phase("decode", [call], 1.5)
+    call.prompt_tokens = 7
+    call.generated_tokens = generated
+    registry.record_call(call)
+    return call
+
+
+def test_calls_are_aggregated_per_model_and_phase():
+    registry = MetricsRegistry()
+    call = _finished_call(registry)
+    _finished_call(registry)
+
+    assert call.tokens_per_sec == 5.0
+    snapshot = registry.snapshot()["m"]
+    assert snapshot["calls"]["generate"]["calls"] == 2
+    assert snapshot["calls"]["generate"]["generated_tokens"] == 20
+    assert snapshot["phases"]["prefill"]["count"] == 2
+    assert snapshot["phases"]["decode"]["avg"] == 1.5
+    assert set(snapshot["phases"]) == {
+        "queue", "tokenize", "prefill", "decode", "total"
+    }
+    assert snapshot["tokens_per_sec"]["avg"] == 5.0
+
+
+def test_hooks_see_phases_and_calls():
+    seen = []
+
+    class Recorder(MetricsHook):
+        def on_phase(self, call, phase, seconds):
+            seen.append(phase)
+
+        def on_call(self, call):
+            seen.append("done")
+
+    registry = MetricsRegistry()
+    registry.add_hook(Recorder())
+    _finished_call(registry)
+    assert seen == ["queue", "tokenize", "prefill", "decode", "done"]
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    call = _finished_call(registry)
+    assert call.phases == {}
+    assert registry.snapshot() == {}
+
+
+def test_prometheus_export(tmp_path):
+    registry = MetricsRegistry()
+    path = tmp_path / "metrics.prom"
+    registry.add_hook(PrometheusFileExporter(registry, str(path), min_interval=0))
+    _finished_call(registry, model='a"b')
+
+    text = path.read_text()
+    assert 'deepseek_llm_calls_total{model="a\\"b",kind="generate"} 1' in text
+    assert (
+        'deepseek_llm_phase_seconds_bucket{model="a\\"b",phase="prefill",le="0.5"} 1'
+        in text
+    )
+    assert 'deepseek_llm_phase_seconds_count{model="a\\"b",phase="decode"} 1' in text
+
+
+def test_json_lines_export(tmp_path):
+    registry = MetricsRegistry()
+    path = tmp_path / "calls.jsonl"
+    registry.add_hook(JsonLinesExporter(str(path)))
+    _finished_call(registry)
+    _finished_call(registry, generated=4)
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["generated_tokens"] for line in lines] == [10, 4]
+    assert lines[0]["phases"]["prefill"] == 0.5
+
+
+def test_sampling_profiler_samples_named_threads():
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_loop, name="deepseek-batcher")
+    worker.start()
+    profiler = SamplingProfiler(interval_ms=1, thread_prefixes=("deepseek-batcher",))
+    profiler.start()
+    time.sleep(0.2)
+    profiler.stop()
+    stop.set()
+    worker.join()
+
+    assert profiler.stats()["samples"] > 0
+    functions = [frame for frame, _, _ in profiler.report(top=50)]
+    assert any(frame.startswith("busy_loop ") for frame in functions)
@@ -0,0 +1,88 @@
+import threading
+
+from src.deepseek_llm_node.core_logic.model_registry import ModelRegistry
+
+SIZES = {"small": 2, "medium": 5, "large": 8}
+
+
+class FakeManager:
+    def __init__(self, name):
+        self.name = name
+        self.is_loaded = False
+        self.load_count = 0
+
+    def load(self):
+        if not self.is_loaded:
+            self.is_loaded = True
+            self.load_count += 1
+        return f"{self.name}-tokenizer", f"{self.name}-model"
+
+    def unload(self):
+        self.is_loaded = False
+
+    def memory_footprint(self):
+        return SIZES[self.name] if self.is_loaded else 0
+
+
+def test_models_load_on_demand_and_are_reused():
+    registry = ModelRegistry(FakeManager)
+    assert registry.acquire("small") == ("small-tokenizer", "small-model")
+    registry.acquire("small")
+    assert registry.manager("small").load_count == 1
+    assert registry.stats()["hits"] == 1
+
+
+def test_least_recently_used_model_is_evicted_over_budget():
+    registry = ModelRegistry(FakeManager, memory_budget_bytes=10)
+    registry.acquire("small")
+    registry.acquire("medium")
+    registry.acquire("small")  # "medium" is now least recently used
+
+    registry.acquire("large")
+    assert list(registry.resident()) == ["small", "large"]
+    assert not registry.manager("medium").is_loaded
+
+    # Reloading "medium" makes room for its known size up front
+    registry.acquire("medium")
+    assert list(registry.resident()) == ["medium"]
+    assert registry.stats()["evictions"] == 3
+
+
+def test_pinned_models_are_not_evicted():
+    registry = ModelRegistry(FakeManager, memory_budget_bytes=10)
+    with registry.use("medium") as loaded:
+        assert loaded == ("medium-tokenizer", "medium-model")
+        registry.acquire("large")
+        # "medium" is in use, so the budget is exceeded instead
+        assert list(registry.resident()) == ["medium", "large"]
+        assert registry.stats()["pinned_models"] == ["medium"]
+
+    assert registry.stats()["pinned_models"] == []
+    registry.acquire("small")
+    assert list(registry.resident()) == ["large", "small"]
+
+
+def test_slow_load_does_not_block_other_models():
+    started, finish = threading.Event(), threading.Event()
+
+    class SlowManager(FakeManager):
+        def load(self):
+            if self.name == "large" and not self.is_loaded:
+                started.set()
+                finish.wait(5)
+            return super().load()
+
+    registry = ModelRegistry(SlowManager)
+    registry.acquire("small")
+    loader = threading.Thread(target=registry.acquire, args=("large",))
+    loader.start()
+    assert started.wait(5)
+
+    # Served while "large" is still loading
+    assert registry.acquire("small") == ("small-tokenizer", "small-model")
+    registry.acquire("medium")
+    assert "large" not in registry.resident()
+
+    finish.set()
+    loader.join(5)
+    assert list(registry.resident()) == ["small", "medium", "large"]
@@ -0,0 +1,48 @@
+from src.deepseek_llm_node.core_logic.prefix_cache import PrefixCache
+
+
+def test_registered_prefix_is_cached_and_reused():
+    cache = PrefixCache()
+    cache.register("m", [1, 2, 3])
+    prompt = [1, 2, 3, 4, 5]
+
+    assert cache.lookup("m", prompt) == (0, None)
+    assert cache.observe("m", prompt) == 3
+    cache.put("m", [1, 2, 3], "state", nbytes=10)
+
+    assert cache.observe("m", prompt) == 0
+    assert cache.lookup("m", prompt) == (3, "state")
+    # Another model never sees the state
+    assert cache.lookup("other", prompt) == (0, None)
+
+
+def test_frequent_block_aligned_prefixes_are_promoted():
+    cache = PrefixCache(block_size=2, promote_after=2)
+    assert cache.observe("m", [7, 8, 9, 1]) == 0
+    assert cache.observe("m", [7, 8, 9, 2]) == 2
+    assert cache.observe("m", [7, 8, 5, 6, 3]) == 2
+
+
+def test_eviction_respects_byte_budget():
+    cache = PrefixCache(max_bytes=15)
+    cache.put("m", [1], "a", nbytes=10)
+    cache.put("m", [2], "b", nbytes=10)
+    assert cache.lookup("m", [1, 0]) == (0, None)
+    assert cache.lookup("m", [2, 0]) == (1, "b")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_repeated_long_prompt_reuses_its_prefix(tiny_model, monkeypatch):
+    from src.deepseek_llm_node.core_logic import deepseek_utils
+
+    monkeypatch.setattr(deepseek_utils, "response_cache_enabled", False)
+    prompt = " ".join(["the video frame shows a quiet city"] * 20)
+    options = {"model": tiny_model, "do_sample": False, "max_new_tokens": 4}
+    results = [
+        deepseek_utils.run_deepseek_inference(prompt, **options) for _ in range(3)
+    ]
+
+    # Later runs resume from the cached prefix and decode the same tokens
+    assert results[1] == results[2] == results[0]
+    stats = deepseek_utils.get_prefix_cache_stats()
+    assert stats["entries"] >= 1 and stats["hits"] >= 1
@@ -0,0 +1,75 @@
+import pytest
+import torch
+from torch import nn
+
+from src.deepseek_llm_node.core_logic.quantization import (
+    WeightOnlyInt4Linear,
+    WeightOnlyInt8Linear,
+    load_quantized_model,
+    quantize_model,
+    save_quantized_model,
+)
+
+
+@pytest.mark.parametrize(
+    "precision, layer_type, tolerance",
+    [
+        ("int8-weight", WeightOnlyInt8Linear, 0.05),
+        ("int4-weight", WeightOnlyInt4Linear, 0.3),
+    ],
+)
+def test_weight_only_quantization_stays_close(precision, layer_type, tolerance):
+    torch.manual_seed(0)
+    model = nn.Sequential(nn.Linear(256, 64), nn.ReLU(), nn.Linear(64, 8))
+    x = torch.randn(4, 256)
+    expected = model(x)
+
+    quantized = quantize_model(model, precision, skip_modules=())
+    assert isinstance(quantized[0], layer_type)
+
+    error = (quantized(x) - expected).abs().max() / expected.abs().max()
+    assert error < tolerance
+
+
+@pytest.mark.parametrize("precision", ["int8-weight", "int4-weight"])
+def test_quantized_artifact_roundtrip(tmp_path, precision):
+    def build_model():
+        return nn.Sequential(nn.Linear(128, 16), nn.ReLU(), nn.Linear(16, 4))
+
+    torch.manual_seed(0)
+    model = quantize_model(build_model(), precision, skip_modules=())
+    save_quantized_model(model, str(tmp_path), "tiny", precision)
+    # Plain tensors and JSON only, nothing that is unpickled on load
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "meta.json", "model.safetensors"
+    ]
+
+    loaded = load_quantized_model(str(tmp_path), "tiny", precision, build_model)
+    assert type(loaded[0]) is type(model[0])
+    assert torch.equal(loaded[0].qweight, model[0].qweight)
+    x = torch.randn(2, 128)
+    assert torch.equal(loaded(x), model(x))
+    # Artifacts for another precision are never reused
+    other = "int4-weight" if precision == "int8-weight" else "int8-weight"
+    assert load_quantized_model(str(tmp_path), "tiny", other, build_model) is None
+
+
+def test_quantized_tiny_model_is_rebuilt_from_its_artifact(tiny_model, tmp_path):
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    def build_model():
+        config = AutoConfig.from_pretrained(tiny_model)
+        return AutoModelForCausalLM.from_config(config, torch_dtype=torch.bfloat16)
+
+    model = AutoModelForCausalLM.from_pretrained(
+        tiny_model, torch_dtype=torch.bfloat16
+    )
+    model = quantize_model(model, "int8-weight")
+    save_quantized_model(model, str(tmp_path), "tiny", "int8-weight")
+    loaded = load_quantized_model(str(tmp_path), "tiny", "int8-weight", build_model)
+
+    input_ids = torch.tensor([[1, 5, 9, 13]])
+    with torch.no_grad():
+        assert torch.equal(
+            loaded(input_ids).logits, model(input_ids).logits
+        )
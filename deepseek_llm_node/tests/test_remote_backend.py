@@ -0,0 +1,162 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.deepseek_llm_node.core_logic.generation_config import GenerationConfig
+from src.deepseek_llm_node.core_logic.metrics import MetricsRegistry
+from src.deepseek_llm_node.core_logic.remote_backend import (
+    OpenAICompatibleBackend,
+    RemoteBackendError,
+)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible completions endpoint."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests.append((self.path, payload, self.client_address))
+            failing = server.failures > 0
+            server.failures -= failing
+
+        if failing:
+            self._send(503, {"error": "busy"}, retry_after="0")
+        elif self.path == "/v1/chat/completions":
+            last = payload["messages"][-1]["content"]
+            self._send(200, {
+                "choices": [{"message": {"role": "assistant", "content": last[::-1]}}]
+            })
+        elif payload.get("stream"):
+            self._stream(payload["prompt"].split())
+        else:
+            self._send(200, {
+                "choices": [{"text": payload["prompt"].upper()}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 5},
+            })
+
+    def _send(self, status, body, retry_after=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if retry_after is not None:
+            self.send_header("Retry-After", retry_after)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, words):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = [{"choices": [{"text": word}]} for word in words]
+        events.append({"choices": [], "usage": {"completion_tokens": len(words)}})
+        for event in events:
+            self._chunk(f"data: {json.dumps(event)}\n\n".encode())
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def _chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.failures = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _backend(server, **kwargs):
+    host, port = server.server_address
+    return OpenAICompatibleBackend(f"http://{host}:{port}/v1", backoff=0.01, **kwargs)
+
+
+def test_completions_reuse_keep_alive_connections(server):
+    backend = _backend(server)
+    config = GenerationConfig(do_sample=False, max_new_tokens=8, stop_strings=("X",))
+
+    assert backend.generate("hello", config, "m") == "HELLO"
+    assert backend.generate("again", config, "m") == "AGAIN"
+
+    path, payload, _ = server.requests[0]
+    assert path == "/v1/completions"
+    assert payload["temperature"] == 0.0
+    assert payload["max_tokens"] == 8
+    assert payload["stop"] == ["X"]
+    # Both requests went over the same pooled connection
+    assert len({address for _, _, address in server.requests}) == 1
+    assert backend.stats()["connections_created"] == 1
+
+
+def test_streaming_yields_chunks_and_records_metrics(server):
+    metrics = MetricsRegistry()
+    backend = _backend(server, metrics=metrics)
+
+    chunks = list(backend.stream("a b c", GenerationConfig(), "m"))
+    assert chunks == ["a", "b", "c"]
+    # The drained stream leaves the connection reusable
+    assert backend.generate("x", GenerationConfig(), "m") == "X"
+    assert backend.stats()["connections_created"] == 1
+
+    calls = metrics.snapshot()["m"]["calls"]
+    assert calls["remote-stream"]["generated_tokens"] == 3
+    assert calls["remote"]["prompt_tokens"] == 3
+
+
+def test_transient_failures_are_retried(server):
+    server.failures = 2
+    backend = _backend(server)
+    assert backend.generate("ok", GenerationConfig(), "m") == "OK"
+    assert backend.stats()["retries"] == 2
+
+    server.failures = 5
+    with pytest.raises(RemoteBackendError) as excinfo:
+        _backend(server, max_retries=1).generate("ok", GenerationConfig(), "m")
+    assert excinfo.value.status == 503
+
+
+def test_chat_and_bounded_concurrency(server):
+    backend = _backend(server, max_concurrency=2)
+    messages = [{"role": "user", "content": "abc"}]
+    assert backend.chat(messages, GenerationConfig(), "m") == "cba"
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda i=i: results.append(
+                backend.generate(f"p{i}", GenerationConfig(), "m")
+            )
+        )
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == sorted(f"P{i}" for i in range(8))
+    assert backend.stats()["connections_created"] <= 2
+
+
+def test_unreachable_server_fails_after_retries():
+    backend = OpenAICompatibleBackend(
+        "http://127.0.0.1:9/v1", max_retries=1, backoff=0.01, timeout=2
+    )
+    with pytest.raises(RemoteBackendError):
+        backend.generate("x", GenerationConfig(), "m")
+    assert backend.stats()["failed"] == 1
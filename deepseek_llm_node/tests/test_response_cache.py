@@ -0,0 +1,70 @@
+from src.deepseek_llm_node.core_logic.response_cache import (
+    ResponseCache,
+    make_cache_key,
+)
+
+
+def test_cache_key_depends_on_every_input():
+    base = make_cache_key("m", "hello", {"max_new_tokens": 8}, seed=1)
+    assert base == make_cache_key("m", "hello", {"max_new_tokens": 8}, seed=1)
+    assert base != make_cache_key("m", "hello", {"max_new_tokens": 8}, seed=2)
+    assert base != make_cache_key("m", "hello", {"max_new_tokens": 9}, seed=1)
+    assert base != make_cache_key("other", "hello", {"max_new_tokens": 8}, seed=1)
+    # Responses of other weights, e.g. after switching to int4, are not reused
+    fp16 = make_cache_key("m", "hello", {}, weights={"precision": "fp16"})
+    int4 = make_cache_key("m", "hello", {}, weights={"precision": "int4-weight"})
+    assert fp16 != int4
+
+
+def test_memory_lru_respects_byte_budget():
+    cache = ResponseCache(memory_budget_bytes=30)
+    cache.put("a", "x" * 10)
+    cache.put("b", "y" * 10)
+    assert cache.get("a") == "x" * 10
+    # "b" is now the least recently used entry and gets evicted
+    cache.put("c", "z" * 10)
+    assert cache.get("b") is None
+    assert cache.get("c") == "z" * 10
+    stats = cache.stats()
+    assert stats["memory_evictions"] == 1
+    assert stats["memory_hits"] == 2
+    assert stats["misses"] == 1
+
+
+def test_disk_tier_persists_across_instances(tmp_path):
+    cache = ResponseCache(disk_dir=str(tmp_path))
+    cache.put("k", "response")
+
+    reopened = ResponseCache(disk_dir=str(tmp_path))
+    assert reopened.get("k") == "response"
+    assert reopened.stats()["disk_hits"] == 1
+    # Promoted into memory on the first hit
+    assert reopened.get("k") == "response"
+    assert reopened.stats()["memory_hits"] == 1
+
+
+def test_disk_tier_serves_entries_evicted_from_memory(tmp_path):
+    cache = ResponseCache(memory_budget_bytes=20, disk_dir=str(tmp_path))
+    # Requests look the cache up before generating, on an empty directory
+    assert cache.get("a") is None
+    cache.put("a", "x" * 10)
+    cache.put("b", "y" * 10)
+    assert cache.stats()["memory_entries"] == 1
+    assert cache.get("a") == "x" * 10
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_respects_byte_budget(tmp_path):
+    cache = ResponseCache(disk_dir=str(tmp_path), disk_budget_bytes=300)
+    for i in range(20):
+        assert cache.get(f"k{i}") is None
+        cache.put(f"k{i}", "response %02d" % i)
+
+    stats = cache.stats()
+    assert 0 < stats["disk_bytes"] <= 300
+    assert stats["disk_evictions"] == 20 - stats["disk_entries"]
+    files = list(tmp_path.iterdir())
+    assert len(files) == stats["disk_entries"]
+    assert sum(f.stat().st_size for f in files) == stats["disk_bytes"]
+    # The most recent entries are the ones kept
+    assert ResponseCache(disk_dir=str(tmp_path)).get("k19") == "response 19"
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from src.deepseek_llm_node.core_logic.snapshot import (
+    COMPLETE_MARKER,
+    ensure_snapshot,
+    snapshot_path,
+    weights_fingerprint,
+)
+
+
+def _fake_download(files):
+    calls = []
+
+    def download(model_name, target):
+        calls.append(model_name)
+        for name in files:
+            with open(os.path.join(target, name), "w") as f:
+                f.write("{}")
+
+    return download, calls
+
+
+def test_snapshot_is_downloaded_once(tmp_path):
+    download, calls = _fake_download(["config.json", "model.safetensors"])
+    root = str(tmp_path)
+
+    path = ensure_snapshot("org/model", root, download=download)
+    assert path == snapshot_path(root, "org/model")
+    assert os.path.exists(os.path.join(path, "model.safetensors"))
+    assert os.path.exists(os.path.join(path, COMPLETE_MARKER))
+
+    assert ensure_snapshot("org/model", root, download=download) == path
+    assert calls == ["org/model"]
+    # No staging directories are left behind
+    assert os.listdir(root) == [os.path.basename(path)]
+
+
+def test_local_paths_and_missing_safetensors(tmp_path):
+    download, calls = _fake_download(["pytorch_model.bin"])
+    local = str(tmp_path)
+    assert ensure_snapshot(local, str(tmp_path / "snapshots"), download) == local
+    assert calls == []
+
+    root = tmp_path / "snapshots"
+    with pytest.raises(ValueError):
+        ensure_snapshot("org/model", str(root), download=download)
+    assert os.listdir(root) == []
+
+
+def test_weights_fingerprint_follows_the_weight_files(tmp_path):
+    assert weights_fingerprint(str(tmp_path / "missing")) is None
+    (tmp_path / "config.json").write_text("{}")
+    (tmp_path / "model.safetensors").write_bytes(b"a" * 8)
+    first = weights_fingerprint(str(tmp_path))
+    assert weights_fingerprint(str(tmp_path)) == first
+
+    (tmp_path / "README.md").write_text("notes")
+    assert weights_fingerprint(str(tmp_path)) == first
+    (tmp_path / "model.safetensors").write_bytes(b"b" * 16)
+    assert weights_fingerprint(str(tmp_path)) != first
@@ -0,0 +1,22 @@
+import pytest
+
+from src.deepseek_llm_node.core_logic.truncation import truncate_tokens
+
+
+def test_policies_keep_the_requested_part():
+    ids = list(range(10))
+    assert truncate_tokens(ids, 20) == ids
+    assert truncate_tokens(ids, 4, "tail") == [6, 7, 8, 9]
+    assert truncate_tokens(ids, 4, "head") == [0, 1, 2, 3]
+    assert truncate_tokens(ids, 5, "middle") == [0, 1, 2, 8, 9]
+    # The beginning-of-sequence token survives every policy
+    assert truncate_tokens(ids, 4, "tail", keep_prefix=1) == [0, 7, 8, 9]
+    assert truncate_tokens(ids, 4, "middle", keep_prefix=1) == [0, 1, 2, 9]
+
+
+def test_error_policy_and_empty_budget():
+    with pytest.raises(ValueError):
+        truncate_tokens(list(range(10)), 4, "error")
+    assert truncate_tokens([1, 2], 4, "error") == [1, 2]
+    with pytest.raises(ValueError):
+        truncate_tokens(list(range(10)), 1, "tail", keep_prefix=1)
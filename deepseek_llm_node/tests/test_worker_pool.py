@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import pytest
+
+from src.deepseek_llm_node.core_logic.cancellation import CancellationToken
+from src.deepseek_llm_node.core_logic.worker_pool import (
+    WorkerCrashedError,
+    WorkerPool,
+    WorkerRequestError,
+)
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(2, handler="tests.worker_pool_handler", start_timeout=60)
+    yield pool
+    pool.shutdown()
+
+
+def test_requests_run_in_worker_processes(pool):
+    futures = [pool.generate(f"p{i}", None, "m") for i in range(6)]
+    results = [future.result(timeout=30) for future in futures]
+
+    assert [r.split(":")[1] for r in results] == [f"P{i}" for i in range(6)]
+    pids = {worker["pid"] for worker in pool.stats()["workers"]}
+    assert {int(r.split(":")[2]) for r in results} <= pids
+    assert asyncio.run(pool.agenerate("x", None, "m")).startswith("m:X:")
+
+
+def test_streaming_and_remote_errors(pool):
+    assert list(pool.stream("a b c", None, "m")) == ["a", "b", "c"]
+    with pytest.raises(WorkerRequestError, match="ValueError: bad prompt"):
+        pool.generate("fail", None, "m").result(timeout=30)
+
+
+class _PolledToken(CancellationToken):
+    # Like ComfyUI's interrupt token: never cancelled through `cancel`
+    flag = False
+
+    @property
+    def cancelled(self):
+        return self.flag
+
+
+def _wait_until_idle(pool):
+    for _ in range(200):
+        if all(w["pending"] == 0 for w in pool.stats()["workers"]):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_cancellation_reaches_the_worker(pool):
+    token = CancellationToken()
+    future = pool.generate("wait", None, "m", cancel_token=token)
+    token.cancel()
+    assert future.result(timeout=30) == "stopped"
+
+    polled = _PolledToken()
+    future = pool.generate("wait", None, "m", cancel_token=polled)
+    polled.flag = True
+    assert future.result(timeout=30) == "stopped"
+
+    # The stream ends once cancelled instead of running to completion
+    token = CancellationToken()
+    chunks = []
+    for chunk in pool.stream("forever", None, "m", cancel_token=token):
+        chunks.append(chunk)
+        token.cancel()
+    assert 1 <= len(chunks) < 1000
+
+
+def test_closing_a_stream_stops_the_worker(pool):
+    stream = pool.stream("forever", None, "m")
+    assert next(stream) == "x"
+    stream.close()
+    assert _wait_until_idle(pool)
+
+
+def test_async_stream(pool):
+    async def collect():
+        return [chunk async for chunk in pool.astream("a b c", None, "m")]
+
+    async def first_chunk():
+        stream = pool.astream("forever", None, "m")
+        chunk = await stream.__anext__()
+        await stream.aclose()
+        return chunk
+
+    assert asyncio.run(collect()) == ["a", "b", "c"]
+    assert asyncio.run(first_chunk()) == "x"
+    assert _wait_until_idle(pool)
+
+
+def test_chat_sessions_stay_on_their_worker(pool):
+    reply, session = pool.chat("hi")
+    pid = reply.split("@")[1]
+    for _ in range(4):
+        reply, session = pool.chat("again", session)
+        assert reply.split("@")[1] == pid
+    assert pool.end_chat(session)
+    assert not pool.end_chat(session)
+
+
+def test_crashed_worker_fails_its_requests_and_restarts(pool):
+    with pytest.raises(WorkerCrashedError):
+        pool.generate("crash", None, "m").result(timeout=30)
+
+    # The replacement comes up and serves requests again
+    for _ in range(100):
+        stats = pool.stats()
+        if stats["restarts"] == 1 and all(w["alive"] for w in stats["workers"]):
+            break
+        time.sleep(0.05)
+    assert pool.stats()["restarts"] == 1
+    assert pool.generate("ok", None, "m").result(timeout=30).startswith("m:OK")
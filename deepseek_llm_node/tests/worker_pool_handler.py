@@ -0,0 +1,35 @@
+"""Stand-in for deepseek_utils inside the worker processes of the tests."""
+import os
+import time
+
+
+def run_deepseek_inference(prompt, config=None, model=None, cancel_token=None):
+    if prompt == "crash":
+        os._exit(3)
+    if prompt == "fail":
+        raise ValueError("bad prompt")
+    if prompt == "wait":
+        # Runs until the client cancels it
+        while not cancel_token.cancelled:
+            time.sleep(0.01)
+        return "stopped"
+    return f"{model}:{prompt.upper()}:{os.getpid()}"
+
+
+def stream_deepseek_inference(prompt, config=None, model=None, cancel_token=None):
+    if prompt == "forever":
+        for _ in range(1000):
+            if cancel_token.cancelled:
+                return
+            yield "x"
+            time.sleep(0.01)
+        return
+    yield from prompt.split()
+
+
+def run_chat_turn(message, session_id=None, **kwargs):
+    return f"{message}@{os.getpid()}", session_id or f"session-{os.getpid()}"
+
+
+def end_chat_session(session_id):
+    return True
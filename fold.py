@@ -2,8 +2,57 @@
 
 import os
 import sys
+import json
+import time
+import shutil
+import difflib
+import hashlib
+import platform
+import functools
 import textwrap
 import argparse
+import threading
+import subprocess
+from string import Template
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# How project virtual environments are made from the shared, pre-built base
+# environment: a hardlinked copy of it, an empty environment that imports the
+# base's packages through a .pth file, or a fresh install from scratch
+VENV_MODES = ("clone", "layer", "fresh")
+
+# Shared base environments and the wheel cache live here
+DEFAULT_CACHE_DIR = os.environ.get(
+    "FOLD_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "fold")
+)
+
+# Built-in template sets, one directory each. Every file ending in .tmpl is
+# rendered with string.Template; its path may use the same variables
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fold_templates")
+TEMPLATE_SUFFIX = ".tmpl"
+DEFAULT_TEMPLATE = "video"
+
+# Per-project options a manifest may set, with their defaults
+PROJECT_OPTIONS = {
+    "requirements": False,
+    "venv": False,
+    "force": False,
+    "venv_mode": "clone",
+    "template": None,
+}
+
+# Serializes building the same base environment from several threads
+_base_locks = {}
+_base_locks_guard = threading.Lock()
+
+# Records the hash of every generated file, so that --update can tell
+# template changes from the user's own edits
+FOLD_MANIFEST = ".fold"
 
 def main():
     parser = argparse.ArgumentParser(
@@ -34,8 +83,21 @@ def main():
     
     parser.add_argument(
         "project_name",
+        nargs="?",
         help="Name of the project to create. Will be used as the root directory name."
     )
+
+    parser.add_argument(
+        "-m", "--manifest",
+        help="Create every project listed in a JSON, TOML or YAML manifest instead"
+    )
+
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=os.cpu_count() or 4,
+        help="Number of projects created in parallel in manifest mode"
+    )
     
     parser.add_argument(
         "-f", "--force",
@@ -43,6 +105,37 @@ def main():
         help="Overwrite existing project directory if it exists"
     )
 
+    parser.add_argument(
+        "-t", "--template",
+        help=f"Template set to generate the project from (default: {DEFAULT_TEMPLATE}, "
+             "or the one recorded in the project with --update)"
+    )
+
+    parser.add_argument(
+        "--template-dir",
+        action="append",
+        default=[],
+        help="Directory with additional template sets, searched before the built-in ones; can be repeated"
+    )
+
+    parser.add_argument(
+        "--list-templates",
+        action="store_true",
+        help="List the available template sets and exit"
+    )
+
+    parser.add_argument(
+        "-u", "--update",
+        action="store_true",
+        help="Re-apply the templates to an existing project, keeping files you have edited"
+    )
+
+    parser.add_argument(
+        "-n", "--dry-run",
+        action="store_true",
+        help="With --update, only show the changes as a diff"
+    )
+
     parser.add_argument(
         "-r", "--requirements",
         action="store_true",
@@ -55,53 +148,226 @@ def main():
         help="Create and initialize a virtual environment"
     )
 
+    parser.add_argument(
+        "--venv-mode",
+        choices=VENV_MODES,
+        default="clone",
+        help="Derive the virtual environment from a cached base environment by "
+             "hardlinking (clone) or .pth layering (layer), or install it from "
+             "scratch (fresh)"
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help="Directory for the cached base environments and wheels"
+    )
+
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Install only from the local wheel cache, never from the package index"
+    )
+
     args = parser.parse_args()
+    template_dirs = tuple(args.template_dir)
+
+    if args.list_templates:
+        for name, description in list_template_sets(template_dirs):
+            print(f"{name:20s} {description}")
+        return
+
+    if args.manifest:
+        # Command-line flags act as defaults for the manifest's projects
+        defaults = {
+            "requirements": args.requirements,
+            "venv": args.venv,
+            "force": args.force,
+            "venv_mode": args.venv_mode,
+        }
+        if args.template:
+            defaults["template"] = args.template
+        try:
+            projects = load_manifest(args.manifest, defaults)
+        except (OSError, ValueError, ImportError) as e:
+            print(f"Error: Cannot read manifest '{args.manifest}': {e}")
+            sys.exit(1)
+        results = create_scaffolds(projects, jobs=args.jobs,
+                                   cache_dir=args.cache_dir, offline=args.offline,
+                                   update=args.update, dry_run=args.dry_run,
+                                   template_dirs=template_dirs)
+        sys.exit(0 if all(error is None for _, _, error in results) else 1)
+
+    if not args.project_name:
+        parser.error("a project name or --manifest is required")
+
+    if args.update:
+        try:
+            update_scaffold(args.project_name,
+                            include_requirements=args.requirements,
+                            template=args.template,
+                            template_dirs=template_dirs,
+                            force=args.force,
+                            dry_run=args.dry_run)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return
 
     # Check if directory exists and handle force flag
     if os.path.exists(args.project_name) and not args.force:
         print(f"Error: Directory '{args.project_name}' already exists. Use --force to overwrite.")
         sys.exit(1)
     
-    create_scaffold(args.project_name, 
-                   include_requirements=args.requirements,
-                   create_venv=args.venv)
+    try:
+        create_scaffold(args.project_name, 
+                       include_requirements=args.requirements,
+                       create_venv=args.venv,
+                       venv_mode=args.venv_mode,
+                       cache_dir=args.cache_dir,
+                       offline=args.offline,
+                       template=args.template or DEFAULT_TEMPLATE,
+                       template_dirs=template_dirs)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+def load_manifest(path: str, defaults: dict = None):
+    """
+    Reads the projects to create from a manifest file. The format follows
+    the file extension: .json, .toml, or .yaml/.yml (needs PyYAML).
 
-def create_scaffold(project_name: str, include_requirements: bool = False, create_venv: bool = False):
+    The manifest is either a list of projects or a table with a "projects"
+    list and optional "defaults". A project is a name or a table with a
+    "name" and any of the PROJECT_OPTIONS, e.g. in YAML:
+
+        defaults:
+          requirements: true
+        projects:
+          - my_node
+          - name: other_node
+            venv: true
+
+    Returns a list of dicts with the name and every option.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    elif extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    elif extension in (".yaml", ".yml"):
+        import yaml
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f)
+    else:
+        raise ValueError(f"unsupported manifest format '{extension}'")
+
+    options = dict(PROJECT_OPTIONS, **(defaults or {}))
+    if isinstance(data, dict):
+        options.update(data.get("defaults", {}))
+        data = data.get("projects")
+    if not isinstance(data, list):
+        raise ValueError("expected a list of projects")
+
+    projects = []
+    for index, entry in enumerate(data):
+        if not isinstance(entry, (str, dict)):
+            raise ValueError(f"project {index}: expected a name or a table, got {entry!r}")
+        project = dict(options)
+        project.update({"name": entry} if isinstance(entry, str) else entry)
+        unknown = set(project) - set(PROJECT_OPTIONS) - {"name"}
+        if unknown:
+            raise ValueError(f"unknown project options: {', '.join(sorted(unknown))}")
+        if not project.get("name"):
+            raise ValueError(f"project without a name: {entry!r}")
+        if project["venv_mode"] not in VENV_MODES:
+            raise ValueError(f"venv_mode must be one of {', '.join(VENV_MODES)}")
+        projects.append(project)
+
+    names = [project["name"] for project in projects]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"projects listed more than once: {', '.join(duplicates)}")
+    return projects
+
+def create_scaffolds(projects, jobs: int = 4, cache_dir: str = DEFAULT_CACHE_DIR,
+                     offline: bool = False, update: bool = False, dry_run: bool = False,
+                     template_dirs=()):
+    """
+    Creates several project scaffolds concurrently and prints how long each
+    one took. A failing project does not stop the others. Projects with the
+    same requirements share one cached base environment, and each template
+    set is compiled only once. With update, the existing projects are
+    updated instead (see update_scaffold).
+
+    Returns a list of (name, seconds, error) tuples in manifest order, where
+    error is None for projects created successfully.
+    """
+    def create(project):
+        start = time.perf_counter()
+        try:
+            if update:
+                update_scaffold(project["name"],
+                                include_requirements=project["requirements"],
+                                template=project["template"],
+                                template_dirs=template_dirs,
+                                force=project["force"],
+                                dry_run=dry_run)
+                return project["name"], time.perf_counter() - start, None
+            if os.path.exists(project["name"]) and not project["force"]:
+                raise FileExistsError(
+                    f"Directory '{project['name']}' already exists. Use force to overwrite."
+                )
+            create_scaffold(project["name"],
+                            include_requirements=project["requirements"],
+                            create_venv=project["venv"],
+                            venv_mode=project["venv_mode"],
+                            cache_dir=cache_dir,
+                            offline=offline,
+                            template=project["template"] or DEFAULT_TEMPLATE,
+                            template_dirs=template_dirs)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return project["name"], time.perf_counter() - start, error
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        results = list(executor.map(create, projects))
+    elapsed = time.perf_counter() - start
+
+    print("\nProject                         Seconds  Result")
+    for name, seconds, error in results:
+        print(f"{name:30s} {seconds:8.2f}  {error or 'ok'}")
+    failed = sum(1 for _, _, error in results if error is not None)
+    action = "updated" if update else "created"
+    print(f"\n{len(results) - failed} {action}, {failed} failed in {elapsed:.2f}s")
+    return results
+
+def create_scaffold(project_name: str, include_requirements: bool = False, create_venv: bool = False,
+                    venv_mode: str = "clone", cache_dir: str = DEFAULT_CACHE_DIR,
+                    offline: bool = False, template: str = DEFAULT_TEMPLATE,
+                    template_dirs=()):
     """
     Create an advanced ComfyUI custom-node project scaffold
     with Docker, GitHub Actions, pre-commit, tests, etc.
     """
-    # 1. Normalize the project name
-    safe_name = project_name.lower().replace("-", "_").replace(" ", "_")
-
-    # 2. Create directory structure
-    os.makedirs(project_name, exist_ok=True)
-    src_dir = os.path.join(project_name, "src", safe_name)
-    node_dir = os.path.join(src_dir, "comfyui_nodes")
-    logic_dir = os.path.join(src_dir, "core_logic")
-    tests_dir = os.path.join(project_name, "tests")
-    gh_actions_dir = os.path.join(project_name, ".github", "workflows")
-
-    for d in [src_dir, node_dir, logic_dir, tests_dir, gh_actions_dir]:
-        os.makedirs(d, exist_ok=True)
-
-    # 3. Create files
-    create_pyproject_toml(project_name, safe_name)
-    if include_requirements:
-        create_requirements_txt(project_name)
-    create_dockerfile(project_name)
-    create_gitignore(project_name)
-    create_precommit_config(project_name)
-    create_readme(project_name, safe_name)
-    create_license(project_name)
-    create_example_core_logic(logic_dir)
-    create_example_node_wrapper(node_dir, safe_name)
-    create_unit_test(tests_dir, safe_name)
-    create_integration_test(tests_dir, safe_name)
-    create_github_actions_ci(gh_actions_dir, safe_name)
+    files = render_scaffold(project_name, include_requirements, template, template_dirs)
+    for path, content in files.items():
+        write_file(os.path.join(project_name, path), content)
+    save_fold_manifest(project_name,
+                       {path: content_hash(content) for path, content in files.items()},
+                       {"requirements": include_requirements, "template": template})
 
     if create_venv:
-        setup_virtual_environment(project_name)
+        setup_virtual_environment(project_name, mode=venv_mode,
+                                  cache_dir=cache_dir, offline=offline)
 
     print(f"Project scaffold '{project_name}' created successfully.")
     if create_venv:
@@ -109,15 +375,287 @@ def create_scaffold(project_name: str, include_requirements: bool = False, creat
         print(f"  source {project_name}/venv/bin/activate  # For Unix/MacOS")
         print(f"  .\\{project_name}\\venv\\Scripts\\activate  # For Windows")
 
-def setup_virtual_environment(project_name: str):
+def find_template_set(name: str, template_dirs=()) -> str:
+    """
+    Returns the directory of a template set, looking in template_dirs
+    first and then in the built-in TEMPLATE_DIR.
+    """
+    for directory in tuple(template_dirs) + (TEMPLATE_DIR,):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            return path
+    raise ValueError(f"unknown template set '{name}'")
+
+def list_template_sets(template_dirs=()):
+    """
+    Returns (name, description) for every template set that can be used,
+    user-supplied ones shadowing built-in ones of the same name.
+    """
+    sets = {}
+    for directory in (TEMPLATE_DIR,) + tuple(template_dirs)[::-1]:
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if os.path.isdir(os.path.join(directory, name)):
+                config = read_text(os.path.join(directory, name, "template.json"))
+                sets[name] = json.loads(config or "{}").get("description", "")
+    return sorted(sets.items())
+
+@functools.lru_cache(maxsize=None)
+def load_template_set(name: str, template_dirs=(), _chain=()):
+    """
+    Reads and compiles a template set once per process.
+
+    A set is a directory of files ending in .tmpl, laid out like the project
+    they generate. Its optional template.json may set:
+
+    - "description": shown by --list-templates
+    - "extends": the name of a set whose files are included unless this set
+      has a file of the same path
+    - "optional": {"<option>": ["<path>", ...]}, files generated only when
+      that project option (e.g. "requirements") is on
+
+    Returns a dict with "files", mapping each path to its compiled
+    (path, content) templates, and "optional", mapping paths to the option
+    they depend on.
+    """
+    if name in _chain:
+        raise ValueError(f"template set '{name}' extends itself")
+    root = find_template_set(name, template_dirs)
+    config = json.loads(read_text(os.path.join(root, "template.json")) or "{}")
+
+    template_set = {"files": {}, "optional": {}}
+    if config.get("extends"):
+        parent = load_template_set(config["extends"], template_dirs, _chain + (name,))
+        template_set["files"].update(parent["files"])
+        template_set["optional"].update(parent["optional"])
+    for option, paths in config.get("optional", {}).items():
+        template_set["optional"].update((path, option) for path in paths)
+
+    for directory, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if not filename.endswith(TEMPLATE_SUFFIX):
+                continue
+            source = os.path.join(directory, filename)
+            path = os.path.relpath(source, root)[:-len(TEMPLATE_SUFFIX)].replace(os.sep, "/")
+            template_set["files"][path] = (Template(path), Template(read_text(source)))
+    return template_set
+
+def render_scaffold(project_name: str, include_requirements: bool = False,
+                    template: str = DEFAULT_TEMPLATE, template_dirs=()):
+    """
+    Renders every file of a project scaffold without writing anything.
+
+    Templates may use ${project_name} and ${package_name}, the project name
+    normalized to a Python identifier. Returns a dict mapping paths relative
+    to the project directory (with forward slashes) to the file contents.
     """
-    Creates and initializes a virtual environment for the project
+    variables = {
+        "project_name": project_name,
+        "package_name": project_name.lower().replace("-", "_").replace(" ", "_"),
+    }
+    options = {"requirements": include_requirements}
+    template_set = load_template_set(template, tuple(template_dirs))
+
+    files = {}
+    for path, (path_template, content_template) in sorted(template_set["files"].items()):
+        option = template_set["optional"].get(path)
+        if option is not None and not options.get(option):
+            continue
+        try:
+            files[path_template.substitute(variables)] = content_template.substitute(variables)
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"cannot render {template}/{path}{TEMPLATE_SUFFIX}: "
+                             f"bad placeholder {e}") from None
+    return files
+
+def write_file(file_path: str, content: str):
     """
-    import subprocess
-    import platform
+    Writes a generated file, creating its directory.
+    """
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+def content_hash(content: str) -> str:
+    """SHA-256 of a file's text, independent of line endings."""
+    return hashlib.sha256(content.replace("\r\n", "\n").encode("utf-8")).hexdigest()
+
+def read_text(path: str):
+    """A file's text, or None if it does not exist."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def load_fold_manifest(project_name: str):
+    """The project's .fold manifest, or None for projects created without one."""
+    text = read_text(os.path.join(project_name, FOLD_MANIFEST))
+    return json.loads(text) if text is not None else None
 
+def save_fold_manifest(project_name: str, hashes: dict, options: dict):
+    """
+    Records the hash of every generated file and the options used (the
+    template set, whether requirements.txt is generated). The file is left
+    alone when nothing changed.
+    """
+    manifest = {
+        "options": options,
+        "files": dict(sorted(hashes.items())),
+    }
+    content = json.dumps(manifest, indent=2) + "\n"
+    path = os.path.join(project_name, FOLD_MANIFEST)
+    if read_text(path) != content:
+        write_file(path, content)
+
+def update_scaffold(project_name: str, include_requirements: bool = False,
+                    template: str = None, template_dirs=(),
+                    force: bool = False, dry_run: bool = False):
+    """
+    Re-applies the current templates to an existing project.
+
+    Each generated file is compared with the hash recorded in the project's
+    .fold manifest when it was last written:
+
+    - unchanged: the template output is what is on disk; not touched, so
+      its mtime (and Docker or pytest caches) stay valid
+    - update: the template changed and the file was not edited; rewritten
+    - create: a file the templates did not generate before
+    - edited: the file was edited but its template did not change; kept
+      unless force is set
+    - conflict: the file was edited (or predates the manifest) and the
+      template changed; kept unless force is set
+    - deleted: the file was removed; not recreated unless force is set
+    - orphaned: the file was generated before, but the templates no longer
+      produce it (e.g. after switching template sets); never deleted, and
+      its hash stays recorded until the file is removed
+
+    Options recorded in the manifest (like requirements) stay on, and the
+    recorded template set is used unless another one is given. With dry_run
+    nothing is written and the changes are printed as a diff.
+
+    Returns a dict mapping each file's path to its status.
+    """
+    if not os.path.isdir(project_name):
+        raise FileNotFoundError(f"Directory '{project_name}' does not exist")
+    manifest = load_fold_manifest(project_name) or {"options": {}, "files": {}}
+    recorded = manifest["files"]
+    include_requirements = include_requirements or manifest["options"].get("requirements", False)
+    template = template or manifest["options"].get("template", DEFAULT_TEMPLATE)
+
+    files = render_scaffold(project_name, include_requirements, template, template_dirs)
+    statuses = {}
+    hashes = {}
+    writes = []
+    report = []
+    for path, content in files.items():
+        current = read_text(os.path.join(project_name, path))
+        new_hash = content_hash(content)
+        if current is not None and content_hash(current) == new_hash:
+            status = "unchanged"
+        elif current is None:
+            status = "create" if path not in recorded else "deleted"
+        elif content_hash(current) == recorded.get(path):
+            status = "update"
+        elif new_hash == recorded.get(path):
+            status = "edited"
+        else:
+            status = "conflict"
+        statuses[path] = status
+
+        overwrite = status in ("update", "create") or (
+            force and status in ("edited", "conflict", "deleted"))
+        if overwrite:
+            writes.append(path)
+        if status == "unchanged" or overwrite:
+            hashes[path] = new_hash
+        elif path in recorded:
+            # Keep the old hash, so the file still counts as edited next time
+            hashes[path] = recorded[path]
+        if status != "unchanged":
+            report.append(f"{status:10s} {path}{'' if overwrite else ' (kept)'}")
+        if dry_run and status != "unchanged":
+            report.extend(line.rstrip("\n") for line in difflib.unified_diff(
+                (current or "").splitlines(True), content.splitlines(True),
+                fromfile=f"a/{path}", tofile=f"b/{path}"))
+
+    for path in sorted(set(recorded) - set(files)):
+        current = read_text(os.path.join(project_name, path))
+        if current is None:
+            # Removed by the user; forget it
+            continue
+        statuses[path] = "orphaned"
+        hashes[path] = recorded[path]
+        report.append(f"{'orphaned':10s} {path} (no longer generated; delete it if unused)")
+        if dry_run:
+            report.extend(line.rstrip("\n") for line in difflib.unified_diff(
+                current.splitlines(True), [], fromfile=f"a/{path}", tofile="/dev/null"))
+
+    unchanged = sum(1 for status in statuses.values() if status == "unchanged")
+    orphaned = sum(1 for status in statuses.values() if status == "orphaned")
+    header = f"{'Would update' if dry_run else 'Updated'} '{project_name}': {unchanged} unchanged, "
+    header += f"{len(writes)} written, {len(files) - unchanged - len(writes)} kept, "
+    header += f"{orphaned} orphaned"
+    print("\n".join([header] + report))
+    if dry_run:
+        return statuses
+
+    for path in writes:
+        write_file(os.path.join(project_name, path), files[path])
+    save_fold_manifest(project_name, hashes,
+                       {"requirements": include_requirements, "template": template})
+    return statuses
+
+def setup_virtual_environment(project_name: str, mode: str = "clone",
+                              cache_dir: str = DEFAULT_CACHE_DIR, offline: bool = False):
+    """
+    Creates and initializes a virtual environment for the project.
+
+    The requirements (requirements.txt and the dependencies in
+    pyproject.toml) are installed once into a base environment cached
+    under cache_dir and keyed by a hash of the requirements, the Python
+    version and the platform (see provision_base_environment). The project's
+    environment is then derived from it in seconds:
+
+    - clone: a copy of the base whose files are hardlinks; only scripts that
+      embed the environment's path are rewritten. Falls back to "layer" on
+      Windows, where the script launchers cannot be rewritten.
+    - layer: an empty environment whose .pth file puts the base's
+      site-packages on the import path. Packages installed into it shadow
+      the base's.
+    - fresh: a new environment with everything installed from scratch.
+
+    Only the project itself is installed (in editable mode) into the
+    derived environment; pip still checks its dependencies and fetches any
+    the base lacks.
+    """
     venv_path = os.path.join(project_name, "venv")
-    
+    requirements_path = os.path.join(project_name, "requirements.txt")
+    if not os.path.exists(requirements_path):
+        requirements_path = None
+
+    if mode != "fresh":
+        start = time.perf_counter()
+        requirements = sorted(set(read_requirements(requirements_path)
+                                  + read_project_dependencies(project_name)))
+        base_path = provision_base_environment(requirements, cache_dir, offline)
+        shutil.rmtree(venv_path, ignore_errors=True)
+        if mode == "clone" and os.name != "nt":
+            clone_environment(base_path, venv_path)
+        else:
+            layer_environment(base_path, venv_path)
+        # The base already holds the dependencies, so normally nothing is
+        # downloaded; the build backend comes from the base too
+        install = [venv_python(venv_path), "-m", "pip", "install", "--quiet",
+                   "--no-build-isolation", "--find-links", os.path.join(cache_dir, "wheels")]
+        if offline:
+            install.append("--no-index")
+        subprocess.run(install + ["-e", project_name], check=True)
+        print(f"Virtual environment for '{project_name}' ready in "
+              f"{time.perf_counter() - start:.1f}s ({mode} of {base_path})")
+        return
+
     # Create virtual environment
     subprocess.run([sys.executable, "-m", "venv", venv_path], check=True)
     
@@ -138,426 +676,138 @@ def setup_virtual_environment(project_name: str):
     # Install the project in editable mode
     subprocess.run([pip_path, "install", "-e", project_name], check=True)
 
-def create_requirements_txt(project_name: str):
-    """
-    Creates a requirements.txt file with common dependencies
-    """
-    content = textwrap.dedent("""\
-    # Core dependencies
-    torch>=2.0.0
-    numpy>=1.22.0
-    pillow>=9.0.0
-    
-    # Development dependencies
-    pytest>=7.0.0
-    pytest-mock>=3.10.0
-    flake8>=6.0.0
-    black>=23.7.0
-    mypy>=1.5.0
-    pre-commit>=3.3.0
-    
-    # Type stubs
-    types-Pillow>=9.0.0
-    """)
-    
-    file_path = os.path.join(project_name, "requirements.txt")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def create_pyproject_toml(project_name: str, package_name: str):
-    """
-    Creates a pyproject.toml with:
-    - basic project metadata
-    - pinned dev dependencies for linting, testing, etc.
-    """
-    content = textwrap.dedent(f"""\
-    [build-system]
-    requires = ["setuptools>=42", "wheel"]
-    build-backend = "setuptools.build_meta"
-
-    [project]
-    name = "{package_name}"
-    version = "0.1.0"
-    description = "Advanced scaffold for a ComfyUI custom-node project."
-    authors = [{{ name = "Your Name", email = "you@example.com" }}]
-    readme = "README.md"
-    license = {{ file = "LICENSE" }}
-    requires-python = ">=3.8"
-    keywords = ["comfyui", "nodes", "example"]
-
-    [project.optional-dependencies]
-    dev = [
-      "pytest",
-      "pytest-mock",
-      "flake8",
-      "black",
-      "mypy",
-      "pre-commit"
-    ]
-
-    [tool.black]
-    line-length = 88
-    target-version = ['py38', 'py39', 'py310', 'py311']
-
-    [tool.flake8]
-    max-line-length = 88
-    extend-ignore = ["E203", "W503"]
-    """)
-    file_path = os.path.join(project_name, "pyproject.toml")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def create_dockerfile(project_name: str):
-    """
-    Creates a Dockerfile that installs Python, dependencies,
-    and the local custom node code.
-    """
-    content = textwrap.dedent("""\
-    FROM python:3.10-slim
-
-    # Install system deps (if needed)
-    # RUN apt-get update && apt-get install -y ...
-
-    # Create a working directory
-    WORKDIR /app
-
-    # Copy project files
-    COPY . /app
-
-    # Install dependencies
-    # This will install both the main project and the dev deps
-    RUN pip install --upgrade pip && pip install -e .[dev]
-
-    # Expose ComfyUI's default port (if you run it inside Docker)
-    EXPOSE 8188
-
-    # Optionally, you can run ComfyUI as an entrypoint
-    # but that depends on how you structure your environment
-    # ENTRYPOINT ["python", "run.py"]
-    """)
-    file_path = os.path.join(project_name, "Dockerfile")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def create_gitignore(project_name: str):
-    content = textwrap.dedent("""\
-    # Python
-    __pycache__/
-    *.py[cod]
-    .pytest_cache/
-
-    # Virtual env
-    venv/
-    .venv/
-    env/
-    .env/
-
-    # Distribution / packaging
-    build/
-    dist/
-    *.egg-info/
-
-    # MyPy
-    .mypy_cache/
-
-    # Docker
-    .dockerignore
-
-    # IDE / Editor settings
-    .vscode/
-    .idea/
-    """)
-    file_path = os.path.join(project_name, ".gitignore")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def create_precommit_config(project_name: str):
-    """
-    Configures pre-commit hooks to run black, flake8, mypy
-    before each commit.
-    """
-    content = textwrap.dedent("""\
-    repos:
-      - repo: https://github.com/psf/black
-        rev: 23.7.0
-        hooks:
-          - id: black
-            language_version: python3
-
-      - repo: https://github.com/pycqa/flake8
-        rev: 6.1.0
-        hooks:
-          - id: flake8
-
-      - repo: https://github.com/pre-commit/mirrors-mypy
-        rev: v1.5.1
-        hooks:
-          - id: mypy
-    """)
-    file_path = os.path.join(project_name, ".pre-commit-config.yaml")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def create_readme(project_name: str, package_name: str):
-    content = textwrap.dedent(f"""\
-    # {project_name}
-
-    An advanced scaffold for a ComfyUI custom-node project.  
-    This structure includes:
-    - Docker support
-    - GitHub Actions for CI
-    - pre-commit for linting & type checking
-    - Example Node with separate core logic
-    - Unit & Integration tests
-
-    ## Quickstart
-
-    1. **Create a virtual environment**:
-       ```bash
-       python -m venv .venv
-       source .venv/bin/activate
-       ```
-
-    2. **Install**:
-       ```bash
-       pip install -e .[dev]
-       pre-commit install
-       ```
-
-    3. **Run Tests**:
-       ```bash
-       pytest
-       ```
-
-    4. **Lint & Format**:
-       ```bash
-       black .
-       flake8 .
-       mypy .
-       ```
-
-    5. **Try Docker**:
-       ```bash
-       docker build -t {package_name}:latest .
-       docker run -p 8188:8188 {package_name}:latest
-       ```
-
-    ## Using the Node with ComfyUI
-
-    - You can copy or symlink `src/{package_name}/comfyui_nodes` into your ComfyUI `custom_nodes` folder.
-    - Or, run ComfyUI in an environment where this project is installed (so ComfyUI can discover the custom node).
-
-    ## Project Layout
-
-    ```
-    {project_name}/
-    ├─ Dockerfile
-    ├─ pyproject.toml
-    ├─ .pre-commit-config.yaml
-    ├─ .github/workflows/ci.yml
-    ├─ src/
-    │   └─ {package_name}/
-    │       ├─ core_logic/
-    │       │   └─ video_utils.py
-    │       └─ comfyui_nodes/
-    │           └─ example_node.py
-    ├─ tests/
-    │   ├─ test_core_logic.py
-    │   └─ test_integration.py
-    ├─ .gitignore
-    ├─ LICENSE
-    └─ README.md
-    ```
-
-    Modify and expand as needed!
-    """)
-    file_path = os.path.join(project_name, "README.md")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def create_license(project_name: str):
-    """
-    A simple MIT license placeholder.
-    """
-    content = textwrap.dedent("""\
-    MIT License
-
-    Copyright (c) 2023
-
-    Permission is hereby granted, free of charge, to any person obtaining a copy
-    of this software and associated documentation files (the "Software"), to deal
-    in the Software without restriction, including without limitation the rights
-    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
-    copies of the Software, and to permit persons to whom the Software is
-    furnished to do so, subject to the following conditions:
-
-    The above copyright notice and this permission notice shall be included in all
-    copies or substantial portions of the Software.
-
-    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
-    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
-    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
-    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
-    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
-    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
-    SOFTWARE.
-    """)
-    file_path = os.path.join(project_name, "LICENSE")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def create_example_core_logic(logic_dir: str):
-    """
-    Creates an example "video_utils.py" in core_logic to simulate
-    the logic separate from ComfyUI node code.
-    """
-    content = textwrap.dedent("""\
-    import os
-
-    def process_video(input_path: str) -> str:
-        \"\"\"Pretend to process a video, returning some result.\"\"\"
-        # For demonstration, we just echo the path. You'd place
-        # real video processing logic here.
-        if not os.path.exists(input_path):
-            raise FileNotFoundError(f"Video file not found: {input_path}")
-        return f"Processed: {input_path}"
-    """)
-    file_path = os.path.join(logic_dir, "video_utils.py")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
+def venv_python(venv_path: str) -> str:
+    """Path of the Python interpreter of a virtual environment."""
+    if platform.system() == "Windows":
+        return os.path.join(venv_path, "Scripts", "python.exe")
+    return os.path.join(venv_path, "bin", "python")
 
-def create_example_node_wrapper(node_dir: str, package_name: str):
-    """
-    Creates a ComfyUI node that wraps the core_logic function.
+def venv_site_packages(venv_path: str) -> str:
+    """site-packages directory of a virtual environment made by this Python."""
+    if platform.system() == "Windows":
+        return os.path.join(venv_path, "Lib", "site-packages")
+    version = f"python{sys.version_info[0]}.{sys.version_info[1]}"
+    return os.path.join(venv_path, "lib", version, "site-packages")
+
+def read_requirements(requirements_path: str = None):
+    """Requirement lines of a requirements file, without comments and blanks."""
+    if not requirements_path:
+        return []
+    with open(requirements_path, "r", encoding="utf-8") as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return sorted(line for line in lines if line)
+
+def read_project_dependencies(project_name: str):
+    """The [project].dependencies listed in the project's pyproject.toml."""
+    path = os.path.join(project_name, "pyproject.toml")
+    if not os.path.exists(path):
+        return []
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        import tomli as tomllib
+    with open(path, "rb") as f:
+        data = tomllib.load(f)
+    return list(data.get("project", {}).get("dependencies", []))
+
+def requirements_key(requirements) -> str:
+    """Hash identifying a base environment: requirements, Python and platform."""
+    blob = json.dumps({
+        "requirements": sorted(requirements),
+        "python": sys.version,
+        "executable": os.path.realpath(sys.executable),
+        "platform": platform.platform(),
+    }, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+def provision_base_environment(requirements=(),
+                               cache_dir: str = DEFAULT_CACHE_DIR,
+                               offline: bool = False) -> str:
     """
-    content = textwrap.dedent(f"""\
-    from {package_name}.core_logic.video_utils import process_video
-
-    class ExampleVideoNode:
-        @classmethod
-        def INPUT_TYPES(cls):
-            return {{
-                "required": {{
-                    "video_path": ("STRING",),
-                }}
-            }}
-
-        RETURN_TYPES = ("STRING",)
-        FUNCTION = "execute"
-        CATEGORY = "Custom/Video"
-        DESCRIPTION = "Example node that processes a video using core logic."
-
-        def execute(self, video_path: str):
-            # Use the core logic
-            result = process_video(video_path)
-            return (result,)
-    """)
-    file_path = os.path.join(node_dir, "example_node.py")
-    init_file = os.path.join(node_dir, "__init__.py")
-
-    # Ensure we have __init__.py
-    with open(init_file, "w", encoding="utf-8") as f:
-        f.write("# ComfyUI Node package\n")
+    Returns the cached base environment with the given requirements
+    installed, building it on first use. Builds are serialized between threads and, where fcntl is
+    available, between processes.
 
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def create_unit_test(tests_dir: str, package_name: str):
-    """
-    Creates a sample unit test for the core logic in 'video_utils'.
+    Packages are installed from the wheel cache in cache_dir/wheels. Online,
+    missing wheels are downloaded (or built) into it first; offline, the
+    package index is never contacted.
     """
-    content = textwrap.dedent(f"""\
-    import pytest
-    import os
-    from {package_name}.core_logic.video_utils import process_video
-
-    def test_process_video(tmp_path):
-        # Create a fake video file
-        dummy_video = tmp_path / "test.mp4"
-        dummy_video.write_text("fake video data")
-
-        # Test the process_video function
-        result = process_video(str(dummy_video))
-        assert "Processed:" in result
-        assert str(dummy_video) in result
-
-        # Check error handling
-        with pytest.raises(FileNotFoundError):
-            process_video("non_existent.mp4")
-    """)
-    file_path = os.path.join(tests_dir, "test_core_logic.py")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def create_integration_test(tests_dir: str, package_name: str):
+    requirements = sorted(requirements)
+    key = requirements_key(requirements)
+    base_path = os.path.join(cache_dir, "venvs", key)
+    marker = os.path.join(base_path, ".fold-complete")
+    wheels_dir = os.path.join(cache_dir, "wheels")
+    os.makedirs(wheels_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(base_path), exist_ok=True)
+
+    with _base_locks_guard:
+        lock = _base_locks.setdefault(key, threading.Lock())
+    with lock, open(base_path + ".lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if os.path.exists(marker):
+            return base_path
+
+        # Leftovers of an interrupted build cannot be trusted
+        shutil.rmtree(base_path, ignore_errors=True)
+        subprocess.run([sys.executable, "-m", "venv", base_path], check=True)
+        pip = [venv_python(base_path), "-m", "pip"]
+        packages = ["setuptools", "wheel"] + requirements
+        if not offline:
+            subprocess.run(pip + ["install", "--quiet", "--upgrade", "pip"], check=True)
+            # Fill the wheel cache; wheels already in it are not fetched again
+            subprocess.run(pip + ["wheel", "--quiet", "--wheel-dir", wheels_dir,
+                                  "--find-links", wheels_dir] + packages, check=True)
+        subprocess.run(pip + ["install", "--quiet", "--no-index",
+                              "--find-links", wheels_dir] + packages, check=True)
+
+        with open(marker, "w", encoding="utf-8") as f:
+            json.dump({"requirements": requirements}, f, indent=2)
+    return base_path
+
+def clone_environment(base_path: str, venv_path: str):
     """
-    Creates a minimal integration test that tests the ExampleVideoNode
-    in the context of ComfyUI-like usage. 
-    We won't fully spin up ComfyUI, but we can mock or stub as needed.
+    Copies a virtual environment using hardlinks, which takes no extra disk
+    space. Files that embed the environment's path (script shebangs,
+    activate scripts) get private, rewritten copies.
     """
-    content = textwrap.dedent(f"""\
-    import pytest
-    from {package_name}.comfyui_nodes.example_node import ExampleVideoNode
-
-    def test_example_node_integration(tmp_path):
-        # Create a fake video file
-        dummy_video = tmp_path / "test.mp4"
-        dummy_video.write_text("fake video data")
-
-        node = ExampleVideoNode()
-        result = node.execute(str(dummy_video))
-        assert "Processed: " in result[0]
-    """)
-    file_path = os.path.join(tests_dir, "test_integration.py")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def create_github_actions_ci(gh_actions_dir: str, package_name: str):
+    def link(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            # Different file system, or hardlinks not supported
+            shutil.copy2(src, dst)
+
+    shutil.copytree(base_path, venv_path, symlinks=True, copy_function=link,
+                    ignore=shutil.ignore_patterns(".fold-complete"))
+
+    old = os.path.abspath(base_path).encode()
+    new = os.path.abspath(venv_path).encode()
+    bin_dir = os.path.join(venv_path, "bin")
+    for name in os.listdir(bin_dir):
+        path = os.path.join(bin_dir, name)
+        if os.path.islink(path) or not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            content = f.read()
+        if old in content:
+            mode = os.stat(path).st_mode
+            # Replace the hardlink instead of writing through to the base
+            os.unlink(path)
+            with open(path, "wb") as f:
+                f.write(content.replace(old, new))
+            os.chmod(path, mode)
+
+def layer_environment(base_path: str, venv_path: str):
     """
-    Creates a basic GitHub Actions workflow (CI) that:
-    - Checks out code
-    - Sets up Python
-    - Installs dependencies
-    - Runs lint & tests
+    Creates an empty virtual environment on top of a base environment: a
+    .pth file adds the base's site-packages (including pip) to its path.
     """
-    content = textwrap.dedent(f"""\
-    name: CI
-
-    on:
-      push:
-        branches: [ "main" ]
-      pull_request:
-        branches: [ "main" ]
-
-    jobs:
-      build-test:
-        runs-on: ubuntu-latest
-        steps:
-          - uses: actions/checkout@v3
-
-          - name: Set up Python
-            uses: actions/setup-python@v4
-            with:
-              python-version: "3.10"
-
-          - name: Install dependencies
-            run: |
-              pip install --upgrade pip
-              pip install -e .[dev]
-
-          - name: Lint (black, flake8, mypy)
-            run: |
-              black --check .
-              flake8 .
-              mypy .
-
-          - name: Run tests
-            run: |
-              pytest --maxfail=1 --disable-warnings -q
-    """)
-    file_path = os.path.join(gh_actions_dir, "ci.yml")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
+    subprocess.run([sys.executable, "-m", "venv", "--without-pip", venv_path], check=True)
+    site_packages = venv_site_packages(venv_path)
+    os.makedirs(site_packages, exist_ok=True)
+    with open(os.path.join(site_packages, "_fold_base.pth"), "w", encoding="utf-8") as f:
+        f.write(os.path.abspath(venv_site_packages(base_path)) + "\n")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fold  # noqa: E402
+
+
+def write_manifest(tmp_path, data, name="projects.json"):
+    path = tmp_path / name
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return str(path)
+
+
+def test_manifest_defaults_and_overrides(tmp_path):
+    path = write_manifest(tmp_path, {
+        "defaults": {"requirements": True},
+        "projects": ["a", {"name": "b", "venv": True, "requirements": False}],
+    })
+    a, b = fold.load_manifest(path, {"force": True})
+    assert a == dict(fold.PROJECT_OPTIONS, name="a", requirements=True, force=True)
+    assert (b["venv"], b["requirements"], b["force"]) == (True, False, True)
+
+
+def test_manifest_toml(tmp_path):
+    pytest.importorskip("tomllib" if sys.version_info >= (3, 11) else "tomli")
+    path = tmp_path / "projects.toml"
+    path.write_text('projects = ["a", { name = "b", template = "llm" }]\n')
+    assert [p["template"] for p in fold.load_manifest(str(path))] == [None, "llm"]
+
+
+@pytest.mark.parametrize("data, message", [
+    ([1, "x"], "project 0"),
+    (["a", {"name": "b", "colour": "red"}], "unknown project options: colour"),
+    (["a", "a"], "more than once: a"),
+    ([{"venv": True}], "without a name"),
+    ([{"name": "a", "venv_mode": "copy"}], "venv_mode"),
+    ({"defaults": {}}, "list of projects"),
+])
+def test_manifest_rejects_bad_entries(tmp_path, data, message):
+    with pytest.raises(ValueError, match=message):
+        fold.load_manifest(write_manifest(tmp_path, data))
+
+
+def make_set(root, name, files, config=None):
+    directory = root / name
+    for path, content in files.items():
+        target = directory / (path + fold.TEMPLATE_SUFFIX)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(content, encoding="utf-8")
+    directory.mkdir(parents=True, exist_ok=True)
+    if config is not None:
+        (directory / "template.json").write_text(json.dumps(config))
+
+
+def test_template_set_extends(tmp_path):
+    make_set(tmp_path, "gpu", {
+        "Dockerfile": "FROM cuda # ${project_name} costs $$5\n",
+        "src/${package_name}/gpu.py": "import ${package_name}\n",
+    }, {"extends": "video", "optional": {"requirements": ["Dockerfile"]}})
+    dirs = (str(tmp_path),)
+
+    files = fold.render_scaffold("My-Node", True, "gpu", dirs)
+    assert files["Dockerfile"] == "FROM cuda # My-Node costs $5\n"
+    assert files["src/my_node/gpu.py"] == "import my_node\n"
+    # Inherited from video, and from base through video
+    assert "src/my_node/comfyui_nodes/example_node.py" in files
+    assert "requirements.txt" in files
+    assert "LICENSE" in files
+
+    # Optional files of the parent and the set itself
+    files = fold.render_scaffold("My-Node", False, "gpu", dirs)
+    assert "requirements.txt" not in files
+    assert "Dockerfile" not in files
+
+
+def test_template_set_errors(tmp_path):
+    make_set(tmp_path, "a", {}, {"extends": "b"})
+    make_set(tmp_path, "b", {}, {"extends": "a"})
+    make_set(tmp_path, "typo", {"x": "${projet_name}"})
+    dirs = (str(tmp_path),)
+    with pytest.raises(ValueError, match="extends itself"):
+        fold.load_template_set("a", dirs)
+    with pytest.raises(ValueError, match="unknown template set"):
+        fold.load_template_set("missing", dirs)
+    with pytest.raises(ValueError, match="projet_name"):
+        fold.render_scaffold("p", template="typo", template_dirs=dirs)
+
+
+def test_update_detects_edits_and_conflicts(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    make_set(tmp_path / "pack", "pack", {"a.txt": "a1\n", "b.txt": "b1\n", "c.txt": "c1\n", "e.txt": "e\n"})
+    dirs = (str(tmp_path / "pack"),)
+    fold.create_scaffold("p", template="pack", template_dirs=dirs)
+    (tmp_path / "p" / "b.txt").write_text("b1 edited\n")
+    (tmp_path / "p" / "c.txt").write_text("c1 edited\n")
+    untouched = os.stat(tmp_path / "p" / "e.txt").st_mtime_ns
+
+    # New output for a (not edited) and c (edited); b and e keep theirs
+    make_set(tmp_path / "pack", "pack", {"a.txt": "a2\n", "c.txt": "c2\n", "d.txt": "d\n"})
+    fold.load_template_set.cache_clear()
+    statuses = fold.update_scaffold("p", template_dirs=dirs, dry_run=True)
+    assert {k: v for k, v in statuses.items() if v != "unchanged"} == {
+        "a.txt": "update", "b.txt": "edited", "c.txt": "conflict", "d.txt": "create"
+    }
+    assert "+a2" in capsys.readouterr().out
+    assert (tmp_path / "p" / "a.txt").read_text() == "a1\n"
+
+    fold.update_scaffold("p", template_dirs=dirs)
+    assert (tmp_path / "p" / "a.txt").read_text() == "a2\n"
+    assert (tmp_path / "p" / "c.txt").read_text() == "c1 edited\n"
+    assert (tmp_path / "p" / "d.txt").read_text() == "d\n"
+    assert os.stat(tmp_path / "p" / "e.txt").st_mtime_ns == untouched
+
+    # The conflict stays one until forced
+    statuses = fold.update_scaffold("p", template_dirs=dirs)
+    assert statuses["c.txt"] == "conflict"
+    fold.update_scaffold("p", template_dirs=dirs, force=True)
+    assert (tmp_path / "p" / "c.txt").read_text() == "c2\n"
+
+
+def test_update_reports_orphaned_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fold.create_scaffold("p")
+    statuses = fold.update_scaffold("p", template="llm")
+    orphaned = sorted(path for path, status in statuses.items() if status == "orphaned")
+    assert orphaned == [
+        "src/p/comfyui_nodes/example_node.py", "src/p/core_logic/video_utils.py"
+    ]
+    assert (tmp_path / "p" / "src/p/core_logic/video_utils.py").exists()
+
+    os.remove(tmp_path / "p" / "src/p/core_logic/video_utils.py")
+    statuses = fold.update_scaffold("p")
+    assert "src/p/core_logic/video_utils.py" not in statuses
+    assert statuses["src/p/comfyui_nodes/example_node.py"] == "orphaned"